@@ -1,42 +1,108 @@
 import sys
 import os
 import time
+_IMPORT_STARTED = time.perf_counter()
+import asyncio
 import threading
+import uuid
+import shutil
 # Add the current directory to Python path for imports
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 import sqlite3
-import pandas as pd
 from pathlib import Path
+from collections import OrderedDict
+from contextlib import asynccontextmanager
 from pydantic import BaseModel
 import duckdb
 
 from fastapi import FastAPI, UploadFile,File, Form, HTTPException, Depends
 from fastapi import BackgroundTasks
 from fastapi.security import HTTPBasic, HTTPBasicCredentials
-from fastapi.responses import JSONResponse
-from langchain_community.embeddings.openai import OpenAIEmbeddings
+from fastapi.responses import JSONResponse, PlainTextResponse
 from dotenv import load_dotenv
-from langchain_core.documents import Document
 
-from rag_utils.rag_module import run_indexer,vectorstore,get_rag_chain
-from rag_utils.query_classifier import detect_query_type_llm
-from rag_utils.csv_query import ask_csv
-from rag_utils.rag_chain import ask_rag
-
-app = FastAPI()
+# Heavy resources (Chroma, LangChain chains, Ollama models) are created lazily
+# on first use or by the background warm-up, never at import time
+from rag_utils.rag_module import run_indexer
+from rag_utils.query_classifier import detect_query_type_llm, route_query
+from rag_utils.query_router import record_route
+from rag_utils.csv_query import ask_csv, get_allowed_tables_for_role, invalidate_schema_cache
+from rag_utils.table_profile import ensure_profile_tables, build_table_profile
+from rag_utils.llm_scheduler import (QueueFullError, set_llm_context, scheduler_stats, INTERACTIVE,
+                                    CancelToken, set_cancel_token)
+from rag_utils.rag_chain import ask_rag, retrieve_context, invalidate_answer_cache
+from rag_utils.context_packer import packer_stats
+from rag_utils.vector_admin import vector_stats, remove_document, remove_superseded, compact
+from rag_utils.sessions import SESSIONS
+from rag_utils.warmup import start_warmup, warmup_state
+from rag_utils.paths import DUCKDB_DIR, DUCKDB_FILE, ROLES_DB_PATH, UPLOAD_DIR, resolve
+from rag_utils.startup import timed, record, startup_report, log_startup_report
+from rag_utils.metrics import render_metrics, cache_event, FALLBACKS, CHAT_REQUESTS, ROUTE_DECISIONS
+from rag_utils.tracing import start_trace, current_trace, export_trace, span, set_attribute
+from rag_utils.logging_setup import get_logger
+
+logger = get_logger(__name__)
+
+# Preload models, chains and the vector index at startup so the first chat is not a cold start
+WARMUP_ON_STARTUP = os.getenv("WARMUP_ON_STARTUP", "1") == "1"
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    init_storage()
+    log_startup_report()
+    if WARMUP_ON_STARTUP:
+        start_warmup(sorted(set(get_cached_roles()) | {"C-Level", "General"}))
+    yield
+
+
+async def ensure_storage():
+    # Normally done by the lifespan hook; covers apps served without it (TestClient)
+    init_storage()
+
+
+app = FastAPI(lifespan=lifespan, dependencies=[Depends(ensure_storage)])
+
+
+@app.middleware("http")
+async def trace_requests(request, call_next):
+    """Per-request trace: Server-Timing breakdown on every response, slow traces exported"""
+    trace = start_trace(f"{request.method} {request.url.path}", request.headers.get("x-request-id"))
+    try:
+        response = await call_next(request)
+    except Exception as e:
+        # Unhandled errors still leave a trace (the client gets a 500)
+        trace.attributes.update(status=500, error=type(e).__name__)
+        raise
+    else:
+        trace.attributes["status"] = response.status_code
+    finally:
+        trace.finish()
+        export_trace(trace)
+    response.headers["Server-Timing"] = trace.server_timing()
+    response.headers["X-Request-ID"] = trace.request_id
+    return response
 security = HTTPBasic()
 load_dotenv()
 
+
+@app.exception_handler(QueueFullError)
+async def queue_full_handler(request, exc: QueueFullError):
+    """Reject quickly when the LLM queue is saturated instead of letting requests time out"""
+    return JSONResponse(
+        status_code=429,
+        content={"detail": f"Server busy: {exc}. Please retry shortly."},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
 # -------------------------
 # === DUCKDB SETUP ===
 # -------------------------
-# Set path to DuckDB database file using absolute path
-BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
-DUCKDB_DIR = Path(BASE_DIR) / "static" / "data"
-DUCKDB_DIR.mkdir(parents=True, exist_ok=True)  # ensure directory exists
+# Set path to DuckDB database file using absolute path (see rag_utils.paths)
+os.makedirs(DUCKDB_DIR, exist_ok=True)  # ensure directory exists
 
-DUCKDB_PATH = DUCKDB_DIR / "structured_queries.duckdb"
+DUCKDB_PATH = Path(DUCKDB_FILE)
 
 def initialize_duckdb():
     """Initialize DuckDB with required tables"""
@@ -47,18 +113,17 @@ def initialize_duckdb():
                 role TEXT
             )
         """)
-
-# Initialize DuckDB on startup
-initialize_duckdb()
+        ensure_profile_tables(duck_conn)
 
 
 # -------------------------
 # === SQLITE DATABASE SETUP ===
 # -------------------------
 
-conn = sqlite3.connect("roles_docs.db", check_same_thread=False)
+conn = sqlite3.connect(ROLES_DB_PATH, check_same_thread=False)
 c = conn.cursor()
-c.executescript("""
+
+SCHEMA_SQL = """
 CREATE TABLE IF NOT EXISTS users (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
     username TEXT UNIQUE,
@@ -82,11 +147,10 @@ CREATE TABLE IF NOT EXISTS documents (
 
 -- Add index on username for faster lookups
 CREATE INDEX IF NOT EXISTS idx_users_username ON users(username);
-""")
-conn.commit()
+"""
 
 def create_default_user():
-    conn_local = sqlite3.connect("roles_docs.db")
+    conn_local = sqlite3.connect(ROLES_DB_PATH)
     c_local = conn_local.cursor()
     import hashlib
 
@@ -115,17 +179,38 @@ def create_default_user():
         # Check if the insert actually added a row
         if c_local.rowcount > 0:
             users_created += 1
-            print(f"✅ User '{username}' ({role}) created.")
+            logger.info("Created default user %r (%s)", username, role)
     
     conn_local.commit()
     conn_local.close()
     
     if users_created > 0:
-        print(f"🎉 Total {users_created} new users created successfully!")
+        logger.info("Created %d default users", users_created)
 
 
-# Create all sample users on startup
-create_default_user()
+_STORAGE_READY = False
+_STORAGE_LOCK = threading.Lock()
+
+
+def init_storage():
+    """Create SQLite/DuckDB tables and the default users once per process.
+
+    Runs from the lifespan hook, or on the first request when the app is
+    used without it (e.g. TestClient without a context manager).
+    """
+    global _STORAGE_READY
+    if _STORAGE_READY:
+        return
+    with _STORAGE_LOCK:
+        if _STORAGE_READY:
+            return
+        with timed("sqlite_schema"):
+            c.executescript(SCHEMA_SQL)
+            conn.commit()
+            create_default_user()
+        with timed("duckdb_schema"):
+            initialize_duckdb()
+        _STORAGE_READY = True
 
 # -------------------------
 # === AUTHENTICATION ===
@@ -147,7 +232,9 @@ def authenticate(credentials: HTTPBasicCredentials = Depends(security)):
         entry = _AUTH_CACHE.get(username)
         if entry and entry.get("password_hash") == hashed_input and entry.get("expiry", 0) > now:
             # Return cached role without DB hit
+            cache_event("auth", "hit")
             return {"username": username, "role": entry["role"]}
+    cache_event("auth", "miss")
 
     # Fallback: verify against DB
     c.execute("SELECT password, role FROM users WHERE username = ?", (username,))
@@ -192,8 +279,12 @@ class ChatRequest(BaseModel):
     question: str
     # 'brief' (default) or 'extended' to control verbosity of RAG answers
     detail: str = "brief"
-    # Optional conversation history for context-aware responses
+    # Server-side conversation (preferred): history is kept and summarized by the server
+    session_id: str | None = None
+    # Optional client-sent history, used only when no session is given (older clients)
     history: list[dict] = []  # Accept dicts instead of strict ChatMessage to be flexible
+    # Return the per-stage timing breakdown of this request in the response body
+    include_timings: bool = False
 
 # -------------------------
 # === ROUTES ===
@@ -337,8 +428,6 @@ def delete_role(role_name: str = Form(...), user=Depends(authenticate)):
 
 
 
-UPLOAD_DIR = "static/uploads"
-
 @app.post("/upload-docs")
 async def upload_docs(file: UploadFile = File(...), role: str = Form(...)):
     try:
@@ -350,59 +439,83 @@ async def upload_docs(file: UploadFile = File(...), role: str = Form(...)):
         os.makedirs(role_dir, exist_ok=True)
         filepath = os.path.join(role_dir, filename)
 
-        # Read content + save file
+        # Read and validate before touching anything: a failed re-upload keeps the earlier copy
         data = await file.read()  # Read once
-
-        with open(filepath, "wb") as f:
-            f.write(data)  # Save file for future indexing
-
-        # Convert to string content for validation (optional)
         if extension == ".csv":
+            import pandas as pd
             from io import BytesIO
-            df = pd.read_csv(BytesIO(data))
-            content = df.to_string(index=False)
-
-             # Load for DuckDB
-            df1 = pd.read_csv(filepath)
+            df1 = pd.read_csv(BytesIO(data))
             table_name = Path(filepath).stem.replace("-", "_")
 
             # Save metadata including headers
             headers = df1.columns.tolist()
             headers_str = ",".join(headers)
 
-            # Use connection management for DuckDB operations
-            with duckdb.connect(str(DUCKDB_PATH)) as duck_conn:
-                duck_conn.execute(f"CREATE OR REPLACE TABLE {table_name} AS SELECT * FROM df1")
-
-                # ✅ Remove any existing metadata for this table to avoid duplicates
-                duck_conn.execute(
-                    "DELETE FROM tables_metadata WHERE table_name = ?",
-                    (table_name,)
-                )
-                
-                # ✅ Save metadata to DuckDB tables_metadata (always lowercase role)
-                duck_conn.execute(
-                    "INSERT INTO tables_metadata (table_name, role) VALUES (?, ?)",
-                    (table_name, role.lower())
-                )
-
         elif extension == ".md":
-            content = data.decode("utf-8")
+            data.decode("utf-8")
             headers_str = None  # explicitly set to None
-            
+
         else:
             raise HTTPException(status_code=400, detail="Unsupported file type")
 
+        # Save file for future indexing; replaced in one step so the old copy is never half-written,
+        # and kept aside until the new one is indexed so a failed re-upload can put it back
+        backup_path = None
+        if os.path.exists(filepath):
+            backup_path = f"{filepath}.{uuid.uuid4().hex}.bak"
+            shutil.copy2(filepath, backup_path)
+        tmp_path = f"{filepath}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, filepath)
+
         # Save metadata to DB using global connection to avoid locking
         c.execute("INSERT INTO documents (filename, role, filepath,headers_str,embedded) VALUES (?, ?, ?,?,?)",
                   (filename, role, filepath, headers_str,0))
-        #doc_id = c.lastrowid  # ✅ Get inserted doc ID
+        doc_id = c.lastrowid
         conn.commit()
-        
-        run_indexer()
-        print("Files indexed successfully")
+
+        try:
+            await asyncio.to_thread(run_indexer)
+
+            if extension == ".csv":
+                # Use connection management for DuckDB operations; the earlier table is swapped
+                # out only now, in one transaction, so it stays queryable if indexing fails
+                with duckdb.connect(str(DUCKDB_PATH)) as duck_conn:
+                    duck_conn.begin()
+                    duck_conn.execute(f"CREATE OR REPLACE TABLE {table_name} AS SELECT * FROM df1")
+
+                    # ✅ Remove any existing metadata for this table to avoid duplicates
+                    duck_conn.execute(
+                        "DELETE FROM tables_metadata WHERE table_name = ?",
+                        (table_name,)
+                    )
+
+                    # ✅ Save metadata to DuckDB tables_metadata (always lowercase role)
+                    duck_conn.execute(
+                        "INSERT INTO tables_metadata (table_name, role) VALUES (?, ?)",
+                        (table_name, role.lower())
+                    )
+
+                    # ✅ Precompute row counts, column stats and value frequencies for fast aggregates
+                    build_table_profile(duck_conn, table_name)
+                    duck_conn.commit()
+        except Exception:
+            # Drop the half-indexed new row; the earlier copy (row, chunks, file, table) stays in place
+            await asyncio.to_thread(remove_document, doc_id)
+            if backup_path:
+                os.replace(backup_path, filepath)
+            raise
+        if backup_path:
+            os.remove(backup_path)
+
+        # A re-upload replaces the earlier copy (row, chunks) instead of adding orphans
+        await asyncio.to_thread(remove_superseded, filename, role)
+        logger.info("Indexed upload %s", filename)
         return JSONResponse(content={"message": f"{filename} uploaded successfully for role '{role}'."})
 
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Upload failed: {e}")
     
@@ -435,66 +548,196 @@ async def chat(req: ChatRequest, user=Depends(authenticate)):
         **({"sql": result["sql"]} if "sql" in result else {})
     }
 """
+# Speculative routing: run SQL and RAG concurrently when the route is uncertain
+SPECULATIVE_ROUTING = os.getenv("SPECULATIVE_ROUTING", "1") == "1"
+# Prefetch RAG retrieval while SQL is generated so a fallback only pays for generation
+PREFETCH_RAG_CONTEXT = os.getenv("PREFETCH_RAG_CONTEXT", "1") == "1"
+
+# Recently seen questions whose SQL attempt fell back to RAG (bounded, oldest evicted first)
+_FALLBACK_PRONE: OrderedDict[str, None] = OrderedDict()
+_FALLBACK_PRONE_MAX = 500
+_NOT_FOUND_PHRASE = "i couldn't find an answer in the documents"
+
+
+def _norm_question(question: str) -> str:
+    return " ".join(question.strip().lower().split())
+
+
+def _mark_fallback_prone(question: str):
+    key = _norm_question(question)
+    _FALLBACK_PRONE[key] = None
+    _FALLBACK_PRONE.move_to_end(key)
+    while len(_FALLBACK_PRONE) > _FALLBACK_PRONE_MAX:
+        _FALLBACK_PRONE.popitem(last=False)
+        cache_event("fallback_prone", "eviction")
+
+
+def _sql_result_ok(result: dict) -> bool:
+    return bool(result) and not result.get("error") and bool(result.get("answer", "").strip())
+
+
+def _rag_result_ok(result: dict) -> bool:
+    answer = (result or {}).get("answer") or ""
+    return bool(answer.strip()) and bool(result.get("sources", True)) and _NOT_FOUND_PHRASE not in answer.lower()
+
+
+def _discard_task(task: asyncio.Task):
+    """Cancel a task we no longer need and swallow its outcome"""
+    if not task.done():
+        task.cancel()
+    elif not task.cancelled():
+        task.exception()  # mark the exception (if any) as retrieved
+
+
+async def _cancellable(token: CancelToken, coro_fn, *args, **kwargs):
+    # Worker threads started by the branch inherit the token, so cancelling it
+    # also stops their queued and future LLM calls, not only this task
+    set_cancel_token(token)
+    return await coro_fn(*args, **kwargs)
+
+
+async def _run_speculative(question: str, role: str, username: str, detail: str, history: list):
+    """Start SQL and RAG together; the first valid result wins and the other is cancelled.
+
+    Returns (result, mode). Worst-case latency is max(SQL, RAG) instead of SQL + RAG.
+    """
+    tokens = {"sql": CancelToken(), "rag": CancelToken()}
+    sql_task = asyncio.create_task(_cancellable(tokens["sql"], ask_csv, question, role, username,
+                                                return_sql=True, history=history))
+    rag_task = asyncio.create_task(_cancellable(tokens["rag"], ask_rag, question, role, detail=detail, history=history))
+    pending = {sql_task, rag_task}
+    rag_result = None
+    rag_error = None
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            # If both finished together, prefer the exact SQL answer
+            if sql_task in done and sql_task.exception() is None and _sql_result_ok(sql_task.result()):
+                return sql_task.result(), "SQL"
+            if rag_task in done:
+                rag_error = rag_task.exception()
+                if rag_error is None:
+                    rag_result = rag_task.result()
+                    if _rag_result_ok(rag_result):
+                        return rag_result, "RAG"
+        # Neither was clearly valid: keep the old behaviour of answering from RAG
+        if rag_result is not None:
+            return rag_result, "RAG"
+        raise rag_error
+    finally:
+        for task, token in ((sql_task, tokens["sql"]), (rag_task, tokens["rag"])):
+            if not task.done():
+                token.cancel()
+            _discard_task(task)
+
+
 @app.post("/chat")
 async def chat(req: ChatRequest, user=Depends(authenticate)):
     role = user["role"]
     username = user["username"]
     question = req.question
-    history = req.history
 
-    # 1. Detect mode: SQL or RAG
-    mode = detect_query_type_llm(question)
-    # Heuristic: counting questions should go to SQL for completeness
-    ql = question.lower()
-    if any(kw in ql for kw in ["how many", "count "]):
-        mode = "SQL"
-    print(f"Detected mode: {mode}")
+    # Bounded history (running summary + recent turns) from the session; legacy
+    # clients without a session id may still send their own history
+    session = SESSIONS.get_or_create(req.session_id, username)
+    history = session.history() if req.session_id or not req.history else req.history
+
+    # Interactive chat is scheduled ahead of indexing/evaluation, fairly across users
+    set_llm_context(priority=INTERACTIVE, tenant=username)
 
     result = {}
     fallback_used = False
+    speculative = False
+    allowed_tables = get_allowed_tables_for_role(role)
+
+    # 1. Uncertain or fallback-prone questions: race SQL against RAG instead of classifying
+    if SPECULATIVE_ROUTING and allowed_tables and (
+        route_query(question)[0] is None or _norm_question(question) in _FALLBACK_PRONE
+    ):
+        speculative = True
+        with span("speculative"):
+            result, mode = await _run_speculative(question, role, username, req.detail, history)
+        logger.info("Speculative routing: %s answered first", mode)
+        ROUTE_DECISIONS.inc(mode, "speculative")
+        # Not logged for the router: the faster path is not necessarily the right route
 
-    # 2. Pre-check: If SQL mode but no tables available, skip SQL attempt
-    if mode == "SQL":
-        from rag_utils.csv_query import get_allowed_tables_for_role
-        allowed_tables = get_allowed_tables_for_role(role)
-        
-        if not allowed_tables:
-            print(f"[SQL Pre-check] No tables available for role '{role}'. Skipping SQL, using RAG.")
+    else:
+        # 2. Detect mode: SQL or RAG (off the event loop - may call the LLM)
+        mode = await asyncio.to_thread(detect_query_type_llm, question)
+        logger.info("Detected mode: %s", mode)
+
+        # 3. Pre-check: If SQL mode but no tables available, skip SQL attempt
+        if mode == "SQL" and not allowed_tables:
+            logger.info("No tables available for role %r, using RAG", role)
             mode = "RAG (no CSV tables available)"
+            FALLBACKS.inc("no_tables")
             result = await ask_rag(question, role, detail=req.detail, history=history)
-        else:
-            print(f"[SQL Pre-check] {len(allowed_tables)} table(s) available: {allowed_tables}")
+
+        elif mode == "SQL":
+            logger.debug("%d table(s) available: %s", len(allowed_tables), allowed_tables)
+            prefetch = None
+            if PREFETCH_RAG_CONTEXT:
+                prefetch = asyncio.create_task(retrieve_context(question, role, detail=req.detail, history=history))
             try:
                 result = await ask_csv(question, role, username, return_sql=True, history=history)
 
                 if result.get("error"):
                     error_msg = result.get("answer", "Unknown error")
-                    print(f"[SQL Error] {error_msg}")
                     raise ValueError(f"SQL blocked or failed: {error_msg}")
-                
+
                 if not result.get("answer", "").strip():
-                    print(f"[SQL Warning] Empty answer returned")
                     raise ValueError("SQL returned empty result")
 
+                record_route(question, "SQL")
+
+            except QueueFullError:
+                raise
             except Exception as e:
-                print(f"[SQL Fallback Triggered] Error: {e}")
+                logger.warning("SQL failed, falling back to RAG: %s", e)
+                context_docs = None
+                if prefetch is not None:
+                    try:
+                        context_docs = await prefetch
+                    except QueueFullError:
+                        raise
+                    except Exception as prefetch_error:
+                        logger.warning("RAG prefetch failed, retrieving again: %s", prefetch_error)
                 # Use the requested verbosity when falling back to RAG
-                result = await ask_rag(question, role, detail=req.detail, history=history)
+                with span("sql_to_rag_fallback"):
+                    result = await ask_rag(question, role, detail=req.detail, history=history, context_docs=context_docs)
                 fallback_used = True
+                FALLBACKS.inc("sql_to_rag")
                 mode = "SQL → RAG fallback"
+                _mark_fallback_prone(question)
+                record_route(question, "RAG")
+            finally:
+                if prefetch is not None:
+                    _discard_task(prefetch)
 
-    else:
-        # Respect verbosity preference for RAG answers
-        result = await ask_rag(question, role, detail=req.detail, history=history)
+        else:
+            # Respect verbosity preference for RAG answers
+            result = await ask_rag(question, role, detail=req.detail, history=history)
 
-    return {
+    CHAT_REQUESTS.inc(mode)
+    set_attribute("mode", mode)
+    set_attribute("role", role)
+    session.add("user", question)
+    session.add("assistant", result["answer"], sql=result.get("sql"))
+
+    response = {
         "user": username,
         "role": role,
+        "session_id": session.id,
         "mode": mode,
         "fallback": fallback_used,
+        "speculative": speculative,
         "answer": result["answer"],
         **({"sql": result["sql"]} if "sql" in result else {})
     }
+    trace = current_trace()
+    if req.include_timings and trace is not None:
+        response["timings"] = {"request_id": trace.request_id, "breakdown_ms": trace.breakdown(), "spans": trace.to_dict()["spans"]}
+    return response
 
 
 @app.get("/debug/docs")
@@ -535,11 +778,84 @@ def vectorstore_info(user=Depends(authenticate)):
     if user["role"] != "C-Level":
         raise HTTPException(status_code=403, detail="Only C-Level can access debug endpoints")
     try:
-        vs = vectorstore.get()
-        docs = vs.get("documents", [])
-        return {"documents_count": len(docs), "collections": list(vs.keys())}
+        return {**vector_stats(), "context_packing": packer_stats()}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.post("/admin/vectorstore/compact")
+def compact_vectorstore(user=Depends(authenticate)):
+    """Delete orphaned and duplicate chunks and rebuild the vector index. C-Level only."""
+    if user["role"] != "C-Level":
+        raise HTTPException(status_code=403, detail="Only C-Level can compact the vector store")
+    try:
+        report = compact()
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    invalidate_answer_cache()
+    return report
+
+
+@app.delete("/documents/{doc_id}")
+def delete_document(doc_id: int, user=Depends(authenticate)):
+    """Remove a document, its chunks and (for CSVs) its DuckDB table. C-Level only."""
+    if user["role"] != "C-Level":
+        raise HTTPException(status_code=403, detail="Only C-Level can delete documents")
+    removed = remove_document(doc_id)
+    if removed is None:
+        raise HTTPException(status_code=404, detail="Document not found")
+    invalidate_answer_cache()
+    invalidate_schema_cache()
+    return removed
+
+
+@app.get("/sessions/{session_id}")
+def get_session(session_id: str, user=Depends(authenticate)):
+    """Stored summary, recent messages and result references of the caller's session"""
+    session = SESSIONS.get(session_id, user["username"])
+    if session is None:
+        raise HTTPException(status_code=404, detail="Session not found")
+    return session.to_dict()
+
+
+@app.get("/sessions/{session_id}/artifacts/{ref}")
+def get_session_artifact(session_id: str, ref: str, user=Depends(authenticate)):
+    """Full tool output (e.g. an SQL result table) that the conversation refers to"""
+    session = SESSIONS.get(session_id, user["username"])
+    content = session.get_artifact(ref) if session is not None else None
+    if content is None:
+        raise HTTPException(status_code=404, detail="Result not found")
+    return {"ref": ref, "content": content}
+
+
+@app.delete("/sessions/{session_id}")
+def delete_session(session_id: str, user=Depends(authenticate)):
+    if not SESSIONS.delete(session_id, user["username"]):
+        raise HTTPException(status_code=404, detail="Session not found")
+    return {"message": "Session deleted"}
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    """Prometheus text format: stage latencies, routing, fallbacks, caches, Ollama queue depth"""
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+@app.get("/ready")
+def ready():
+    """Readiness probe: 200 once warm-up has finished, 503 while it runs or if it failed"""
+    state = warmup_state()
+    state["startup"] = startup_report()
+    if not WARMUP_ON_STARTUP:
+        state["status"] = "ready"
+    return JSONResponse(status_code=200 if state["status"] == "ready" else 503, content=state)
+
+@app.get("/debug/llm-queue")
+def llm_queue_info(user=Depends(authenticate)):
+    """Return LLM scheduler queue depth and admission stats. C-Level only."""
+    if user["role"] != "C-Level":
+        raise HTTPException(status_code=403, detail="Only C-Level can access debug endpoints")
+    return scheduler_stats()
 
 
 @app.get("/debug/users")
@@ -563,7 +879,11 @@ def download_document(doc_id: int, user=Depends(authenticate)):
     if not row:
         raise HTTPException(status_code=404, detail="Document not found")
     filepath, filename = row
+    filepath = resolve(filepath)
     if not os.path.exists(filepath):
         raise HTTPException(status_code=404, detail="File not found on disk")
     from fastapi.responses import FileResponse
     return FileResponse(path=filepath, filename=filename, media_type='application/octet-stream')
+
+
+record("api_import", time.perf_counter() - _IMPORT_STARTED)
@@ -0,0 +1,149 @@
+"""DuckDB store for evaluation runs: one row per run, one typed row per judged item.
+
+Judge output is parsed once, when a run is recorded. Summaries, per-role
+breakdowns and run comparisons are SQL aggregations over the metric columns.
+"""
+import os
+import re
+import json
+import uuid
+from datetime import datetime, timezone
+
+import duckdb
+
+EVAL_DIR = os.path.dirname(os.path.abspath(__file__))
+EVAL_STORE_FILE = os.getenv("EVAL_STORE", os.path.join(EVAL_DIR, "eval_runs.duckdb"))
+METRICS = ("faithfulness", "relevancy", "context_recall")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS eval_runs (
+    run_id VARCHAR PRIMARY KEY,
+    created_at TIMESTAMP,
+    name VARCHAR,
+    config JSON
+);
+CREATE TABLE IF NOT EXISTS eval_results (
+    run_id VARCHAR,
+    question VARCHAR,
+    role VARCHAR,
+    source VARCHAR,
+    prediction VARCHAR,
+    ground_truth VARCHAR,
+    contexts VARCHAR,
+    faithfulness DOUBLE,
+    relevancy DOUBLE,
+    context_recall DOUBLE,
+    judge_error VARCHAR
+);
+"""
+
+_SCORE_RE = re.compile(r'"(faithfulness|relevancy|context_recall)"\s*:\s*([0-9.]+)')
+
+
+def connect(path: str | None = None) -> duckdb.DuckDBPyConnection:
+    conn = duckdb.connect(path or EVAL_STORE_FILE)
+    conn.execute(_SCHEMA)
+    return conn
+
+
+def parse_scores(text) -> tuple[dict, str | None]:
+    """({metric: float}, error) from the judge's reply; tolerates text around the JSON"""
+    try:
+        parsed = json.loads(text)
+    except (TypeError, ValueError):
+        parsed = None
+    if isinstance(parsed, dict):
+        if "error" in parsed:
+            return {}, str(parsed["error"])
+        scores = {m: float(parsed[m]) for m in METRICS if isinstance(parsed.get(m), (int, float))}
+    else:
+        scores = {name: float(value) for name, value in _SCORE_RE.findall(str(text or ""))}
+    return scores, None if scores else f"Unparseable judge output: {str(text)[:200]}"
+
+
+def record_run(results: list[dict], config: dict | None = None, name: str | None = None, path: str | None = None) -> str:
+    """Append a finished run; result rows are the evaluator's (question, prediction, ..., metrics)"""
+    run_id = uuid.uuid4().hex[:12]
+    rows = []
+    for r in results:
+        scores, error = parse_scores(r.get("metrics"))
+        rows.append((run_id, r.get("question"), (r.get("role") or "").lower() or None, r.get("source"),
+                     r.get("prediction"), r.get("ground_truth"), r.get("contexts"),
+                     *(scores.get(m) for m in METRICS), error))
+    with connect(path) as conn:
+        conn.execute("BEGIN")
+        conn.execute("INSERT INTO eval_runs VALUES (?, ?, ?, ?)",
+                     [run_id, datetime.now(timezone.utc).replace(tzinfo=None), name, json.dumps(config or {})])
+        if rows:
+            conn.executemany(f"INSERT INTO eval_results VALUES ({', '.join('?' * 11)})", rows)
+        conn.execute("COMMIT")
+    return run_id
+
+
+def import_csv(results_csv: str, qa_csv: str | None = None, name: str | None = None, path: str | None = None) -> str:
+    """Load a legacy evaluation_results CSV (roles/sources joined from the QA pairs) as a run"""
+    with duckdb.connect() as conn:
+        query = "SELECT r.*, NULL AS role, NULL AS source FROM read_csv_auto(?) r"
+        params = [results_csv]
+        if qa_csv:
+            query = ("SELECT r.*, q.role, q.source FROM read_csv_auto(?) r "
+                     "LEFT JOIN (SELECT DISTINCT ON (question) question, role, source FROM read_csv_auto(?)) q USING (question)")
+            params.append(qa_csv)
+        cursor = conn.execute(query, params)
+        columns = [d[0] for d in cursor.description]
+        results = [dict(zip(columns, row)) for row in cursor.fetchall()]
+    return record_run(results, {"imported_from": os.path.basename(results_csv)}, name or os.path.basename(results_csv), path)
+
+
+def latest_run_id(conn) -> str | None:
+    row = conn.execute("SELECT run_id FROM eval_runs ORDER BY created_at DESC LIMIT 1").fetchone()
+    return row[0] if row else None
+
+
+_AVERAGES = ", ".join(f"round(avg({m}), 4) AS {m}" for m in METRICS)
+
+
+def summary(run_id: str | None = None, path: str | None = None) -> dict:
+    """Average metrics of one run (the latest by default)"""
+    with connect(path) as conn:
+        run_id = run_id or latest_run_id(conn)
+        row = conn.execute(
+            f"SELECT count(*) AS items, count(judge_error) AS judge_errors, {_AVERAGES} FROM eval_results WHERE run_id = ?",
+            [run_id],
+        ).fetchone()
+    return {"run_id": run_id, **dict(zip(("items", "judge_errors") + METRICS, row))}
+
+
+def role_summary(run_id: str | None = None, path: str | None = None) -> list[dict]:
+    """Average metrics per role for one run (the latest by default)"""
+    with connect(path) as conn:
+        run_id = run_id or latest_run_id(conn)
+        cursor = conn.execute(
+            f"SELECT coalesce(role, 'unknown') AS role, count(*) AS items, {_AVERAGES} FROM eval_results "
+            "WHERE run_id = ? AND judge_error IS NULL GROUP BY ALL ORDER BY role",
+            [run_id],
+        )
+        columns = [d[0] for d in cursor.description]
+        return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+
+def compare_runs(limit: int = 20, path: str | None = None) -> list[dict]:
+    """Most recent runs with their configuration and average metrics"""
+    with connect(path) as conn:
+        cursor = conn.execute(
+            f"SELECT r.run_id, r.created_at, r.name, r.config, count(e.run_id) AS items, {_AVERAGES} "
+            "FROM eval_runs r LEFT JOIN eval_results e USING (run_id) "
+            "GROUP BY ALL ORDER BY r.created_at DESC LIMIT ?",
+            [limit],
+        )
+        columns = [d[0] for d in cursor.description]
+        return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+
+def export_parquet(directory: str, path: str | None = None):
+    """Write both tables as Parquet files (for notebooks or other tools)"""
+    os.makedirs(directory, exist_ok=True)
+    with connect(path) as conn:
+        for table in ("eval_runs", "eval_results"):
+            target = os.path.join(directory, f"{table}.parquet").replace("'", "''")
+            conn.execute(f"COPY {table} TO '{target}' (FORMAT PARQUET)")
@@ -1,31 +1,31 @@
-import pandas as pd
-import json
+import argparse
+import os
 
-# Load evaluation results CSV
-df = pd.read_csv("evaluation_results_openai.csv")
+from eval_store import summary, compare_runs, import_csv, EVAL_DIR
 
-# Lists to store each score
-faithfulness_scores = []
-relevancy_scores = []
-context_recall_scores = []
+parser = argparse.ArgumentParser(description="Average judge metrics of an evaluation run")
+parser.add_argument("--run", help="run id (default: latest run)")
+parser.add_argument("--compare", type=int, metavar="N", help="list the N most recent runs instead")
+parser.add_argument("--import-csv", help="first load a legacy evaluation_results CSV as a run")
+args = parser.parse_args()
 
-for i, row in df.iterrows():
-    try:
-        metrics = json.loads(row["metrics"])
-        faithfulness_scores.append(metrics.get("faithfulness", 0))
-        relevancy_scores.append(metrics.get("relevancy", 0))
-        context_recall_scores.append(metrics.get("context_recall", 0))
-    except Exception as e:
-        print(f"Row {i} has invalid JSON: {e}")
-        continue
+if args.import_csv:
+    run_id = import_csv(args.import_csv, os.path.join(EVAL_DIR, "qa_pairs_openai.csv"))
+    print(f"Imported {args.import_csv} as run {run_id}")
 
-# Compute averages
-avg_faithfulness = sum(faithfulness_scores) / len(faithfulness_scores)
-avg_relevancy = sum(relevancy_scores) / len(relevancy_scores)
-avg_context_recall = sum(context_recall_scores) / len(context_recall_scores)
+if args.compare:
+    print("=== Recent Evaluation Runs ===")
+    for run in compare_runs(args.compare):
+        print(f"{run['run_id']}  {run['created_at']:%Y-%m-%d %H:%M}  items={run['items']:<4} "
+              f"faithfulness={run['faithfulness']}  relevancy={run['relevancy']}  context_recall={run['context_recall']}  "
+              f"{run['name'] or ''} {run['config']}")
+else:
+    result = summary(args.run)
+    if not result["run_id"]:
+        raise SystemExit("No evaluation runs stored yet (run evaluator.py or use --import-csv)")
 
-# Print summary
-print("=== Evaluation Summary ===")
-print(f"Faithfulness:     {avg_faithfulness:.2f}")
-print(f"Relevancy:        {avg_relevancy:.2f}")
-print(f"Context Recall:   {avg_context_recall:.2f}")
+    # Print summary
+    print(f"=== Evaluation Summary (run {result['run_id']}, {result['items']} items, {result['judge_errors']} judge errors) ===")
+    print(f"Faithfulness:     {result['faithfulness']:.2f}")
+    print(f"Relevancy:        {result['relevancy']:.2f}")
+    print(f"Context Recall:   {result['context_recall']:.2f}")
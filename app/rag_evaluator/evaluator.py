@@ -1,18 +1,72 @@
 import sys
 import os
-sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'rag_utils'))
-from rag_utils.rag_module import vectorstore, model, chat_prompt  
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+from rag_utils.rag_module import get_vectorstore, get_model
+from rag_utils.llm_client import get_llm_client, LLMError, EVAL_TIMEOUT, LLM_MODEL, EMBED_MODEL
+from rag_utils.llm_scheduler import set_llm_context, BATCH
+from rag_evaluator.eval_store import record_run
 
-from langchain.chains import RetrievalQA
-from langchain.schema import Document
 import pandas as pd
-import time, os
-import requests
+import argparse
+import asyncio
+import hashlib
 import json
+import threading
 
 # ========== ENV CONFIG ==========
-# Ollama setup
-OLLAMA_URL = "http://localhost:11434/api/generate"
+# Ollama is reached through the shared pooled client (rag_utils.llm_client)
+EVAL_DIR = os.path.dirname(os.path.abspath(__file__))
+# Items in flight at once; the LLM scheduler still queues them behind interactive chat
+EVAL_CONCURRENCY = int(os.getenv("EVAL_CONCURRENCY", "4"))
+# Judge outputs keyed by (question, prediction, context) hashes, shared by every run
+JUDGE_CACHE_FILE = os.getenv("EVAL_JUDGE_CACHE", os.path.join(EVAL_DIR, "judge_cache.jsonl"))
+
+
+def _hash(*parts) -> str:
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(str(part).encode("utf-8"))
+        digest.update(b"\x00")
+    return digest.hexdigest()
+
+
+def checkpoint_path(output_csv: str) -> str:
+    return os.path.splitext(output_csv)[0] + ".checkpoint.jsonl"
+
+
+class JsonlStore:
+    """Append-only key -> record file; a crash loses at most the line being written"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self.records = {}
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue  # torn last line after a crash
+                    self.records[entry["key"]] = entry["value"]
+
+    def get(self, key: str):
+        return self.records.get(key)
+
+    def put(self, key: str, value):
+        with self._lock:
+            self.records[key] = value
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps({"key": key, "value": value}, ensure_ascii=False) + "\n")
+
+
+def _judge_failed(scores: str) -> bool:
+    try:
+        parsed = json.loads(scores)
+    except (TypeError, ValueError):
+        return False  # free text is kept as the judge produced it
+    return isinstance(parsed, dict) and "error" in parsed
+
 
 # ========== QUESTION GENERATION ==========
 def generate_question_with_openai(text_chunk):
@@ -24,35 +78,44 @@ def generate_question_with_openai(text_chunk):
     Only return the question.
     """
 
-    ollama_payload = {
-        "model": "llama3.1",
-        "prompt": prompt,
-        "stream": False,
-        "options": {"temperature": 0.7}
-    }
-    
-    response = requests.post(OLLAMA_URL, json=ollama_payload)
-    
-    if response.status_code != 200:
-        return f"Error: {response.text}"
-    
-    return response.json()["response"].strip()
-
-
-def generate_qa_dataset(docs, output_csv="qa_pairs_openai.csv"):
-    qa_list = []
-    for doc in docs:
-        question = generate_question_with_openai(doc.page_content)
-        qa_list.append({
-            "question": question,
-            "answer": doc.page_content,
-            "role": doc.metadata.get("role", ""),
-            "source": doc.metadata.get("source", "")
-        })
-        time.sleep(1.2)
+    try:
+        return get_llm_client().generate(prompt, options={"temperature": 0.7}, timeout=EVAL_TIMEOUT)
+    except LLMError as e:
+        return f"Error: {e}"
+
+
+async def generate_qa_dataset_async(docs, output_csv="qa_pairs_openai.csv", concurrency=EVAL_CONCURRENCY):
+    """One question per chunk, `concurrency` at a time, resuming from the checkpoint file"""
+    checkpoint = JsonlStore(checkpoint_path(output_csv))
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def generate(doc):
+        key = _hash(doc.page_content, doc.metadata.get("source", ""))
+        question = checkpoint.get(key)
+        if question is None:
+            async with semaphore:
+                question = await asyncio.to_thread(generate_question_with_openai, doc.page_content)
+            if not question.startswith("Error:"):
+                checkpoint.put(key, question)  # failed generations are retried on the next run
+        return _qa_item(doc, question)
+
+    qa_list = await asyncio.gather(*(generate(doc) for doc in docs))
     pd.DataFrame(qa_list).to_csv(output_csv, index=False)
     return qa_list
 
+
+def _qa_item(doc, question):
+    return {
+        "question": question,
+        "answer": doc.page_content,
+        "role": doc.metadata.get("role", ""),
+        "source": doc.metadata.get("source", "")
+    }
+
+
+def generate_qa_dataset(docs, output_csv="qa_pairs_openai.csv", concurrency=EVAL_CONCURRENCY):
+    return asyncio.run(generate_qa_dataset_async(docs, output_csv, concurrency))
+
 # ========== RAG OUTPUT EVALUATION ==========
 def evaluate_with_openai(question, predicted_answer, retrieved_contexts, reference_answer):
     prompt = f"""You are an evaluator for a RAG system.
@@ -83,56 +146,110 @@ Respond ONLY in valid JSON like:
 }}
 """
 
-    ollama_payload = {
-        "model": "llama3.1",
-        "prompt": prompt,
-        "stream": False,
-        "options": {"temperature": 0.0}
-    }
-    
-    response = requests.post(OLLAMA_URL, json=ollama_payload)
-    
-    if response.status_code != 200:
-        return f"{{\"error\": \"Ollama API error: {response.text}\"}}"
-    
-    return response.json()["response"].strip()
+    try:
+        return get_llm_client().generate(prompt, options={"temperature": 0.0}, timeout=EVAL_TIMEOUT)
+    except LLMError as e:
+        return json.dumps({"error": f"Ollama API error: {e}"})
+
+
+def judge_cached(question, predicted, contexts, ground_truth, cache: JsonlStore) -> str:
+    """Judge scores, reused when the question, prediction and context are unchanged"""
+    key = _hash(question, predicted, contexts)
+    scores = cache.get(key)
+    if scores is None:
+        try:
+            scores = evaluate_with_openai(question, predicted, contexts, ground_truth)
+        except Exception as e:
+            # Same shape as evaluate_with_openai's errors, so the item is not checkpointed
+            return json.dumps({"error": f"Judge failed: {e}"})
+        if not _judge_failed(scores):
+            cache.put(key, scores)
+    return scores
 
 # ========== RAG EVALUATION RUNNER ==========
-def run_rag_eval(qa_list, retriever):
-    qa_chain = RetrievalQA.from_chain_type(
-        llm=model,
+def _build_qa_chain(retriever):
+    from langchain.chains import RetrievalQA
+
+    return RetrievalQA.from_chain_type(
+        llm=get_model(),
         retriever=retriever,
         return_source_documents=True
     )
 
-    results = []
-    for qa in qa_list:
-        question = qa["question"]
-        ground_truth = qa["answer"]
 
-        result = qa_chain.invoke({"query": question})
-        predicted = result["result"]
-        contexts = "\n---\n".join([doc.page_content for doc in result["source_documents"]])
+async def run_rag_eval_async(qa_list, retriever, output_csv="evaluation_results_openai.csv",
+                             concurrency=EVAL_CONCURRENCY, resume=True, qa_chain=None, config=None):
+    """Answer and judge every QA pair, `concurrency` at a time.
 
-        try:
-            scores = evaluate_with_openai(question, predicted, contexts, ground_truth)
-        except Exception as e:
-            scores = str(e)
-
-        results.append({
+    Each finished item is appended to the checkpoint file, so a crashed run resumes
+    where it stopped (resume=False starts over). Items are keyed by `config` too, so a
+    run with another retriever or model never replays them, and the checkpoint is
+    removed once every item finished. Judge outputs are cached across runs.
+    The finished run is recorded in the evaluation store with `config` as metadata.
+    """
+    qa_chain = qa_chain or _build_qa_chain(retriever)
+    path = checkpoint_path(output_csv)
+    if not resume and os.path.exists(path):
+        os.remove(path)
+    checkpoint = JsonlStore(path)
+    judge_cache = JsonlStore(JUDGE_CACHE_FILE)
+    semaphore = asyncio.Semaphore(concurrency)
+    config_key = json.dumps(config or {}, sort_keys=True, default=str)
+
+    async def evaluate(qa):
+        question = qa["question"]
+        ground_truth = qa["answer"]
+        key = _hash(config_key, question, ground_truth)
+        done = checkpoint.get(key)
+        if done is not None:
+            return done
+
+        async with semaphore:
+            result = await asyncio.to_thread(qa_chain.invoke, {"query": question})
+            predicted = result["result"]
+            contexts = "\n---\n".join([doc.page_content for doc in result["source_documents"]])
+            scores = await asyncio.to_thread(judge_cached, question, predicted, contexts, ground_truth, judge_cache)
+
+        row = {
             "question": question,
+            "role": qa.get("role", ""),
+            "source": qa.get("source", ""),
             "prediction": predicted,
             "ground_truth": ground_truth,
             "contexts": contexts,
             "metrics": scores
-        })
-
-    pd.DataFrame(results).to_csv("evaluation_results_openai.csv", index=False)
+        }
+        if not _judge_failed(scores):
+            checkpoint.put(key, row)
+        return row
+
+    results = await asyncio.gather(*(evaluate(qa) for qa in qa_list))
+    pd.DataFrame(results).to_csv(output_csv, index=False)
+    # Items the judge failed on stay unfinished; keep the checkpoint so a re-run retries only those
+    if not any(_judge_failed(row["metrics"]) for row in results) and os.path.exists(path):
+        os.remove(path)
+    run_id = record_run(results, config)
+    print(f"Recorded evaluation run {run_id} ({len(results)} items)")
     return results
 
+
+def run_rag_eval(qa_list, retriever, output_csv="evaluation_results_openai.csv", concurrency=EVAL_CONCURRENCY,
+                 resume=True, config=None):
+    return asyncio.run(run_rag_eval_async(qa_list, retriever, output_csv, concurrency, resume, config=config))
+
 # ========== RUN EXAMPLE ==========
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate QA pairs and evaluate the RAG pipeline")
+    parser.add_argument("--concurrency", type=int, default=EVAL_CONCURRENCY)
+    parser.add_argument("--fresh", action="store_true", help="ignore the checkpoint of a previous evaluation run")
+    args = parser.parse_args()
+
+    # Evaluation traffic is scheduled behind interactive chat
+    set_llm_context(priority=BATCH, tenant="evaluator")
+    vectorstore = get_vectorstore()
     docs = vectorstore.similarity_search("finance", k=50)
-    qa_list = generate_qa_dataset(docs)
-    retriever = vectorstore.as_retriever(search_kwargs={"k": 4})
-    run_rag_eval(qa_list, retriever)
+    qa_list = generate_qa_dataset(docs, concurrency=args.concurrency)
+    search_kwargs = {"k": 4}
+    retriever = vectorstore.as_retriever(search_kwargs=search_kwargs)
+    config = {"retriever": "similarity", **search_kwargs, "llm": LLM_MODEL, "embeddings": EMBED_MODEL, "qa_pairs": len(qa_list)}
+    run_rag_eval(qa_list, retriever, concurrency=args.concurrency, resume=not args.fresh, config=config)
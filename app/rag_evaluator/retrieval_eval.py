@@ -0,0 +1,203 @@
+"""Retrieval-only evaluation: recall@k, MRR and nDCG without generation or an LLM judge.
+
+Ground truth is the `source` column of qa_pairs_openai.csv: a retrieved chunk is
+relevant when it comes from that document. Question embeddings are computed once
+(and cached on disk), candidate pools are fetched from Chroma once at the largest
+fetch_k, and every grid configuration is then scored with numpy. Latency is measured
+per configuration with the production MMR search on a sample of questions.
+
+    python retrieval_eval.py --k 1 2 3 4 --lambda-mult 0.5 0.8 1.0 --fetch-k 10 20 --general-k 0 1 2
+"""
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+from rag_utils.rag_module import get_vectorstore, get_embeddings, retrieval_partitions
+from rag_utils.llm_client import EMBED_MODEL
+
+import argparse
+import hashlib
+import itertools
+import json
+import time
+import numpy as np
+import pandas as pd
+
+EVAL_DIR = os.path.dirname(os.path.abspath(__file__))
+QA_PAIRS_FILE = os.path.join(EVAL_DIR, "qa_pairs_openai.csv")
+EMBEDDING_CACHE_FILE = os.getenv("RETRIEVAL_EVAL_EMBEDDINGS", os.path.join(EVAL_DIR, "question_embeddings.npz"))
+
+
+def _key(text: str) -> str:
+    return hashlib.sha256(f"{EMBED_MODEL}\x00{text}".encode("utf-8")).hexdigest()
+
+
+def embed_questions(questions: list[str]) -> np.ndarray:
+    """Query embeddings (normalized) for every question, reusing the on-disk cache"""
+    cache = {}
+    if os.path.exists(EMBEDDING_CACHE_FILE):
+        with np.load(EMBEDDING_CACHE_FILE) as data:
+            cache = dict(zip(data["keys"].tolist(), data["vectors"]))
+    missing = [q for q in dict.fromkeys(questions) if _key(q) not in cache]
+    if missing:
+        embeddings = get_embeddings()
+        for question in missing:
+            cache[_key(question)] = np.asarray(embeddings.embed_query(question), dtype=np.float32)
+        np.savez(EMBEDDING_CACHE_FILE, keys=np.array(list(cache)), vectors=np.stack(list(cache.values())))
+    vectors = np.stack([cache[_key(q)] for q in questions])
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+class CandidatePool:
+    """Top fetch_k chunks of one partition for one question, with normalized embeddings"""
+
+    def __init__(self, result: dict):
+        embeddings = np.asarray(result["embeddings"][0], dtype=np.float32)
+        if embeddings.size == 0:
+            embeddings = embeddings.reshape(0, 1)
+        self.embeddings = embeddings / np.maximum(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12)
+        self.sources = [m.get("source") for m in result["metadatas"][0]]
+        self.texts = result["documents"][0]
+
+
+def fetch_pools(vectorstore, query_vectors: np.ndarray, filters: list, fetch_k: int) -> dict:
+    """{(question index, filter json): CandidatePool} from one Chroma query per pair"""
+    collection = vectorstore._collection
+    pools = {}
+    for i, vector in enumerate(query_vectors):
+        for search_filter in filters:
+            result = collection.query(query_embeddings=[vector.tolist()], n_results=fetch_k, where=search_filter,
+                                      include=["embeddings", "metadatas", "documents"])
+            pools[(i, json.dumps(search_filter, sort_keys=True))] = CandidatePool(result)
+    return pools
+
+
+def mmr(query: np.ndarray, candidates: np.ndarray, k: int, lambda_mult: float) -> list[int]:
+    """Maximal marginal relevance over normalized vectors (same selection rule as langchain's)"""
+    if len(candidates) == 0 or k <= 0:
+        return []
+    query_sim = candidates @ query
+    pairwise = candidates @ candidates.T
+    selected = [int(np.argmax(query_sim))]
+    redundancy = pairwise[:, selected[0]].copy()
+    while len(selected) < min(k, len(candidates)):
+        scores = lambda_mult * query_sim - (1 - lambda_mult) * redundancy
+        scores[selected] = -np.inf
+        best = int(np.argmax(scores))
+        selected.append(best)
+        redundancy = np.maximum(redundancy, pairwise[:, best])
+    return selected
+
+
+def score(relevance: np.ndarray, relevant_available: np.ndarray) -> dict[str, np.ndarray]:
+    """Per-question recall@k, reciprocal rank and nDCG from a padded 0/1 relevance matrix.
+
+    With one ground-truth document per question, recall@k is whether any chunk of it
+    was retrieved; nDCG's ideal ranking puts every available relevant chunk first.
+    """
+    positions = relevance.shape[1]
+    discounts = 1.0 / np.log2(np.arange(2, positions + 2))
+    hit = relevance.any(axis=1)
+    first = relevance.argmax(axis=1)
+    dcg = (relevance * discounts).sum(axis=1)
+    ideal_count = np.minimum(relevant_available, positions)
+    ideal = np.concatenate([[0.0], np.cumsum(discounts)])[ideal_count]
+    return {
+        "recall": hit.astype(float),
+        "mrr": np.where(hit, 1.0 / (first + 1), 0.0),
+        "ndcg": np.divide(dcg, ideal, out=np.zeros_like(dcg), where=ideal > 0),
+    }
+
+
+def _production_latency_ms(vectorstore, query_vectors, partitions, fetch_k, lambda_mult, sample) -> float:
+    started = time.perf_counter()
+    for vector in query_vectors[:sample]:
+        for search_filter, k in partitions:
+            if k <= 0:
+                continue
+            vectorstore.max_marginal_relevance_search_by_vector(
+                vector.tolist(), k=k, fetch_k=fetch_k, lambda_mult=lambda_mult, filter=search_filter
+            )
+    return (time.perf_counter() - started) * 1000 / max(1, min(sample, len(query_vectors)))
+
+
+def evaluate_grid(qa: pd.DataFrame, ks, lambdas, fetch_ks, general_ks, detail="brief", latency_sample=5) -> pd.DataFrame:
+    """One row per (configuration, role) plus an "all" role row per configuration"""
+    vectorstore = get_vectorstore()
+    roles = qa["role"].str.lower().tolist()
+    query_vectors = embed_questions(qa["question"].tolist())
+
+    # Every filter any configuration can use, fetched once at the largest fetch_k
+    filters = {json.dumps(f, sort_keys=True): f for role in set(roles)
+               for general_k in general_ks for f, _ in retrieval_partitions(role, detail, general_k=general_k)}
+    pools = fetch_pools(vectorstore, query_vectors, list(filters.values()), max(fetch_ks))
+
+    # Relevant chunks a question could retrieve: chunks of its source document
+    sources = qa["source"].tolist()
+    counts = {s: len(vectorstore._collection.get(where={"source": s}, include=[])["ids"]) for s in set(sources)}
+    relevant_available = np.array([counts[s] for s in sources])
+
+    rows = []
+    for k, lambda_mult, fetch_k, general_k in itertools.product(ks, lambdas, fetch_ks, general_ks):
+        started = time.perf_counter()
+        retrieved = []
+        for i, role in enumerate(roles):
+            texts, docs = set(), []
+            for search_filter, part_k in retrieval_partitions(role, detail, role_k=k, general_k=general_k):
+                pool = pools[(i, json.dumps(search_filter, sort_keys=True))]
+                for j in mmr(query_vectors[i], pool.embeddings[:fetch_k], part_k, lambda_mult):
+                    if pool.texts[j] not in texts:  # same dedup as PartitionedMMRRetriever
+                        texts.add(pool.texts[j])
+                        docs.append(pool.sources[j])
+            retrieved.append(docs)
+        width = max(1, max(len(d) for d in retrieved))
+        relevance = np.zeros((len(retrieved), width))
+        for i, docs in enumerate(retrieved):
+            relevance[i, :len(docs)] = [source == sources[i] for source in docs]
+        metrics = score(relevance, relevant_available)
+        scoring_ms = (time.perf_counter() - started) * 1000 / len(roles)
+
+        latencies = [
+            _production_latency_ms(vectorstore, query_vectors[[i for i, r in enumerate(roles) if r == role]],
+                                   retrieval_partitions(role, detail, role_k=k, general_k=general_k),
+                                   fetch_k, lambda_mult, latency_sample)
+            for role in sorted(set(roles))
+        ] if latency_sample else [0.0]
+
+        config = {"k": k, "lambda_mult": lambda_mult, "fetch_k": fetch_k, "general_k": general_k}
+        frame = pd.DataFrame({"role": roles, **metrics})
+        for role, group in [("all", frame)] + list(frame.groupby("role")):
+            rows.append({
+                **config, "role": role, "questions": len(group),
+                "recall_at_k": round(group["recall"].mean(), 4),
+                "mrr": round(group["mrr"].mean(), 4),
+                "ndcg": round(group["ndcg"].mean(), 4),
+                "search_ms": round(float(np.mean(latencies)), 2),
+                "scoring_ms": round(scoring_ms, 3),
+            })
+    return pd.DataFrame(rows)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--qa-pairs", default=QA_PAIRS_FILE)
+    parser.add_argument("--k", type=int, nargs="+", default=[2, 3], help="chunks from the role's partition (role + General documents when general_k is 0)")
+    parser.add_argument("--lambda-mult", type=float, nargs="+", default=[0.5, 0.8, 1.0])
+    parser.add_argument("--fetch-k", type=int, nargs="+", default=[10, 20])
+    parser.add_argument("--general-k", type=int, nargs="+", default=[0, 1, 2])
+    parser.add_argument("--detail", default="brief", choices=["brief", "extended"])
+    parser.add_argument("--latency-sample", type=int, default=5, help="questions per role timed with the live search (0 = skip)")
+    parser.add_argument("--output", help="write every (configuration, role) row to this CSV")
+    args = parser.parse_args()
+
+    qa = pd.read_csv(args.qa_pairs).dropna(subset=["question", "source"])
+    results = evaluate_grid(qa, args.k, args.lambda_mult, args.fetch_k, args.general_k, args.detail, args.latency_sample)
+    overall = results[results["role"] == "all"].sort_values(["mrr", "ndcg", "search_ms"], ascending=[False, False, True])
+    with pd.option_context("display.width", 160, "display.max_rows", 500):
+        print("=== Retrieval configurations (all roles) ===")
+        print(overall.drop(columns=["role"]).to_string(index=False))
+        best = overall.iloc[0]
+        print(f"\n=== Per role for k={best.k}, lambda_mult={best.lambda_mult}, fetch_k={best.fetch_k}, general_k={best.general_k} ===")
+        mask = (results[["k", "lambda_mult", "fetch_k", "general_k"]] == best[["k", "lambda_mult", "fetch_k", "general_k"]].values).all(axis=1)
+        print(results[mask & (results["role"] != "all")][["role", "questions", "recall_at_k", "mrr", "ndcg"]].to_string(index=False))
+    if args.output:
+        results.to_csv(args.output, index=False)
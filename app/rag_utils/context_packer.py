@@ -0,0 +1,132 @@
+import os
+import re
+import threading
+
+from langchain_core.documents import Document
+
+# Context token budget per detail level (prompt instructions and the question come on top)
+CONTEXT_BUDGETS = {
+    "brief": int(os.getenv("CONTEXT_TOKENS_BRIEF", "900")),
+    "extended": int(os.getenv("CONTEXT_TOKENS_EXTENDED", "2200")),
+}
+# Chunks whose word shingles overlap at least this much with a kept chunk are dropped
+NEAR_DUPLICATE_THRESHOLD = float(os.getenv("CONTEXT_DUPLICATE_THRESHOLD", "0.8"))
+# Longest chunk_overlap span searched for (the splitter uses 150 characters)
+MAX_OVERLAP_CHARS = 400
+MIN_OVERLAP_CHARS = 20
+# A truncated chunk is only worth keeping if this many tokens of budget remain
+MIN_TRUNCATED_TOKENS = 80
+
+_WORD_RE = re.compile(r"\w+")
+_SENTENCE_END_RE = re.compile(r"(?<=[.!?\n])\s+")
+
+_STATS = {"answers": 0, "tokens_in": 0, "tokens_out": 0}
+_STATS_LOCK = threading.Lock()
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough llama tokenizer estimate (~4 characters per token), no tokenizer needed"""
+    return max(1, len(text) // 4) if text else 0
+
+
+def _shingles(text: str, size: int = 5) -> set:
+    words = _WORD_RE.findall(text.lower())
+    if len(words) <= size:
+        return {" ".join(words)}
+    return {" ".join(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+def _jaccard(a: set, b: set) -> float:
+    return len(a & b) / len(a | b) if a and b else 0.0
+
+
+def _overlap_length(left: str, right: str) -> int:
+    """Length of the longest suffix of left that is also a prefix of right"""
+    for size in range(min(len(left), len(right), MAX_OVERLAP_CHARS), MIN_OVERLAP_CHARS - 1, -1):
+        if left.endswith(right[:size]):
+            return size
+    return 0
+
+
+def _trim_overlaps(text: str, kept_texts: list[str]) -> str:
+    """Cut spans shared with neighbouring chunks of the same file (splitter overlap)"""
+    for kept in kept_texts:
+        head = _overlap_length(kept, text)
+        if head:
+            text = text[head:]
+        tail = _overlap_length(text, kept)
+        if tail:
+            text = text[:-tail]
+    return text.strip()
+
+
+def _truncate(text: str, max_tokens: int) -> str:
+    """Cut text to roughly max_tokens, at a sentence boundary where possible"""
+    limit = max_tokens * 4
+    if len(text) <= limit:
+        return text
+    cut = text[:limit]
+    boundaries = [m.start() for m in _SENTENCE_END_RE.finditer(cut)]
+    if boundaries and boundaries[-1] > limit // 2:
+        cut = cut[:boundaries[-1]]
+    return cut.rstrip()
+
+
+def _relevance_order(docs: list[Document]) -> list[Document]:
+    # Rerankers attach relevance_score; otherwise the retriever's order is the ranking
+    if any("relevance_score" in (d.metadata or {}) for d in docs):
+        return sorted(docs, key=lambda d: -(d.metadata or {}).get("relevance_score", 0.0))
+    return list(docs)
+
+
+def pack_context(docs: list[Document], detail: str = "brief", budget: int | None = None) -> tuple[list[Document], dict]:
+    """Deduplicate and trim retrieved chunks to fit the detail level's token budget.
+
+    Returns (packed documents, stats). Input documents are not modified.
+    """
+    budget = budget or CONTEXT_BUDGETS.get((detail or "brief").lower(), CONTEXT_BUDGETS["brief"])
+    tokens_in = sum(estimate_tokens(d.page_content) for d in docs)
+
+    packed, kept_shingles, kept_by_source = [], [], {}
+    used = dropped = 0
+    for doc in _relevance_order(docs):
+        source = (doc.metadata or {}).get("source")
+        text = _trim_overlaps(doc.page_content, kept_by_source.get(source, []))
+        shingles = _shingles(text)
+        if not text or any(_jaccard(shingles, other) >= NEAR_DUPLICATE_THRESHOLD for other in kept_shingles):
+            dropped += 1
+            continue
+
+        remaining = budget - used
+        tokens = estimate_tokens(text)
+        if tokens > remaining:
+            if remaining < MIN_TRUNCATED_TOKENS:
+                break
+            text = _truncate(text, remaining)
+            tokens = estimate_tokens(text)
+
+        packed.append(Document(page_content=text, metadata=dict(doc.metadata or {})))
+        kept_shingles.append(shingles)
+        kept_by_source.setdefault(source, []).append(doc.page_content)
+        used += tokens
+
+    stats = {
+        "chunks_in": len(docs),
+        "chunks_out": len(packed),
+        "duplicates_dropped": dropped,
+        "tokens_in": tokens_in,
+        "tokens_out": used,
+        "tokens_saved": tokens_in - used,
+        "budget": budget,
+    }
+    with _STATS_LOCK:
+        _STATS["answers"] += 1
+        _STATS["tokens_in"] += tokens_in
+        _STATS["tokens_out"] += used
+    return packed, stats
+
+
+def packer_stats() -> dict:
+    """Totals since startup"""
+    with _STATS_LOCK:
+        return {**_STATS, "tokens_saved": _STATS["tokens_in"] - _STATS["tokens_out"]}
@@ -1,21 +1,30 @@
-import re
+import asyncio
 import duckdb
 import os, tabulate
-import requests
 import json
 import sqlite3
 import os
 from pathlib import Path
 from functools import lru_cache
+import threading
 import time
 
-BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
-DB_PATH = os.path.join(BASE_DIR, "roles_docs.db")
+from rag_utils.table_profile import answer_from_profile, get_table_profile, describe_table_for_prompt, profiles_cached
+from rag_utils.sql_guard import run_guarded_query, QueryRejected, SQL_MAX_RESULT_ROWS
+from rag_utils.single_flight import SingleFlight
+from rag_utils.llm_client import get_llm_client, LLMError, LLMTimeoutError, LLMUnavailableError, SQL_TIMEOUT
+from rag_utils.llm_scheduler import QueueFullError, LLMCallCancelled, raise_if_cancelled
+from rag_utils.paths import ROLES_DB_PATH, DUCKDB_DIR, DUCKDB_FILE
+from rag_utils.metrics import stage, cache_event
+from rag_utils.tracing import span
+from rag_utils.logging_setup import get_logger
+
+logger = get_logger(__name__)
+
+DB_PATH = ROLES_DB_PATH
 
 # DuckDB setup
-DUCKDB_DIR = os.path.join(BASE_DIR, "static", "data")
 os.makedirs(DUCKDB_DIR, exist_ok=True)  # Create directory if it doesn't exist
-DUCKDB_FILE = os.path.join(DUCKDB_DIR, "structured_queries.duckdb")
 
 # Cache for table schemas with timestamp
 _SCHEMA_CACHE = {}
@@ -25,17 +34,10 @@ def get_duck_connection():
     """Get a DuckDB connection with proper connection management"""
     return duckdb.connect(DUCKDB_FILE, read_only=False)
 
-# Ollama setup
-OLLAMA_URL = "http://localhost:11434/api/generate"
-OLLAMA_HEALTH_URL = "http://localhost:11434/api/tags"
-
+# Ollama is reached through the shared pooled client
 def check_ollama_health():
-    """Quick health check for Ollama service"""
-    try:
-        response = requests.get(OLLAMA_HEALTH_URL, timeout=2)
-        return response.status_code == 200
-    except:
-        return False
+    """Cached health state for the Ollama service (no network round-trip)"""
+    return get_llm_client().is_available()
 
 @lru_cache(maxsize=50)
 def get_allowed_tables_for_role(role: str) -> list[str]:
@@ -62,11 +64,13 @@ def get_cached_schemas() -> list[tuple]:
     
     # Check if cache is valid
     if _SCHEMA_CACHE and _SCHEMA_CACHE.get("timestamp", 0) + _SCHEMA_CACHE_TTL > now:
-        print("[Schema Cache] Using cached schemas")
+        logger.debug("Schema cache hit")
+        cache_event("schema", "hit")
         return _SCHEMA_CACHE["data"]
+    cache_event("schema", "miss")
     
     # Fetch from database
-    print("[Schema Cache] Refreshing schemas from DB")
+    logger.info("Refreshing table schemas from the documents table")
     conn = sqlite3.connect(DB_PATH, check_same_thread=False)
     cur = conn.cursor()
     cur.execute("""
@@ -89,42 +93,136 @@ def invalidate_schema_cache():
     global _SCHEMA_CACHE
     _SCHEMA_CACHE = {}
 
+# In-memory DuckDB used only for parsing; one cursor per thread
+_PARSER_CONN = duckdb.connect(":memory:")
+_PARSER_LOCAL = threading.local()
+
+def _parser_cursor():
+    cursor = getattr(_PARSER_LOCAL, "cursor", None)
+    if cursor is None:
+        cursor = _PARSER_LOCAL.cursor = _PARSER_CONN.cursor()
+    return cursor
+
+def _collect_tables(node, ctes: frozenset, tables: list, table_functions: list):
+    """Walk the serialized parse tree collecting base tables, with CTE names resolved per scope"""
+    if isinstance(node, list):
+        for item in node:
+            _collect_tables(item, ctes, tables, table_functions)
+        return
+    if not isinstance(node, dict):
+        return
+
+    cte_map = node.get("cte_map")
+    if isinstance(cte_map, dict) and cte_map.get("map"):
+        ctes = ctes | {entry["key"].lower() for entry in cte_map["map"]}
+
+    node_type = node.get("type")
+    if node_type == "BASE_TABLE":
+        name = node.get("table_name", "")
+        schema = node.get("schema_name") or ""
+        catalog = node.get("catalog_name") or ""
+        if not schema and not catalog and name.lower() in ctes:
+            return  # reference to a CTE, not a stored table
+        # Only the default schema is addressable; keep qualifiers otherwise so the ACL check fails
+        qualifiers = [q for q in (catalog, schema) if q and q.lower() != "main"]
+        qualified = ".".join(qualifiers + [name])
+        if qualified not in tables:
+            tables.append(qualified)
+        return
+    if node_type == "TABLE_FUNCTION":
+        function = node.get("function", {})
+        table_functions.append(function.get("function_name", "?"))
+
+    for value in node.values():
+        if isinstance(value, (dict, list)):
+            _collect_tables(value, ctes, tables, table_functions)
+
+@lru_cache(maxsize=256)
+def analyze_sql(sql: str) -> dict:
+    """Parse SQL once with DuckDB's json_serialize_sql.
+
+    Returns {"safe": bool, "error": str | None, "tables": tuple[str, ...]}.
+    Only a single SELECT statement over base tables is safe; DML/DDL,
+    multiple statements and table functions (read_csv etc.) are rejected.
+    """
+    try:
+        serialized = _parser_cursor().execute("SELECT json_serialize_sql(?)", [sql]).fetchone()[0]
+        tree = json.loads(serialized)
+    except Exception as e:
+        return {"safe": False, "error": f"Could not parse SQL: {e}", "tables": ()}
+
+    if tree.get("error"):
+        # DuckDB only serializes SELECT statements, so this also covers INSERT/UPDATE/DDL
+        return {"safe": False, "error": tree.get("error_message", "Invalid SQL"), "tables": ()}
+    statements = tree.get("statements", [])
+    if len(statements) != 1:
+        return {"safe": False, "error": "Exactly one SELECT statement is allowed", "tables": ()}
+
+    tables, table_functions = [], []
+    _collect_tables(statements[0], frozenset(), tables, table_functions)
+    if table_functions:
+        return {
+            "safe": False,
+            "error": f"Table functions are not allowed: {', '.join(table_functions)}",
+            "tables": tuple(tables),
+        }
+    return {"safe": True, "error": None, "tables": tuple(tables)}
+
 def extract_tables_from_sql(sql: str) -> list[str]:
-    # Extract tables used in FROM and JOIN clauses
-    matches = re.findall(r'FROM\s+(\w+)|JOIN\s+(\w+)', sql, flags=re.IGNORECASE)
-    # Filter out common SQL keywords and placeholders that might be mistakenly extracted
-    excluded_keywords = [
-        'table', 'tables', 'table_name', 'tablename',  # Common placeholders
-        'select', 'where', 'group', 'order', 'by', 'having', 'limit', 'offset',  # SQL keywords
-        'database', 'schema'  # Other common terms
-    ]
-    filtered_matches = []
-    for match_tuple in matches:
-        for item in match_tuple:
-            if item and item.lower() not in excluded_keywords:
-                filtered_matches.append((item,))
-    return filtered_matches
-
-def flatten_matches(matches: list[tuple]) -> list[str]:
-    return [item for tup in matches for item in tup if item]
-
-FORBIDDEN = ["insert", "update", "delete", "drop", "alter", "create"]
+    """Stored tables referenced anywhere in the query (joins, subqueries, CTE bodies)"""
+    return list(analyze_sql(sql)["tables"])
 
 def is_safe_query(sql: str) -> bool:
-    lowered = sql.strip().lower().rstrip(";")
-    return lowered.startswith("select") and all(word not in lowered for word in FORBIDDEN)
+    return analyze_sql(sql)["safe"]
+
+def extract_sql(llm_answer: str) -> str:
+    """The SQL statement in an LLM response (code block, or the first line starting with SELECT)"""
+    sql_query = llm_answer
+
+    # Method 1: Extract from SQL code block
+    if "```sql" in sql_query.lower():
+        parts = sql_query.lower().split("```sql")
+        if len(parts) > 1:
+            sql_query = parts[1].split("```")[0].strip()
+    # Method 2: Extract from generic code block
+    elif "```" in sql_query:
+        parts = sql_query.split("```")
+        if len(parts) > 1:
+            sql_query = parts[1].split("```")[0].strip()
+
+    # Method 3: Find the SELECT statement
+    if not sql_query.strip().upper().startswith("SELECT"):
+        # Look for SELECT in the text
+        lines = sql_query.split("\n")
+        for line in lines:
+            stripped = line.strip()
+            if stripped.upper().startswith("SELECT"):
+                sql_query = stripped
+                break
+
+    # Remove any remaining markdown or explanatory text
+    return sql_query.strip()
+
+# Concurrent identical SQL generations share one LLM call
+_SQL_FLIGHTS = SingleFlight("sql")
 
 def translate_nl_to_sql(question: str, allowed_tables: list[str], history: list = None) -> str:
-    print("translate_nl_to_sql() called")
-    
-    # Quick health check before making expensive LLM call
+    # Only the last exchange of history reaches the prompt, so it is part of the key
+    recent_history = tuple((msg.get("role"), msg.get("content")) for msg in (history or [])[-2:])
+    key = (" ".join(question.lower().split()), tuple(sorted(allowed_tables)), recent_history)
+    with span("translate_nl_to_sql"):
+        return _SQL_FLIGHTS.do(key, _translate_nl_to_sql, question, allowed_tables, history)
+
+def _translate_nl_to_sql(question: str, allowed_tables: list[str], history: list = None) -> str:
+        
+    # Cached health check (kept fresh in the background) before the expensive LLM call
     if not check_ollama_health():
-        print("⚠️ Ollama service not responding")
+        logger.warning("Ollama service not responding")
         return "Error: LLM service unavailable"
     
     # Use cached schemas
     rows = get_cached_schemas()
-    print("Raw rows from cache/DB:", rows)
+    logger.debug("Schema rows: %s", rows)
 
     schemas = []
     for filename, headers_str in rows:
@@ -133,15 +231,22 @@ def translate_nl_to_sql(question: str, allowed_tables: list[str], history: list
             
             # IMPORTANT: Only include tables that the user has access to
             if table_name not in allowed_tables:
-                print(f"[Schema] Skipping {table_name} - not in allowed_tables")
+                logger.debug("Schema: skipping %s (not in allowed tables)", table_name)
                 continue
             
+            # Prefer the precomputed profile: column types + categorical values help the LLM
+            profile = get_table_profile(table_name, get_duck_connection)
+            if profile:
+                schemas.append(describe_table_for_prompt(profile))
+                logger.debug("Schema: added %s from table profile", table_name)
+                continue
+
             # If no headers or empty string, it's likely a markdown document
             # But for CSV files, we should still include them and fetch schema from DuckDB
             if not headers_str or headers_str.strip() == "":
                 # Check if it's a CSV file
                 if filename.endswith('.csv'):
-                    print(f"[Schema] CSV file {filename} has no headers_str, fetching from DuckDB...")
+                    logger.debug("Schema: %s has no stored headers, describing it in DuckDB", filename)
                     try:
                         with get_duck_connection() as duck_conn:
                             # Get actual columns from DuckDB
@@ -149,24 +254,24 @@ def translate_nl_to_sql(question: str, allowed_tables: list[str], history: list
                             actual_cols = [row[0] for row in desc_result]
                             cols = ", ".join(actual_cols)
                             schemas.append(f"Table: {table_name}\nColumns: {cols}")
-                            print(f"[Schema] Added {table_name} with columns from DuckDB")
+                            logger.debug("Schema: added %s with columns from DuckDB", table_name)
                     except Exception as e:
-                        print(f"[Schema] Could not fetch schema for {table_name}: {e}")
+                        logger.warning("Schema: could not describe %s: %s", table_name, e)
                 else:
-                    print(f"[Schema] Skipping {filename} - empty headers and not CSV")
+                    logger.debug("Schema: skipping %s (no headers, not a CSV)", filename)
                 continue
                 
             cols = ", ".join(headers_str.split(","))
             schemas.append(f"Table: {table_name}\nColumns: {cols}")
-            print(f"[Schema] Added {table_name} with {len(headers_str.split(','))} columns")
+            logger.debug("Schema: added %s with %d columns", table_name, len(headers_str.split(',')))
         except Exception as e:
-            print(f"❌ Error while building schema for {filename}: {e}")
+            logger.error("Error while building schema for %s: %s", filename, e)
 
     schema_block = "\n\n".join(schemas)
     
     # If no valid schemas found, return error
     if not schema_block:
-        print("❌ No valid CSV tables available for this role")
+        logger.warning("No valid CSV tables available for this role")
         return "Error: No accessible data tables found"
 
     # Format conversation history for context (reduced from 4 to 2 messages for speed)
@@ -211,61 +316,26 @@ Answer: SELECT * FROM hr_data WHERE LOWER(TRIM(department)) = 'finance' AND perf
 SQL:"""
 
     try:
-        ollama_payload = {
-            "model": "llama3.1",
-            "prompt": prompt,
-            "stream": False,
-            "options": {
-                "temperature": 0.0, 
-                "num_predict": 100,     # Increased to ensure full SQL is generated
-                "num_ctx": 512,         
-                "top_k": 5,             
-                "top_p": 0.3,           
-                "repeat_penalty": 1.0
-            }
+        options = {
+            "temperature": 0.0, 
+            "num_predict": 100,     # Increased to ensure full SQL is generated
+            "num_ctx": 512,         
+            "top_k": 5,             
+            "top_p": 0.3,           
+            "repeat_penalty": 1.0
         }
         
         # Timeout set to 45 seconds
-        response = requests.post(OLLAMA_URL, json=ollama_payload, timeout=45)
-        
-        if response.status_code != 200:
-            print(f"❌ Ollama returned status {response.status_code}")
-            return f"Ollama LLM error: {response.text}"
-        
-        llm_answer = response.json()["response"].strip()
-        print("LLM call successful")
-        print("Raw SQL from LLM:\n", llm_answer)
+        with stage("sql_generation"):
+            llm_answer = get_llm_client().generate(prompt, options=options, timeout=SQL_TIMEOUT)
+        logger.debug("Raw SQL from LLM: %s", llm_answer)
         
         # Clean up the response - extract just the SQL
-        sql_query = llm_answer
-        
-        # Method 1: Extract from SQL code block
-        if "```sql" in sql_query.lower():
-            parts = sql_query.lower().split("```sql")
-            if len(parts) > 1:
-                sql_query = parts[1].split("```")[0].strip()
-        # Method 2: Extract from generic code block
-        elif "```" in sql_query:
-            parts = sql_query.split("```")
-            if len(parts) > 1:
-                sql_query = parts[1].split("```")[0].strip()
-        
-        # Method 3: Find the SELECT statement
-        if not sql_query.strip().upper().startswith("SELECT"):
-            # Look for SELECT in the text
-            lines = sql_query.split("\n")
-            for line in lines:
-                stripped = line.strip()
-                if stripped.upper().startswith("SELECT"):
-                    sql_query = stripped
-                    break
-        
-        # Remove any remaining markdown or explanatory text
-        sql_query = sql_query.strip()
+        sql_query = extract_sql(llm_answer)
         
         # If still no valid SQL, return error
         if not sql_query or not sql_query.upper().startswith("SELECT"):
-            print(f"❌ Could not extract valid SQL from response: {llm_answer}")
+            logger.warning("Could not extract valid SQL from response: %s", llm_answer)
             return "Error: Failed to generate valid SQL query"
         
         # Validate: Check if SQL contains placeholder table names
@@ -273,69 +343,104 @@ SQL:"""
         placeholder_patterns = ['table_name', 'tablename', 'your_table', 'table_here', '<table']
         for placeholder in placeholder_patterns:
             if placeholder in sql_lower:
-                print(f"❌ SQL contains placeholder '{placeholder}' - regenerating with clearer prompt")
+                logger.warning("SQL contains placeholder %r", placeholder)
                 return "Error: SQL generation used placeholder table name. Please try again."
         
         # Validate: Check if any of the allowed tables are actually used
-        has_valid_table = any(table.lower() in sql_lower for table in allowed_tables)
+        allowed_lower = {table.lower() for table in allowed_tables}
+        has_valid_table = any(table.lower() in allowed_lower for table in extract_tables_from_sql(sql_query))
         if not has_valid_table:
-            print(f"❌ SQL doesn't use any allowed tables. Allowed: {allowed_tables}")
-            print(f"   SQL generated: {sql_query}")
+            logger.warning("SQL uses none of the allowed tables %s: %s", allowed_tables, sql_query)
             return f"Error: Generated SQL must use one of these tables: {', '.join(allowed_tables)}"
         
-        print(f"Extracted SQL: {sql_query}")
+        logger.debug("Extracted SQL: %s", sql_query)
         return sql_query
 
-    except requests.exceptions.Timeout:
-        print("❌ LLM call timed out after 45 seconds")
+    except LLMTimeoutError:
+        logger.warning("SQL generation timed out after %gs", SQL_TIMEOUT)
         return "Error: SQL generation timed out. Please try a simpler query."
-    except requests.exceptions.ConnectionError:
-        print("❌ Cannot connect to Ollama. Is it running?")
+    except LLMUnavailableError as e:
+        logger.error("Cannot connect to Ollama: %s", e)
         return "Error: Cannot connect to LLM service"
+    except LLMError as e:
+        logger.error("SQL generation failed: %s", e)
+        return f"Ollama LLM error: {e}"
+    except (QueueFullError, LLMCallCancelled):
+        # Overload is reported to the client as 429, not turned into a RAG fallback
+        raise
     except Exception as e:
-        print(f"❌ LLM call failed: {type(e).__name__}: {e}")
+        logger.exception("SQL generation failed: %s", type(e).__name__)
         return f"Error generating SQL: {str(e)}"
 
+def _run_query(sql: str):
+    with stage("sql_execution"), get_duck_connection() as duck_conn:
+        return run_guarded_query(duck_conn, sql)
+
 async def ask_csv(question: str, role: str, username: str, return_sql: bool = False, history: list = None) -> dict:
+    with span("ask_csv"):
+        return await _ask_csv(question, role, username, return_sql, history)
+
+async def _ask_csv(question: str, role: str, username: str, return_sql: bool = False, history: list = None) -> dict:
     allowed_tables = get_allowed_tables_for_role(role)
     
     # Early exit if no tables available
     if not allowed_tables:
-        print(f"[CSV Query] No tables available for role '{role}'")
+        logger.info("No tables available for role %r", role)
         return {"answer": "No CSV tables available for your role.", "error": True}
 
+    # Whole-table aggregates are answered from the precomputed profiles without an LLM call
+    if profiles_cached(allowed_tables):
+        profile_answer = answer_from_profile(question, allowed_tables, get_duck_connection)
+    else:
+        # Cold path opens DuckDB (and may profile a table); keep it off the event loop
+        profile_answer = await asyncio.to_thread(answer_from_profile, question, allowed_tables, get_duck_connection)
+    if profile_answer:
+        logger.info("Answered from table profile", extra={"sql": profile_answer["sql"]})
+        cache_event("table_profile", "hit")
+        response = {"answer": profile_answer["answer"]}
+        if return_sql:
+            response["sql"] = profile_answer["sql"]
+        return response
+
     try:
-        sql = translate_nl_to_sql(question, allowed_tables, history=history)
-        print(f"[SQL GENERATED]:\n{sql}")
+        # LLM call runs in a worker thread so the event loop keeps serving other requests
+        sql = await asyncio.to_thread(translate_nl_to_sql, question, allowed_tables, history)
+        logger.info("SQL generated", extra={"sql": sql})
         
         # Check if SQL generation failed
         if not sql or sql.startswith("Error") or sql.startswith("Ollama"):
-            print(f"[CSV Query] SQL generation failed: {sql}")
+            logger.warning("SQL generation failed: %s", sql)
             return {"answer": f"Failed to generate SQL query: {sql}", "error": True}
 
-        if not is_safe_query(sql):
-            print(f"[CSV Query] Unsafe query blocked")
+        # One parse drives both the statement check and the table ACL check
+        analysis = analyze_sql(sql)
+        if not analysis["safe"]:
+            logger.warning("Unsafe query blocked: %s", analysis["error"])
             return {"answer": "Only SELECT queries are allowed.", "error": True}
 
-        raw_matches = extract_tables_from_sql(sql)
-        referenced_tables = flatten_matches(raw_matches)
+        referenced_tables = list(analysis["tables"])
         
         # Convert to lowercase for comparison (DuckDB table names are case-insensitive)
         referenced_tables_lower = [t.lower() for t in referenced_tables]
         allowed_tables_lower = [t.lower() for t in allowed_tables]
         
-        print(f"[CSV Query] Extracted tables from SQL: {referenced_tables} -> {referenced_tables_lower}")
-        print(f"[CSV Query] Allowed tables for role '{role}': {allowed_tables} -> {allowed_tables_lower}")
+        logger.debug("Tables referenced %s, allowed for role %r %s", referenced_tables_lower, role, allowed_tables_lower)
 
         for i, table in enumerate(referenced_tables):
             table_lower = referenced_tables_lower[i]
             if table_lower not in allowed_tables_lower:
-                print(f"[CSV Query] Access denied to table '{table}' for role '{role}'")
+                logger.warning("Access denied to table %r for role %r", table, role)
                 return {"answer": f"Access denied to table: {table}", "error": True}
 
-        with get_duck_connection() as duck_conn:
-            result = duck_conn.execute(sql).fetchall()
-            columns = [desc[0] for desc in duck_conn.description]
+        # A speculative branch that already lost stops before running the query
+        raise_if_cancelled()
+
+        # Execute with plan-based cost checks, row cap, memory/thread limits and a deadline
+        try:
+            result, columns, truncated = await asyncio.to_thread(_run_query, sql)
+        except QueryRejected as e:
+            logger.warning("Query rejected by guard: %s", e)
+            return {"answer": f"Query rejected: {e}", "error": True}
         
         output = [list(row) for row in result]
 
@@ -351,6 +456,8 @@ async def ask_csv(question: str, role: str, username: str, return_sql: bool = Fa
             markdown_table = response_text
         else:
             markdown_table = tabulate.tabulate(output, headers=columns, tablefmt="github")
+            if truncated:
+                markdown_table += f"\n\n_Showing the first {SQL_MAX_RESULT_ROWS} rows._"
         
         response = {
             "answer": markdown_table
@@ -359,9 +466,11 @@ async def ask_csv(question: str, role: str, username: str, return_sql: bool = Fa
         if return_sql:
             response["sql"] = sql
 
-        print(f"[CSV Query] Success - returned {len(output)} row(s)")
+        logger.info("SQL answer with %d row(s)", len(output))
         return response
 
+    except (QueueFullError, LLMCallCancelled):
+        raise
     except Exception as e:
-        print(f"[CSV Query] Exception: {type(e).__name__}: {str(e)}")
+        logger.exception("CSV query failed: %s", type(e).__name__)
         return {"answer": f"❌ Error: {str(e)}", "error": True}
@@ -0,0 +1,122 @@
+"""Micro-batching of query embeddings across concurrent requests.
+
+Callers block in embed(). A dispatcher thread collects the texts that arrive
+within EMBED_BATCH_WINDOW_MS of the first one (at most EMBED_BATCH_MAX), sends
+them as one batched call and wakes every caller with its own vector. A batch
+runs with the LLM scheduling context of its most urgent caller, so a chat query
+does not wait behind evaluation traffic. Up to EMBED_BATCH_CONCURRENCY batches
+are in flight while the next one is being collected.
+"""
+import os
+import time
+import queue
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
+from rag_utils.llm_client import get_llm_client, LLMTimeoutError, EMBED_TIMEOUT
+from rag_utils.llm_scheduler import current_priority, raise_if_cancelled, set_cancel_token
+from rag_utils.metrics import EMBED_BATCH_SIZE
+
+# Collection window after the first queued query; 0 disables batching
+EMBED_BATCH_WINDOW_MS = float(os.getenv("EMBED_BATCH_WINDOW_MS", "5"))
+EMBED_BATCH_MAX = int(os.getenv("EMBED_BATCH_MAX", "32"))
+EMBED_BATCH_CONCURRENCY = int(os.getenv("EMBED_BATCH_CONCURRENCY", "2"))
+
+
+class _Request:
+    __slots__ = ("text", "priority", "context", "event", "result", "error")
+
+    def __init__(self, text: str):
+        self.text = text
+        self.priority = current_priority()
+        self.context = contextvars.copy_context()
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class EmbeddingBatcher:
+    """Turns concurrent single-text embed() calls into batched send(texts) calls"""
+
+    def __init__(self, send, window_ms: float = EMBED_BATCH_WINDOW_MS, max_batch: int = EMBED_BATCH_MAX,
+                 concurrency: int = EMBED_BATCH_CONCURRENCY, name: str = "embed"):
+        self.send = send
+        self.window = window_ms / 1000
+        self.max_batch = max(1, max_batch)
+        self.name = name
+        self._queue: queue.Queue = queue.Queue()
+        self._pool = ThreadPoolExecutor(max_workers=max(1, concurrency), thread_name_prefix=f"{name}-batch")
+        self._thread = None
+        self._lock = threading.Lock()
+        self.batches = 0
+        self.texts = 0
+
+    def embed(self, text: str, timeout: float = EMBED_TIMEOUT) -> list[float]:
+        raise_if_cancelled()
+        request = _Request(text)
+        self._start()
+        self._queue.put(request)
+        # The batch's own Ollama call is bounded by the same timeout; the window is extra
+        if not request.event.wait(timeout + self.window + 1):
+            raise LLMTimeoutError(f"Batched embedding timed out after {timeout:g} seconds")
+        if request.error is not None:
+            raise request.error
+        return request.result
+
+    def _start(self):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._collect, name=f"{self.name}-dispatcher", daemon=True)
+                    self._thread.start()
+
+    def _collect(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.window
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self._pool.submit(self._dispatch, batch)
+
+    def _dispatch(self, batch: list[_Request]):
+        # Identical queries in one batch are embedded once
+        texts = list(dict.fromkeys(request.text for request in batch))
+        urgent = min(batch, key=lambda request: request.priority)
+        try:
+            vectors = dict(zip(texts, urgent.context.run(self._send, texts)))
+            for request in batch:
+                request.result = vectors[request.text]
+        except Exception as e:
+            for request in batch:
+                request.error = e
+        finally:
+            EMBED_BATCH_SIZE.observe(len(texts))
+            with self._lock:
+                self.batches += 1
+                self.texts += len(texts)
+            for request in batch:
+                request.event.set()
+
+    def _send(self, texts: list[str]):
+        # The batch serves other callers too, so one abandoned caller must not cancel it
+        set_cancel_token(None)
+        return self.send(texts)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"batches": self.batches, "texts": self.texts,
+                    "mean_batch": round(self.texts / self.batches, 2) if self.batches else 0.0}
+
+
+@lru_cache(maxsize=None)
+def get_embed_batcher(model: str) -> EmbeddingBatcher:
+    """Process-wide batcher for one embedding model, sending to Ollama's /api/embed"""
+    return EmbeddingBatcher(lambda texts: get_llm_client().embed_many(texts, model=model), name=f"embed-{model}")
@@ -0,0 +1,252 @@
+"""In-process flat vector index over quantized, memory-mapped embeddings.
+
+An alternative to searching Chroma (VECTOR_BACKEND=flat). The index is exported
+from the Chroma collection, which stays the store documents are written to, into
+a versioned directory under FLAT_INDEX_DIR:
+
+    vectors.npy   normalized embeddings as float16, or int8 with a per-row scale
+    scales.npy    int8 only: float32 scale of each row
+    exact.npy     normalized float32 embeddings, read only for re-scoring
+    roles.npy     uint16 role code per row (the vocabulary is in manifest.json)
+    chunks.jsonl  page content and metadata per row
+
+Arrays are opened with mmap_mode="r", so API workers share the pages through the
+OS page cache. A search prefilters rows by role code, scores them over the
+quantized vectors in float32 blocks, re-scores the top candidates exactly and runs
+MMR on them like Chroma's max_marginal_relevance_search_by_vector.
+manifest.json is replaced atomically after each export; searches notice the new
+version and reopen the files.
+"""
+import os
+import json
+import time
+import uuid
+import shutil
+import threading
+from pathlib import Path
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: exports are serialized within a process only
+    fcntl = None
+
+import numpy as np
+
+from rag_utils.paths import FLAT_INDEX_DIR
+from rag_utils.logging_setup import get_logger
+
+logger = get_logger(__name__)
+
+# "float16" (half the size of float32) or "int8" (a quarter, with per-row scales)
+FLAT_INDEX_DTYPE = os.getenv("FLAT_INDEX_DTYPE", "float16")
+# Candidates re-scored with exact vectors, as a multiple of fetch_k
+FLAT_RESCORE_FACTOR = int(os.getenv("FLAT_RESCORE_FACTOR", "4"))
+_MANIFEST = "manifest.json"
+_BUILD_LOCK_FILE = "build.lock"
+_BUILD_LOCK = threading.Lock()
+_EXPORT_BATCH = 500
+# Rows converted to float32 per matrix product: NumPy has no BLAS path for float16 (or
+# int8) products, and converting the whole mapped matrix per query would not stay in cache
+_SCORE_BLOCK = 2048
+_SUPPORTED_FILTER_KEYS = {"role"}
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    return vectors / np.maximum(np.linalg.norm(vectors, axis=-1, keepdims=True), 1e-12)
+
+
+def _quantize(vectors: np.ndarray, dtype: str) -> tuple[np.ndarray, np.ndarray | None]:
+    if dtype == "float16":
+        return vectors.astype(np.float16), None
+    if dtype == "int8":
+        scales = np.maximum(np.abs(vectors).max(axis=1), 1e-12) / 127.0
+        return np.round(vectors / scales[:, None]).astype(np.int8), scales.astype(np.float32)
+    raise ValueError(f"Unsupported FLAT_INDEX_DTYPE: {dtype}")
+
+
+@contextmanager
+def _build_lock(directory: Path):
+    """One export at a time per index directory: across threads, and across workers where flock exists"""
+    with _BUILD_LOCK:
+        if fcntl is None:
+            yield
+            return
+        directory.mkdir(parents=True, exist_ok=True)
+        with open(directory / _BUILD_LOCK_FILE, "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def build_flat_index(collection, directory: str = FLAT_INDEX_DIR, dtype: str = FLAT_INDEX_DTYPE,
+                     if_missing: bool = False) -> dict:
+    """Export every chunk of a Chroma collection as a new index version and switch to it.
+
+    With if_missing, an index another thread or worker has already published is kept.
+    """
+    with _build_lock(Path(directory)):
+        manifest_path = Path(directory) / _MANIFEST
+        if if_missing and manifest_path.exists():
+            return json.loads(manifest_path.read_text(encoding="utf-8"))
+        return _export(collection, Path(directory), dtype)
+
+
+def _export(collection, directory: Path, dtype: str) -> dict:
+    texts, metadatas, vectors = [], [], []
+    offset = 0
+    while True:
+        batch = collection.get(include=["embeddings", "metadatas", "documents"], limit=_EXPORT_BATCH, offset=offset)
+        if not len(batch["ids"]):
+            break
+        texts.extend(batch["documents"])
+        metadatas.extend(m or {} for m in batch["metadatas"])
+        vectors.extend(np.asarray(e, dtype=np.float32) for e in batch["embeddings"])
+        offset += len(batch["ids"])
+
+    exact = _normalize(np.stack(vectors)) if vectors else np.zeros((0, 0), dtype=np.float32)
+    quantized, scales = _quantize(exact, dtype)
+    roles = sorted({m.get("role") or "" for m in metadatas})
+    codes = {role: i for i, role in enumerate(roles)}
+
+    # Names sort by creation time, so cleanup can tell older versions from newer ones
+    now = time.time_ns()
+    version = time.strftime("%Y%m%d%H%M%S", time.localtime(now // 10**9)) + f"-{now % 10**9:09d}-{os.getpid()}"
+    target = directory / version
+    target.mkdir(parents=True)
+    np.save(target / "vectors.npy", quantized)
+    if scales is not None:
+        np.save(target / "scales.npy", scales)
+    np.save(target / "exact.npy", exact.astype(np.float32))
+    np.save(target / "roles.npy", np.array([codes[m.get("role") or ""] for m in metadatas], dtype=np.uint16))
+    with open(target / "chunks.jsonl", "w", encoding="utf-8") as f:
+        for text, metadata in zip(texts, metadatas):
+            f.write(json.dumps({"text": text, "metadata": metadata}, ensure_ascii=False) + "\n")
+
+    manifest = {"version": version, "dtype": dtype, "count": len(texts),
+                "dim": int(exact.shape[1]) if len(texts) else 0, "roles": roles}
+    tmp = directory / f"{_MANIFEST}.{os.getpid()}-{uuid.uuid4().hex}.tmp"
+    tmp.write_text(json.dumps(manifest), encoding="utf-8")
+    os.replace(tmp, directory / _MANIFEST)
+
+    # Only versions older than this one: a newer directory belongs to an export still in progress.
+    # Older versions may still be mapped by other workers; on Windows they are removed on a later export
+    for entry in directory.iterdir():
+        if entry.is_dir() and entry.name < version:
+            shutil.rmtree(entry, ignore_errors=True)
+    logger.info("Exported %d chunks to flat index %s (%s)", len(texts), version, dtype)
+    return manifest
+
+
+class _Snapshot:
+    """One index version: mapped arrays plus chunk texts and metadata"""
+
+    def __init__(self, directory: Path, manifest: dict):
+        folder = directory / manifest["version"]
+        self.version = manifest["version"]
+        self.vectors = np.load(folder / "vectors.npy", mmap_mode="r")
+        self.scales = np.load(folder / "scales.npy", mmap_mode="r") if manifest["dtype"] == "int8" else None
+        self.exact = np.load(folder / "exact.npy", mmap_mode="r")
+        self.roles = np.load(folder / "roles.npy", mmap_mode="r")
+        self.role_codes = {role: i for i, role in enumerate(manifest["roles"])}
+        self.texts, self.metadatas = [], []
+        with open(folder / "chunks.jsonl", encoding="utf-8") as f:
+            for line in f:
+                entry = json.loads(line)
+                self.texts.append(entry["text"])
+                self.metadatas.append(entry["metadata"])
+        self._rows = {}
+
+    def rows(self, search_filter: dict | None) -> np.ndarray | None:
+        """Row numbers matching the filter (None = all rows), cached per set of roles"""
+        if not search_filter:
+            return None
+        unsupported = set(search_filter) - _SUPPORTED_FILTER_KEYS
+        if unsupported:
+            raise ValueError(f"Flat index filters support {sorted(_SUPPORTED_FILTER_KEYS)}, not {sorted(unsupported)}")
+        role = search_filter["role"]
+        # {"role": name} or {"role": {"$in": [names]}}, as in Chroma's where clause
+        roles = tuple(sorted(role["$in"])) if isinstance(role, dict) else (role,)
+        if roles not in self._rows:
+            codes = [self.role_codes[r] for r in roles if r in self.role_codes]
+            self._rows[roles] = np.flatnonzero(np.isin(self.roles, codes)) if codes else np.empty(0, dtype=np.int64)
+        return self._rows[roles]
+
+    def scores(self, query: np.ndarray, rows: np.ndarray | None) -> np.ndarray:
+        """Approximate cosine similarity from the quantized vectors, in float32 blocks"""
+        query = np.asarray(query, dtype=np.float32)
+        total = len(self.vectors) if rows is None else len(rows)
+        out = np.empty(total, dtype=np.float32)
+        for start in range(0, total, _SCORE_BLOCK):
+            stop = min(start + _SCORE_BLOCK, total)
+            index = slice(start, stop) if rows is None else rows[start:stop]
+            np.matmul(self.vectors[index].astype(np.float32), query, out=out[start:stop])
+            if self.scales is not None:
+                out[start:stop] *= self.scales[index]
+        return out
+
+
+class FlatVectorIndex:
+    """Search side of a vector store (what PartitionedMMRRetriever calls) over a flat index"""
+
+    def __init__(self, embeddings, directory: str = FLAT_INDEX_DIR):
+        self.embeddings = embeddings
+        self.directory = Path(directory)
+        self._snapshot = None
+        self._manifest_mtime = None
+        self._lock = threading.Lock()
+
+    def snapshot(self) -> _Snapshot:
+        """Current index version; reopened when another process or thread exported a new one"""
+        manifest_path = self.directory / _MANIFEST
+        mtime = manifest_path.stat().st_mtime_ns
+        if mtime != self._manifest_mtime:
+            with self._lock:
+                if mtime != self._manifest_mtime:
+                    manifest = json.loads(manifest_path.read_text(encoding="utf-8"))
+                    if self._snapshot is None or self._snapshot.version != manifest["version"]:
+                        self._snapshot = _Snapshot(self.directory, manifest)
+                    self._manifest_mtime = mtime
+        return self._snapshot
+
+    def _candidates(self, embedding, count: int, search_filter: dict | None):
+        snapshot = self.snapshot()
+        query = _normalize(np.asarray(embedding, dtype=np.float32))
+        rows = snapshot.rows(search_filter)
+        total = len(snapshot.texts) if rows is None else len(rows)
+        if total == 0 or count <= 0:
+            return snapshot, query, np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+        # Coarse pass over the quantized vectors, exact re-scoring of the best few
+        approximate = snapshot.scores(query, rows)
+        shortlist = min(total, count * FLAT_RESCORE_FACTOR)
+        top = np.argpartition(-approximate, shortlist - 1)[:shortlist]
+        top = np.sort(top if rows is None else rows[top])  # sorted rows read the mapped file in order
+        exact = snapshot.exact[top] @ query
+        order = np.argsort(-exact, kind="stable")[:count]
+        return snapshot, query, top[order], exact[order]
+
+    def _document(self, snapshot: _Snapshot, row: int):
+        from langchain_core.documents import Document
+
+        return Document(page_content=snapshot.texts[row], metadata=dict(snapshot.metadatas[row]))
+
+    def similarity_search_by_vector(self, embedding, k: int = 4, filter: dict | None = None, **kwargs) -> list:
+        snapshot, _, rows, _ = self._candidates(embedding, k, filter)
+        return [self._document(snapshot, row) for row in rows]
+
+    def similarity_search(self, query: str, k: int = 4, filter: dict | None = None, **kwargs) -> list:
+        return self.similarity_search_by_vector(self.embeddings.embed_query(query), k=k, filter=filter)
+
+    def max_marginal_relevance_search_by_vector(self, embedding, k: int = 4, fetch_k: int = 20,
+                                                lambda_mult: float = 0.5, filter: dict | None = None,
+                                                **kwargs) -> list:
+        from langchain_community.vectorstores.utils import maximal_marginal_relevance
+
+        snapshot, query, rows, _ = self._candidates(embedding, fetch_k, filter)
+        if len(rows) == 0:
+            return []
+        selected = maximal_marginal_relevance(query, np.asarray(snapshot.exact[rows]), lambda_mult=lambda_mult, k=k)
+        return [self._document(snapshot, rows[i]) for i in selected]
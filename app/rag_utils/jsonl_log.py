@@ -0,0 +1,66 @@
+"""Append-only JSONL logs written by a background thread, capped by size.
+
+Callers only enqueue a record (dropped when the queue is full), so a slow disk
+never blocks a request. A file that would grow past its byte budget is renamed
+to <file>.1, replacing the previous one, and a new file is started.
+"""
+import os
+import json
+import queue
+import threading
+
+from rag_utils.logging_setup import get_logger
+
+logger = get_logger(__name__)
+
+_QUEUE: queue.Queue = queue.Queue(maxsize=1000)
+_WRITER = None
+_WRITER_LOCK = threading.Lock()
+
+
+def _rotate(path: str, max_bytes: int, incoming: int):
+    try:
+        size = os.path.getsize(path)
+    except OSError:
+        return
+    if size and size + incoming > max_bytes:
+        os.replace(path, path + ".1")
+
+
+def _write_loop():
+    while True:
+        path, line, max_bytes = _QUEUE.get()
+        try:
+            data = line.encode("utf-8")
+            if max_bytes > 0:
+                _rotate(path, max_bytes, len(data))
+            with open(path, "ab") as f:
+                f.write(data)
+        except OSError as e:
+            logger.warning("Could not write %s: %s", path, e)
+        finally:
+            _QUEUE.task_done()
+
+
+def append_jsonl(path: str, record: dict, max_bytes: int = 0) -> bool:
+    """Queue one record for path (max_bytes 0 = no cap); False if it was dropped"""
+    global _WRITER
+    with _WRITER_LOCK:
+        if _WRITER is None:
+            _WRITER = threading.Thread(target=_write_loop, name="jsonl-writer", daemon=True)
+            _WRITER.start()
+    try:
+        _QUEUE.put_nowait((path, json.dumps(record, default=str) + "\n", max_bytes))
+    except queue.Full:
+        return False  # dropping a record is better than slowing a request down
+    return True
+
+
+def flush():
+    """Wait until every queued record is written (tests, shutdown)"""
+    _QUEUE.join()
+
+
+def rotated_files(path: str) -> list[str]:
+    """The existing files of a log, oldest first"""
+    return [p for p in (path + ".1", path) if os.path.exists(p)]
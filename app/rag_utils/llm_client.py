@@ -0,0 +1,214 @@
+import os
+import time
+import threading
+from functools import lru_cache
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from rag_utils.llm_scheduler import get_scheduler
+from rag_utils.logging_setup import get_logger
+
+logger = get_logger(__name__)
+
+# Ollama setup (shared by SQL generation, classification, RAG and evaluation)
+OLLAMA_BASE_URL = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434").rstrip("/")
+LLM_MODEL = os.getenv("OLLAMA_MODEL", "llama3.1")
+EMBED_MODEL = os.getenv("OLLAMA_EMBED_MODEL", "nomic-embed-text")
+
+# Per-call read timeouts in seconds, one per kind of call
+CONNECT_TIMEOUT = float(os.getenv("OLLAMA_CONNECT_TIMEOUT", "3"))
+CLASSIFY_TIMEOUT = float(os.getenv("OLLAMA_CLASSIFY_TIMEOUT", "15"))
+SQL_TIMEOUT = float(os.getenv("OLLAMA_SQL_TIMEOUT", "45"))
+RAG_TIMEOUT = float(os.getenv("OLLAMA_RAG_TIMEOUT", "120"))
+EMBED_TIMEOUT = float(os.getenv("OLLAMA_EMBED_TIMEOUT", "30"))
+EVAL_TIMEOUT = float(os.getenv("OLLAMA_EVAL_TIMEOUT", "300"))
+
+# How long Ollama keeps a model loaded after the last call (avoids reload on the next request)
+KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "30m")
+
+# Retries only cover connection errors and 5xx responses; timeouts are never retried
+LLM_RETRIES = int(os.getenv("OLLAMA_RETRIES", "1"))
+POOL_SIZE = int(os.getenv("OLLAMA_POOL_SIZE", "16"))
+HEALTH_INTERVAL = float(os.getenv("OLLAMA_HEALTH_INTERVAL", "10"))
+
+# Circuit breaker: open after N consecutive failures, probe again after the reset window
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("OLLAMA_BREAKER_THRESHOLD", "3"))
+BREAKER_RESET_SECONDS = float(os.getenv("OLLAMA_BREAKER_RESET", "15"))
+
+
+class LLMError(Exception):
+    """Ollama returned an error response"""
+
+
+class LLMUnavailableError(LLMError):
+    """Ollama is unreachable or the circuit breaker is open"""
+
+
+class LLMTimeoutError(LLMError):
+    """Ollama did not answer within the call's timeout"""
+
+
+class CircuitBreaker:
+    """Closed -> open after consecutive failures -> half-open after a cool-down.
+
+    While open every call fails immediately instead of waiting for a timeout.
+    In half-open state a single probe call is let through.
+    """
+
+    def __init__(self, failure_threshold: int = BREAKER_FAILURE_THRESHOLD, reset_seconds: float = BREAKER_RESET_SECONDS):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self._failures = 0
+        self._opened_at = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            if time.time() - self._opened_at >= self.reset_seconds:
+                return "half-open"
+            return "open"
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if time.time() - self._opened_at >= self.reset_seconds and not self._probing:
+                self._probing = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._probing = False
+            if self._failures >= self.failure_threshold:
+                if self._opened_at is None:
+                    logger.warning("Ollama circuit opened after %d consecutive failures", self._failures)
+                self._opened_at = time.time()
+
+
+class OllamaClient:
+    """Pooled keep-alive HTTP client for Ollama with cached health and a circuit breaker"""
+
+    def __init__(self, base_url: str = OLLAMA_BASE_URL):
+        self.base_url = base_url
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=POOL_SIZE, max_retries=0)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.breaker = CircuitBreaker()
+        self._healthy = None  # unknown until the first probe or call
+        self._monitor = None
+        self._monitor_lock = threading.Lock()
+
+    # ---------- health ----------
+    def check_health(self) -> bool:
+        """Probe /api/tags once and update the cached state"""
+        try:
+            response = self.session.get(f"{self.base_url}/api/tags", timeout=(CONNECT_TIMEOUT, 2))
+            healthy = response.status_code == 200
+        except requests.exceptions.RequestException:
+            healthy = False
+        self._healthy = healthy
+        if healthy:
+            self.breaker.record_success()
+        return healthy
+
+    def _monitor_loop(self):
+        while True:
+            self.check_health()
+            time.sleep(HEALTH_INTERVAL)
+
+    def start_health_monitor(self):
+        """Refresh the cached health state in a background thread"""
+        with self._monitor_lock:
+            if self._monitor is None:
+                self._monitor = threading.Thread(target=self._monitor_loop, name="ollama-health", daemon=True)
+                self._monitor.start()
+
+    def is_available(self) -> bool:
+        """Cached availability check - never blocks on the network"""
+        self.start_health_monitor()
+        return self._healthy is not False and self.breaker.state != "open"
+
+    # ---------- calls ----------
+    def _post(self, path: str, payload: dict, timeout: float) -> dict:
+        self.start_health_monitor()
+        # Fail fast while the circuit is open instead of taking a queue slot
+        if self.breaker.state == "open":
+            raise LLMUnavailableError("LLM service unavailable (circuit open)")
+        lane = "embed" if path.startswith("/api/embed") else "generate"
+        with get_scheduler(lane).slot():
+            return self._post_with_retries(path, payload, timeout)
+
+    def _post_with_retries(self, path: str, payload: dict, timeout: float) -> dict:
+        last_error = None
+        for attempt in range(LLM_RETRIES + 1):
+            if not self.breaker.allow():
+                raise LLMUnavailableError("LLM service unavailable (circuit open)")
+            try:
+                response = self.session.post(f"{self.base_url}{path}", json=payload, timeout=(CONNECT_TIMEOUT, timeout))
+            except requests.exceptions.Timeout as e:
+                self.breaker.record_failure()
+                raise LLMTimeoutError(f"LLM call timed out after {timeout:g} seconds") from e
+            except requests.exceptions.ConnectionError as e:
+                self.breaker.record_failure()
+                self._healthy = False
+                last_error = LLMUnavailableError("Cannot connect to LLM service")
+                last_error.__cause__ = e
+            else:
+                if response.status_code >= 500:
+                    self.breaker.record_failure()
+                    last_error = LLMError(f"Ollama returned status {response.status_code}: {response.text}")
+                elif response.status_code != 200:
+                    # Client errors (e.g. unknown model) are not an outage: the server answered,
+                    # which also ends a half-open probe
+                    self.breaker.record_success()
+                    raise LLMError(f"Ollama returned status {response.status_code}: {response.text}")
+                else:
+                    self.breaker.record_success()
+                    self._healthy = True
+                    return response.json()
+            if attempt < LLM_RETRIES:
+                time.sleep(0.2 * (attempt + 1))
+        raise last_error
+
+    def generate(self, prompt: str, options: dict | None = None, model: str | None = None,
+                 timeout: float = RAG_TIMEOUT, **extra) -> str:
+        """Non-streaming /api/generate call returning the response text"""
+        payload = {"model": model or LLM_MODEL, "prompt": prompt, "stream": False, "keep_alive": KEEP_ALIVE, **extra}
+        if options:
+            payload["options"] = options
+        return self._post("/api/generate", payload, timeout)["response"].strip()
+
+    def embed(self, text: str, model: str | None = None, timeout: float = EMBED_TIMEOUT) -> list[float]:
+        """Single-text /api/embeddings call"""
+        payload = {"model": model or EMBED_MODEL, "prompt": text, "keep_alive": KEEP_ALIVE}
+        return self._post("/api/embeddings", payload, timeout)["embedding"]
+
+    def embed_many(self, texts: list[str], model: str | None = None, timeout: float = EMBED_TIMEOUT) -> list[list[float]]:
+        """Batched /api/embed call; Ollama returns unit-length vectors from this endpoint"""
+        payload = {"model": model or EMBED_MODEL, "input": texts, "keep_alive": KEEP_ALIVE}
+        return self._post("/api/embed", payload, timeout)["embeddings"]
+
+    def preload(self, model: str | None = None, timeout: float = EVAL_TIMEOUT):
+        """Load a generation model into memory without generating anything"""
+        payload = {"model": model or LLM_MODEL, "keep_alive": KEEP_ALIVE}
+        self._post("/api/generate", payload, timeout)
+
+
+@lru_cache(maxsize=1)
+def get_llm_client() -> OllamaClient:
+    """Process-wide Ollama client so every caller shares one connection pool"""
+    return OllamaClient()
@@ -0,0 +1,254 @@
+import os
+import time
+import threading
+import contextvars
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+
+# Priority classes - lower value is served first
+INTERACTIVE = 0   # chat requests
+BACKGROUND = 1    # indexing / embedding of uploads
+BATCH = 2         # evaluation runs
+PRIORITY_NAMES = {INTERACTIVE: "interactive", BACKGROUND: "background", BATCH: "batch"}
+
+# Generation is the expensive lane; embeddings get their own, wider lane
+LLM_MAX_CONCURRENCY = int(os.getenv("OLLAMA_MAX_CONCURRENCY", "2"))
+LLM_MAX_QUEUE = int(os.getenv("OLLAMA_MAX_QUEUE", "32"))
+EMBED_MAX_CONCURRENCY = int(os.getenv("OLLAMA_EMBED_MAX_CONCURRENCY", "4"))
+EMBED_MAX_QUEUE = int(os.getenv("OLLAMA_EMBED_MAX_QUEUE", "64"))
+QUEUE_WAIT_TIMEOUT = float(os.getenv("OLLAMA_QUEUE_TIMEOUT", "60"))
+
+# Who is asking: set per request, inherited by worker threads via contextvars
+_priority_var = contextvars.ContextVar("llm_priority", default=INTERACTIVE)
+_tenant_var = contextvars.ContextVar("llm_tenant", default="anonymous")
+# Set on work that may be abandoned (a speculative branch); see CancelToken
+_cancel_var = contextvars.ContextVar("llm_cancel", default=None)
+
+
+class QueueFullError(Exception):
+    """The LLM queue is full (or the wait timed out); the caller should retry later"""
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class LLMCallCancelled(Exception):
+    """The work that wanted this LLM call was abandoned (e.g. it lost a speculative race)"""
+
+
+class CancelToken:
+    """Cancellation flag for one branch of work, shared with its worker threads.
+
+    Once cancelled, the branch's queued scheduler waits are dropped and its next
+    LLM calls fail with LLMCallCancelled instead of taking a slot.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._callbacks = []
+        self.cancelled = False
+
+    def cancel(self):
+        with self._lock:
+            if self.cancelled:
+                return
+            self.cancelled = True
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            callback()
+
+    def on_cancel(self, callback):
+        """Run callback when the token is cancelled (immediately if it already is)"""
+        with self._lock:
+            if not self.cancelled:
+                self._callbacks.append(callback)
+                return
+        callback()
+
+
+def set_cancel_token(token: CancelToken | None):
+    """Make the current task (and the threads it starts) abandon LLM calls once token is cancelled"""
+    _cancel_var.set(token)
+
+
+def cancel_requested() -> bool:
+    token = _cancel_var.get()
+    return token is not None and token.cancelled
+
+
+def raise_if_cancelled():
+    """Checkpoint between steps of work that may have been abandoned"""
+    if cancel_requested():
+        raise LLMCallCancelled("LLM work was cancelled")
+
+
+def set_llm_context(priority: int = INTERACTIVE, tenant: str = "anonymous"):
+    """Tag the current request/task for scheduling"""
+    _priority_var.set(priority)
+    _tenant_var.set(tenant)
+
+
+def current_priority() -> int:
+    return _priority_var.get()
+
+
+@contextmanager
+def llm_context(priority: int, tenant: str):
+    """Temporarily schedule calls with the given priority and tenant"""
+    p_token = _priority_var.set(priority)
+    t_token = _tenant_var.set(tenant)
+    try:
+        yield
+    finally:
+        _priority_var.reset(p_token)
+        _tenant_var.reset(t_token)
+
+
+class _Waiter:
+    __slots__ = ("event", "granted", "enqueued_at")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.granted = False
+        self.enqueued_at = time.time()
+
+
+class FairScheduler:
+    """Bounded-concurrency admission control in front of Ollama.
+
+    Waiters are queued per priority class and, within a class, per tenant;
+    tenants are served round-robin so one chatty user cannot starve others.
+    When the queue is full new calls are rejected immediately with a
+    Retry-After estimate instead of piling up until their timeouts fire.
+    """
+
+    def __init__(self, name: str, max_concurrency: int, max_queue: int):
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self._lock = threading.Lock()
+        self._active = 0
+        self._queues: dict[int, OrderedDict] = {p: OrderedDict() for p in PRIORITY_NAMES}
+        self._queued = 0
+        self._service_ewma = 2.0  # seconds, refined as calls complete
+        self.admitted = 0
+        self.rejected = 0
+        self.cancelled = 0
+        self.total_wait = 0.0
+
+    def _retry_after(self) -> int:
+        waves = (self._queued + self._active) / max(self.max_concurrency, 1)
+        return max(1, int(round(waves * self._service_ewma)))
+
+    def _dequeue_next(self) -> _Waiter | None:
+        for priority in sorted(self._queues):
+            tenants = self._queues[priority]
+            if not tenants:
+                continue
+            tenant, waiters = next(iter(tenants.items()))
+            waiter = waiters.popleft()
+            # Round-robin: the tenant goes to the back of its class
+            del tenants[tenant]
+            if waiters:
+                tenants[tenant] = waiters
+            self._queued -= 1
+            return waiter
+        return None
+
+    def _remove(self, waiter: _Waiter):
+        for tenants in self._queues.values():
+            for tenant, waiters in list(tenants.items()):
+                if waiter in waiters:
+                    waiters.remove(waiter)
+                    if not waiters:
+                        del tenants[tenant]
+                    self._queued -= 1
+                    return
+
+    def acquire(self, priority: int | None = None, tenant: str | None = None, timeout: float = QUEUE_WAIT_TIMEOUT):
+        priority = _priority_var.get() if priority is None else priority
+        tenant = _tenant_var.get() if tenant is None else tenant
+        token = _cancel_var.get()
+        raise_if_cancelled()
+        with self._lock:
+            if self._active < self.max_concurrency and self._queued == 0:
+                self._active += 1
+                self.admitted += 1
+                return
+            if self._queued >= self.max_queue:
+                self.rejected += 1
+                raise QueueFullError(f"{self.name} queue is full ({self._queued} waiting)", self._retry_after())
+            waiter = _Waiter()
+            self._queues.setdefault(priority, OrderedDict()).setdefault(tenant, deque()).append(waiter)
+            self._queued += 1
+
+        if token is not None:
+            token.on_cancel(waiter.event.set)  # wake up to leave the queue
+        waiter.event.wait(timeout)
+        with self._lock:
+            if not waiter.granted:
+                self._remove(waiter)
+                if token is not None and token.cancelled:
+                    self.cancelled += 1
+                    raise LLMCallCancelled(f"{self.name} wait cancelled")
+                self.rejected += 1
+                raise QueueFullError(f"{self.name} queue wait exceeded {timeout:g}s", self._retry_after())
+            self.admitted += 1
+            self.total_wait += time.time() - waiter.enqueued_at
+        if token is not None and token.cancelled:
+            # Granted as the branch was abandoned: pass the slot on unused
+            self.release()
+            raise LLMCallCancelled(f"{self.name} wait cancelled")
+
+    def release(self, service_time: float | None = None):
+        with self._lock:
+            if service_time is not None:
+                self._service_ewma = 0.8 * self._service_ewma + 0.2 * service_time
+            waiter = self._dequeue_next()
+            if waiter is None:
+                self._active -= 1
+                return
+            # Hand the slot straight to the next waiter; _active is unchanged
+            waiter.granted = True
+            waiter.event.set()
+
+    @contextmanager
+    def slot(self, priority: int | None = None, tenant: str | None = None):
+        self.acquire(priority, tenant)
+        started = time.time()
+        try:
+            yield
+        finally:
+            self.release(time.time() - started)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "active": self._active,
+                "max_concurrency": self.max_concurrency,
+                "queued": self._queued,
+                "max_queue": self.max_queue,
+                "queued_by_priority": {
+                    PRIORITY_NAMES[p]: sum(len(w) for w in tenants.values()) for p, tenants in self._queues.items()
+                },
+                "admitted": self.admitted,
+                "rejected": self.rejected,
+                "cancelled": self.cancelled,
+                "avg_wait_seconds": round(self.total_wait / self.admitted, 4) if self.admitted else 0.0,
+                "avg_service_seconds": round(self._service_ewma, 3),
+            }
+
+
+_SCHEDULERS = {
+    "generate": FairScheduler("generate", LLM_MAX_CONCURRENCY, LLM_MAX_QUEUE),
+    "embed": FairScheduler("embed", EMBED_MAX_CONCURRENCY, EMBED_MAX_QUEUE),
+}
+
+
+def get_scheduler(lane: str = "generate") -> FairScheduler:
+    return _SCHEDULERS[lane]
+
+
+def scheduler_stats() -> dict:
+    return {lane: scheduler.stats() for lane, scheduler in _SCHEDULERS.items()}
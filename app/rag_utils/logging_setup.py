@@ -0,0 +1,122 @@
+import os
+import sys
+import json
+import queue
+import atexit
+import logging
+import threading
+from logging.handlers import QueueHandler, QueueListener
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+# "json" for the log pipeline, "text" for a readable console
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json")
+# Keep 1 in N debug records per message template (high-volume events such as schema rows)
+LOG_DEBUG_SAMPLE_EVERY = int(os.getenv("LOG_DEBUG_SAMPLE_EVERY", "10"))
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+
+_STANDARD_ATTRS = set(vars(logging.makeLogRecord({}))) | {"message", "asctime", "request_id"}
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname.lower(),
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        if getattr(record, "request_id", None):
+            entry["request_id"] = record.request_id
+        # Structured fields passed via extra={...}
+        for key, value in vars(record).items():
+            if key not in _STANDARD_ATTRS and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class TextFormatter(logging.Formatter):
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)-7s %(name)s [%(request_id)s] %(message)s")
+
+    def format(self, record: logging.LogRecord) -> str:
+        record.request_id = getattr(record, "request_id", None) or "-"
+        return super().format(record)
+
+
+class RequestIdFilter(logging.Filter):
+    """Tag records with the id of the request being served (from the trace context)"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        from rag_utils.tracing import current_trace
+        trace = current_trace()
+        record.request_id = trace.request_id if trace is not None else None
+        return True
+
+
+class DebugSampler(logging.Filter):
+    """Pass every N-th DEBUG record per message template; other levels always pass"""
+
+    def __init__(self, every: int = LOG_DEBUG_SAMPLE_EVERY):
+        super().__init__()
+        self.every = max(1, every)
+        self._counts: dict = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno != logging.DEBUG or self.every == 1:
+            return True
+        key = (record.name, record.msg)
+        with self._lock:
+            count = self._counts.get(key, 0)
+            self._counts[key] = count + 1
+        if count % self.every:
+            return False
+        record.sampled_every = self.every
+        return True
+
+
+class _DroppingQueueHandler(QueueHandler):
+    """Never blocks the caller: when the queue is full the record is dropped and counted"""
+
+    dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            _DroppingQueueHandler.dropped += 1
+
+
+_LISTENER = None
+_CONFIG_LOCK = threading.Lock()
+
+
+def configure_logging():
+    """Route the "rag" loggers through a queue to a background writer thread (idempotent)"""
+    global _LISTENER
+    with _CONFIG_LOCK:
+        if _LISTENER is not None:
+            return
+        output = logging.StreamHandler(sys.stdout)
+        output.setFormatter(JsonFormatter() if LOG_FORMAT == "json" else TextFormatter())
+        log_queue: queue.Queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+        handler = _DroppingQueueHandler(log_queue)
+        handler.addFilter(DebugSampler())
+        handler.addFilter(RequestIdFilter())
+
+        root = logging.getLogger("rag")
+        root.setLevel(LOG_LEVEL)
+        root.handlers[:] = [handler]
+        root.propagate = False
+
+        _LISTENER = QueueListener(log_queue, output, respect_handler_level=False)
+        _LISTENER.start()
+        atexit.register(_LISTENER.stop)
+
+
+def get_logger(name: str) -> logging.Logger:
+    """Logger under the "rag" hierarchy, e.g. get_logger(__name__) in rag_utils.csv_query -> rag.csv_query"""
+    configure_logging()
+    return logging.getLogger(f"rag.{name.rsplit('.', 1)[-1]}")
@@ -0,0 +1,164 @@
+import time
+import threading
+from contextlib import contextmanager
+
+from rag_utils.tracing import span
+from rag_utils.logging_setup import get_logger
+
+logger = get_logger(__name__)
+
+# Latency buckets in seconds: sub-millisecond cache hits up to multi-minute generations
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: tuple, values: tuple, extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _number(value: float) -> str:
+    return "+Inf" if value == float("inf") else repr(float(value))
+
+
+class Counter:
+    def __init__(self, name: str, help_text: str, labelnames: tuple = ()):
+        self.name, self.help, self.labelnames = name, help_text, tuple(labelnames)
+        self._values: dict[tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount: float = 1.0):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def value(self, *labels) -> float:
+        with self._lock:
+            return self._values.get(labels, 0.0)
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for labels, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_labels(self.labelnames, labels)} {_number(value)}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, labelnames: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        self.name, self.help, self.labelnames = name, help_text, tuple(labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        self._series: dict[tuple, list] = {}  # labels -> [bucket counts, sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels):
+        with self._lock:
+            series = self._series.setdefault(labels, [[0] * len(self.buckets), 0.0, 0])
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+                    break
+            series[1] += value
+            series[2] += 1
+
+    @contextmanager
+    def time(self, *labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, *labels)
+
+    def count(self, *labels) -> int:
+        with self._lock:
+            return self._series.get(labels, [None, 0.0, 0])[2]
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for labels, (counts, total, count) in sorted(self._series.items()):
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets, counts):
+                    cumulative += bucket_count
+                    le = _labels(self.labelnames, labels, f'le="{_number(bound)}"')
+                    lines.append(f"{self.name}_bucket{le} {cumulative}")
+                lines.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {_number(total)}")
+                lines.append(f"{self.name}_count{_labels(self.labelnames, labels)} {count}")
+        return lines
+
+
+class Gauge:
+    """Read at scrape time from a callback returning {label values: value}"""
+
+    def __init__(self, name: str, help_text: str, labelnames: tuple, callback):
+        self.name, self.help, self.labelnames, self.callback = name, help_text, tuple(labelnames), callback
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge"]
+        try:
+            values = self.callback()
+        except Exception as e:
+            logger.warning("Gauge %s failed: %s", self.name, e)
+            values = {}
+        for labels, value in sorted(values.items()):
+            lines.append(f"{self.name}{_labels(self.labelnames, labels)} {_number(value)}")
+        return lines
+
+
+_REGISTRY: list = []
+
+
+def register(metric):
+    _REGISTRY.append(metric)
+    return metric
+
+
+def render_metrics() -> str:
+    """All registered metrics in the Prometheus text exposition format"""
+    lines = []
+    for metric in _REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# ---------- the application's metrics ----------
+STAGE_SECONDS = register(Histogram(
+    "rag_stage_duration_seconds",
+    "Latency of pipeline stages (classification, embedding, vector_search, rerank, "
+    "llm_generation, sql_generation, sql_execution)",
+    ("stage",),
+))
+ROUTE_DECISIONS = register(Counter("rag_route_decisions_total", "SQL/RAG routing decisions by deciding component", ("mode", "source")))
+FALLBACKS = register(Counter("rag_fallbacks_total", "Fallbacks taken while answering", ("kind",)))
+CACHE_EVENTS = register(Counter("rag_cache_events_total", "Cache hits, misses and evictions", ("cache", "event")))
+EMBED_BATCH_SIZE = register(Histogram(
+    "rag_embed_batch_size", "Query embeddings sent per batched Ollama call", buckets=(1, 2, 4, 8, 16, 32, 64),
+))
+CHAT_REQUESTS = register(Counter("rag_chat_requests_total", "Answered /chat requests by final mode", ("mode",)))
+
+
+@contextmanager
+def stage(name: str):
+    """Time one pipeline stage: histogram observation plus a span in the request trace"""
+    with span(name), STAGE_SECONDS.time(name):
+        yield
+
+
+def cache_event(cache: str, event: str):
+    CACHE_EVENTS.inc(cache, event)
+
+
+def _queue_depth() -> dict:
+    from rag_utils.llm_scheduler import scheduler_stats
+    values = {}
+    for lane, stats in scheduler_stats().items():
+        values[(lane, "queued")] = stats["queued"]
+        values[(lane, "active")] = stats["active"]
+    return values
+
+
+register(Gauge("ollama_queue_depth", "Ollama calls waiting for or holding a scheduler slot", ("lane", "state"), _queue_depth))
@@ -0,0 +1,98 @@
+from typing import Any, Optional
+
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.llms import LLM
+
+from rag_utils.llm_client import get_llm_client, LLMError, LLM_MODEL, EMBED_MODEL, RAG_TIMEOUT
+from rag_utils.embed_batcher import get_embed_batcher, EMBED_BATCH_WINDOW_MS
+from rag_utils.logging_setup import get_logger
+from rag_utils.single_flight import SingleFlight
+from rag_utils.metrics import stage
+
+logger = get_logger(__name__)
+
+# Concurrent requests embedding the same query share one embedding call
+_EMBED_FLIGHTS = SingleFlight("embed")
+
+
+class PooledOllama(LLM):
+    """LangChain LLM backed by the shared pooled Ollama client"""
+
+    model: str = LLM_MODEL
+    temperature: Optional[float] = None
+    num_predict: Optional[int] = None
+    num_ctx: Optional[int] = None
+    top_k: Optional[int] = None
+    top_p: Optional[float] = None
+    repeat_penalty: Optional[float] = None
+    timeout: float = RAG_TIMEOUT
+    keep_alive: Optional[str] = None
+
+    @property
+    def _llm_type(self) -> str:
+        return "pooled-ollama"
+
+    @property
+    def _identifying_params(self) -> dict:
+        return {"model": self.model, **self._options()}
+
+    def _options(self) -> dict:
+        options = {
+            "temperature": self.temperature,
+            "num_predict": self.num_predict,
+            "num_ctx": self.num_ctx,
+            "top_k": self.top_k,
+            "top_p": self.top_p,
+            "repeat_penalty": self.repeat_penalty,
+        }
+        return {k: v for k, v in options.items() if v is not None}
+
+    def _call(self, prompt: str, stop: Optional[list[str]] = None, run_manager: Any = None, **kwargs: Any) -> str:
+        options = self._options()
+        if stop:
+            options["stop"] = stop
+        extra = {"keep_alive": self.keep_alive} if self.keep_alive else {}
+        with stage("llm_generation"):
+            return get_llm_client().generate(prompt, options=options, model=self.model, timeout=self.timeout, **extra)
+
+
+class PooledOllamaEmbeddings(Embeddings):
+    """Ollama embeddings over the shared client.
+
+    Uses the same passage/query instruction prefixes as langchain's
+    OllamaEmbeddings so vectors stay compatible with the existing index.
+
+    With batch_queries, queries go through the micro-batcher (rag_utils.embed_batcher).
+    Its /api/embed endpoint returns unit vectors, not the /api/embeddings vectors the
+    index holds, so it is only enabled for the flat index, which ranks by cosine
+    similarity; Chroma ranks by L2 distance and always gets the exact vectors.
+    """
+
+    def __init__(self, model: str = EMBED_MODEL, embed_instruction: str = "passage: ", query_instruction: str = "query: ",
+                 batch_queries: bool = False):
+        self.model = model
+        self.embed_instruction = embed_instruction
+        self.query_instruction = query_instruction
+        self.batch_queries = batch_queries and EMBED_BATCH_WINDOW_MS > 0
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        client = get_llm_client()
+        with stage("embedding"):
+            return [client.embed(f"{self.embed_instruction}{text}", model=self.model) for text in texts]
+
+    def embed_query(self, text: str) -> list[float]:
+        prompt = f"{self.query_instruction}{text}"
+        with stage("embedding"):
+            return _EMBED_FLIGHTS.do((self.model, self.batch_queries, prompt), self._embed_query, prompt)
+
+    def _embed_query(self, prompt: str) -> list[float]:
+        if self.batch_queries:
+            try:
+                return get_embed_batcher(self.model).embed(prompt)
+            except LLMError as e:
+                if type(e) is not LLMError:
+                    raise  # timeouts and outages are not about the endpoint
+                # Ollama before /api/embed (0.3): keep using single-text calls
+                logger.warning("Batched embeddings unavailable, embedding queries one by one: %s", e)
+                self.batch_queries = False
+        return get_llm_client().embed(prompt, model=self.model)
@@ -0,0 +1,17 @@
+import os
+
+# Repository root; every data path is anchored here so the working directory does not matter
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+
+ROLES_DB_PATH = os.getenv("ROLES_DB_PATH", os.path.join(BASE_DIR, "roles_docs.db"))
+CHROMA_DIR = os.getenv("CHROMA_DIR", os.path.join(BASE_DIR, "chroma_db"))
+FLAT_INDEX_DIR = os.getenv("FLAT_INDEX_DIR", os.path.join(BASE_DIR, "flat_index"))
+STATIC_DIR = os.path.join(BASE_DIR, "static")
+UPLOAD_DIR = os.path.join(STATIC_DIR, "uploads")
+DUCKDB_DIR = os.path.join(STATIC_DIR, "data")
+DUCKDB_FILE = os.getenv("DUCKDB_FILE", os.path.join(DUCKDB_DIR, "structured_queries.duckdb"))
+
+
+def resolve(path: str) -> str:
+    """Absolute path for a stored (possibly repo-relative) file path"""
+    return path if os.path.isabs(path) else os.path.join(BASE_DIR, path)
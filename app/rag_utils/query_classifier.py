@@ -1,10 +1,17 @@
-import requests
-import os
+import re
 from functools import lru_cache
 import hashlib
 
-# Ollama setup
-OLLAMA_URL = "http://localhost:11434/api/generate"
+from rag_utils.llm_client import get_llm_client, LLMError, CLASSIFY_TIMEOUT
+from rag_utils.single_flight import SingleFlight
+from rag_utils.query_router import get_router, ROUTER_MIN_CONFIDENCE
+from rag_utils.metrics import stage, ROUTE_DECISIONS
+from rag_utils.logging_setup import get_logger
+
+logger = get_logger(__name__)
+
+# Concurrent identical questions share one classifier call
+_CLASSIFY_FLIGHTS = SingleFlight("classify")
 
 # Fast keyword-based classification (no LLM needed)
 SQL_KEYWORDS = [
@@ -23,91 +30,99 @@ RAG_KEYWORDS = [
     "policy", "policies", "guidelines", "about", "understand"
 ]
 
+# Strong SQL indicators with explicit patterns
+SQL_PATTERNS = [
+    "details of employee", "employees in", "employees whose", "employees with",
+    "show me employee", "show employee", "list employee", "get employee", "find employee",
+    "greater than", "less than", "equal to", "rating >", "rating <", "rating =",
+    "performance rating", "salary", "who has", "which department", "hired in",
+    "working in", "from department", "in department"
+]
+
+# Strong RAG indicators
+RAG_PATTERNS = [
+    "tell me about", "explain the", "describe the", "summary of",
+    "summarize the", "highlights of", "overview of"
+]
+
+
+def _matcher(phrases: list[str]) -> re.Pattern:
+    """One compiled alternation instead of a substring scan per phrase (presence checks)"""
+    return re.compile("|".join(re.escape(p) for p in sorted(set(phrases), key=len, reverse=True)))
+
+
+def _counter(phrases: list[str]) -> re.Pattern:
+    """One optional lookahead group per phrase, matched once at the start of the text.
+
+    An alternation only reports one phrase per position, so overlapping phrases
+    ("employee" / "employees") would be undercounted.
+    """
+    return re.compile("".join(f"(?=(?:.*?({re.escape(p)}))?)" for p in dict.fromkeys(phrases)), re.DOTALL)
+
+
+def _count(counter: re.Pattern, text: str) -> int:
+    """Number of the counter's phrases present in text"""
+    return sum(group is not None for group in counter.match(text).groups())
+
+
+_SQL_KEYWORD_RE = _counter(SQL_KEYWORDS)
+_RAG_KEYWORD_RE = _counter(RAG_KEYWORDS)
+_SQL_PATTERN_RE = _matcher(SQL_PATTERNS)
+_RAG_PATTERN_RE = _matcher(RAG_PATTERNS + ["handbook"])
+_SQL_TERM_RE = _matcher(["salary", "employee", "rating", "department", "count", "total"])
+_DOC_NOUN_RE = _matcher(["handbook", "report", "policy", "policies", "guidelines"])
+_EXPLAIN_VERB_RE = _matcher(["summarize", "summary", "explain", "describe", "what is", "overview"])
+_SQL_SINGLE_RE = _matcher(["how many", "count ", "total number", "average", "sum of"])
+_RAG_SINGLE_RE = _matcher(["summary", "summarize", "explain what", "tell me about"])
+
+
 def fast_classify(question: str) -> str | None:
-    """Fast keyword-based classification. Returns None if uncertain."""
+    """Fast rule-based classification. Returns None if uncertain."""
     q_lower = question.lower()
     # Normalize phrases that can confuse SQL detection (e.g., "employee handbook" is a doc, not a table)
     q_norm = q_lower.replace("employee handbook", "handbook")
-    
-    # Strong SQL indicators with explicit patterns
-    sql_patterns = [
-        "details of employee",
-        "employees in",
-        "employees whose",
-        "employees with",
-        "show me employee",
-        "show employee",
-        "list employee",
-        "get employee",
-        "find employee",
-        "greater than",
-        "less than",
-        "equal to",
-        "rating >",
-        "rating <",
-        "rating =",
-        "performance rating",
-        "salary",
-        "who has",
-        "which department",
-        "hired in",
-        "working in",
-        "from department",
-        "in department"
-    ]
-    
-    # Strong RAG indicators
-    rag_patterns = [
-        "tell me about",
-        "explain the",
-        "describe the",
-        "summary of",
-        "summarize the",
-        "highlights of",
-        "overview of"
-    ]
-    
-    # Check for strong RAG patterns first (to avoid SQL false positives)
-    # But exclude if it contains SQL-related terms like "salary", "employee", etc.
-    # Use normalized text so phrases like "employee handbook" don't count as SQL-y
-    has_sql_terms = any(term in q_norm for term in ["salary", "employee", "rating", "department", "count", "total"])
-    
-    if not has_sql_terms:
-        if any(pattern in q_lower for pattern in rag_patterns) or ("handbook" in q_lower):
-            return "RAG"
+
+    # Strong RAG patterns win unless SQL-related terms are present
+    if not _SQL_TERM_RE.search(q_norm) and _RAG_PATTERN_RE.search(q_lower):
+        return "RAG"
 
     # Strong override: document-oriented nouns + explanation verbs => RAG
-    doc_nouns = ["handbook", "report", "policy", "policies", "guidelines"]
-    explain_verbs = ["summarize", "summary", "explain", "describe", "what is", "overview"]
-    if any(n in q_lower for n in doc_nouns) and any(v in q_lower for v in explain_verbs):
+    if _DOC_NOUN_RE.search(q_lower) and _EXPLAIN_VERB_RE.search(q_lower):
         return "RAG"
-    
-    # Check for strong SQL patterns
-    if any(pattern in q_lower for pattern in sql_patterns):
+
+    if _SQL_PATTERN_RE.search(q_lower):
         return "SQL"
-    
-    # Check for strong SQL indicators
-    sql_score = sum(1 for keyword in SQL_KEYWORDS if keyword in q_norm)
-    rag_score = sum(1 for keyword in RAG_KEYWORDS if keyword in q_lower)
-    
-    # Definitive SQL patterns
-    if sql_score >= 2:
+
+    # Definitive keyword scores
+    if _count(_SQL_KEYWORD_RE, q_norm) >= 2:
         return "SQL"
-    
-    # Definitive RAG patterns
-    if rag_score >= 2:
+    if _count(_RAG_KEYWORD_RE, q_lower) >= 2:
         return "RAG"
-    
+
     # Single strong keyword checks
-    if any(kw in q_lower for kw in ["how many", "count ", "total number", "average", "sum of"]):
+    if _SQL_SINGLE_RE.search(q_lower):
         return "SQL"
-    
-    if any(kw in q_lower for kw in ["summary", "summarize", "explain what", "tell me about"]):
+    if _RAG_SINGLE_RE.search(q_lower):
         return "RAG"
-    
-    # If mixed or unclear, return None to trigger LLM
+
+    # If mixed or unclear, return None so the router (then the LLM) decides
     return None
 
+
+def route_query(question: str) -> tuple[str | None, float, str]:
+    """Classify without the LLM: rules first, then the trained router.
+
+    Returns (mode, confidence, source); mode is None when neither is confident.
+    """
+    mode = fast_classify(question)
+    if mode:
+        return mode, 1.0, "rules"
+    mode, confidence = get_router().predict(question)
+    if confidence >= ROUTER_MIN_CONFIDENCE:
+        return mode, confidence, "router"
+    return None, confidence, "router"
+
+
 @lru_cache(maxsize=100)
 def _cached_llm_classify(question_hash: str, question: str) -> str:
     """Cached LLM classification to avoid repeated calls for same questions."""
@@ -131,24 +146,14 @@ Here is the question:
 Answer:
     """
 
-    ollama_payload = {
-        "model": "llama3.1",
-        "prompt": prompt,
-        "stream": False,
-        "options": {"temperature": 0.0, "num_predict": 10}  # Very short output needed
-    }
+    options = {"temperature": 0.0, "num_predict": 10}  # Very short output needed
     
     try:
-        response = requests.post(OLLAMA_URL, json=ollama_payload, timeout=15)  # Reduced timeout
-        
-        if response.status_code != 200:
-            return "RAG"  # Default fallback
-    except (requests.exceptions.Timeout, requests.exceptions.ConnectionError):
-        print("⚠️ Query classifier timeout/connection error - defaulting to RAG")
+        result = get_llm_client().generate(prompt, options=options, timeout=CLASSIFY_TIMEOUT).upper()
+    except LLMError as e:
+        logger.warning("Classifier LLM error (%s), defaulting to RAG", e)
         return "RAG"  # Default fallback
     
-    result = response.json()["response"].strip().upper()
-    
     # Extract SQL or RAG from the response
     if "SQL" in result:
         return "SQL"
@@ -156,15 +161,17 @@ Answer:
         return "RAG"
 
 def detect_query_type_llm(question: str) -> str:
-    """Detect query type with fast keyword matching first, LLM fallback if needed."""
-    # Try fast classification first
-    fast_result = fast_classify(question)
-    if fast_result:
-        print(f"[Fast Classifier] {fast_result} (skipped LLM)")
-        return fast_result
-    
-    # Fall back to LLM with caching
-    question_hash = hashlib.md5(question.lower().encode()).hexdigest()
-    result = _cached_llm_classify(question_hash, question)
-    print(f"[LLM Classifier] {result}")
-    return result
+    """Detect query type: rules, then the trained router, LLM only if both are unsure."""
+    with stage("classification"):
+        mode, confidence, source = route_query(question)
+        if mode:
+            logger.info("Routed to %s by %s (confidence %.2f)", mode, source, confidence)
+            ROUTE_DECISIONS.inc(mode, source)
+            return mode
+
+        # Rare fallback: LLM with caching
+        question_hash = hashlib.md5(question.lower().encode()).hexdigest()
+        result = _CLASSIFY_FLIGHTS.do(question_hash, _cached_llm_classify, question_hash, question)
+        logger.info("Routed to %s by llm (router confidence %.2f)", result, confidence)
+        ROUTE_DECISIONS.inc(result, "llm")
+        return result
@@ -0,0 +1,120 @@
+import os
+import re
+from functools import lru_cache
+
+from rag_utils.llm_client import get_llm_client, LLMError, CLASSIFY_TIMEOUT
+from rag_utils.single_flight import SingleFlight
+from rag_utils.logging_setup import get_logger
+
+logger = get_logger(__name__)
+
+# Ask the LLM only for follow-ups the rules cannot rewrite
+CONDENSE_WITH_LLM = os.getenv("CONDENSE_WITH_LLM", "1") == "1"
+# History passed to generation: last N messages, each cut to this many characters
+HISTORY_MESSAGES = int(os.getenv("GENERATION_HISTORY_MESSAGES", "2"))
+HISTORY_MESSAGE_CHARS = int(os.getenv("GENERATION_HISTORY_CHARS", "200"))
+
+_CONDENSE_FLIGHTS = SingleFlight("condense")
+
+# Pronouns standing in for the previous question's topic. "it" is skipped in
+# "is it" / "it is" constructions ("Is it possible to work remotely?"), and
+# this/these/those only count on their own ("Does this apply...?"), not in front
+# of a noun of their own ("this year", "these employees")
+_PRONOUN_RE = re.compile(
+    r"\b(?:(?<!\bis )it(?!\s+is\b|'s\b)|its|they|them|their|"
+    r"(?:this|these|those)(?=\s*(?:[?.!,;]|$)|\s+(?:is|are|was|were|be|has|have|had|do|does|did|can|could|will|would|"
+    r"should|may|might|must|apply|applies|mean|means|cover|covers|include|includes|affect|affects|cost|costs|"
+    r"work|works|require|requires|for|to|in|on|of|at|with|about|from|by)\b))\b",
+    re.IGNORECASE,
+)
+# "what about X", "and for X", "same for X" - the previous question with a new subject
+_ELLIPSIS_RE = re.compile(r"^\s*(?:and\s+)?(?:what|how)\s+about\s+|^\s*and\s+(?:for\s+)?|^\s*same\s+for\s+", re.IGNORECASE)
+# Leading request phrasing stripped to get the topic of a question
+_LEAD_RE = re.compile(
+    r"^\s*(?:please\s+)?(?:what\s+(?:is|are|was|were)|tell\s+me\s+about|explain|describe|summari[sz]e|"
+    r"give\s+(?:me\s+)?(?:an?\s+)?(?:overview|summary)\s+of|how\s+does|how\s+do|list|show(?:\s+me)?)\s+",
+    re.IGNORECASE,
+)
+
+
+def _last_user_question(history: list) -> str | None:
+    for msg in reversed(history or []):
+        if msg.get("role") == "user" and msg.get("content", "").strip():
+            return msg["content"].strip()
+    return None
+
+
+def _topic(question: str) -> str:
+    """'Explain the leave policy?' -> 'the leave policy'"""
+    return _LEAD_RE.sub("", question).strip().rstrip("?.!").strip()
+
+
+def _is_follow_up(question: str) -> bool:
+    """Only a real back-reference counts; short questions are often standalone ("How many employees?")"""
+    return bool(_PRONOUN_RE.search(question)) or bool(_ELLIPSIS_RE.match(question))
+
+
+def _rule_rewrite(question: str, previous: str) -> str | None:
+    """Cheap rewrites: pronoun substitution. Returns None when the rules do not apply."""
+    if _ELLIPSIS_RE.match(question):
+        return None
+    topic = _topic(previous)
+    matches = _PRONOUN_RE.findall(question)
+    # Only a single unambiguous reference is substituted
+    if not topic or len(matches) != 1:
+        return None
+    pronoun = matches[0].lower()
+    replacement = f"{topic}'s" if pronoun in ("its", "their") else topic
+    return _PRONOUN_RE.sub(replacement, question, count=1)
+
+
+def _llm_rewrite(question: str, previous: str) -> str | None:
+    prompt = (
+        "Rewrite the follow-up question so it can be understood without the conversation. "
+        "Reply with the rewritten question only.\n\n"
+        f"Previous question: {previous}\n"
+        f"Follow-up question: {question}\n\n"
+        "Standalone question:"
+    )
+    try:
+        rewritten = get_llm_client().generate(prompt, options={"temperature": 0.0, "num_predict": 60}, timeout=CLASSIFY_TIMEOUT)
+    except LLMError as e:
+        logger.warning("LLM rewrite failed: %s", e)
+        return None
+    rewritten = rewritten.strip().strip('"').splitlines()[0].strip() if rewritten.strip() else ""
+    return rewritten or None
+
+
+@lru_cache(maxsize=512)
+def _condense(question: str, previous: str) -> str:
+    rewritten = _rule_rewrite(question, previous)
+    if rewritten:
+        logger.debug("Condensed by rules: %s", rewritten)
+        return rewritten
+    if CONDENSE_WITH_LLM:
+        rewritten = _CONDENSE_FLIGHTS.do((question, previous), _llm_rewrite, question, previous)
+        if rewritten:
+            logger.debug("Condensed by llm: %s", rewritten)
+            return rewritten
+    # Fallback: only the previous user question as context, never the answers
+    return f"{previous.rstrip('?.! ')}; {question}"
+
+
+def condense_question(question: str, history: list | None) -> str:
+    """Rewrite a follow-up into a standalone question (unchanged if already standalone)"""
+    question = question.strip()
+    previous = _last_user_question(history)
+    if not previous or not _is_follow_up(question):
+        return question
+    return _condense(question, previous)
+
+
+def compact_history(history: list | None) -> str:
+    """Last few messages, each shortened, for the generation prompt only"""
+    lines = []
+    for msg in (history or [])[-HISTORY_MESSAGES:]:
+        content = " ".join(str(msg.get("content", "")).split())
+        if len(content) > HISTORY_MESSAGE_CHARS:
+            content = content[:HISTORY_MESSAGE_CHARS].rstrip() + "…"
+        lines.append(f"{'User' if msg.get('role') == 'user' else 'Assistant'}: {content}")
+    return "\n".join(lines)
@@ -0,0 +1,169 @@
+import os
+import re
+import csv
+import json
+import math
+from collections import Counter
+from functools import lru_cache
+
+from rag_utils.jsonl_log import append_jsonl, rotated_files
+from rag_utils.logging_setup import get_logger
+
+logger = get_logger(__name__)
+
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+
+# Labelled examples the router is trained from
+QUERY_SET_FILE = os.path.join(BASE_DIR, "queries_by_role.txt")
+QA_PAIRS_FILE = os.path.join(BASE_DIR, "app", "rag_evaluator", "qa_pairs_openai.csv")
+TRAFFIC_LOG_FILE = os.getenv("ROUTER_TRAFFIC_LOG", os.path.join(BASE_DIR, "static", "data", "router_traffic.jsonl"))
+# The log holds raw questions; past this size it is rotated to <file>.1 (one old file is kept)
+TRAFFIC_LOG_MAX_BYTES = int(os.getenv("ROUTER_TRAFFIC_MAX_BYTES", str(1024 * 1024)))
+
+# Below this confidence the router abstains and the LLM classifier decides
+ROUTER_MIN_CONFIDENCE = float(os.getenv("ROUTER_MIN_CONFIDENCE", "0.8"))
+
+LABELS = ("SQL", "RAG")
+
+# Hand-written examples so the SQL class is not starved (the document sets are mostly RAG)
+_SEED_EXAMPLES = [
+    ("How many employees are in each department?", "SQL"),
+    ("Count employees per location", "SQL"),
+    ("What is the average salary by department?", "SQL"),
+    ("Show the top 5 employees with the highest salary", "SQL"),
+    ("List employees with performance rating above 4", "SQL"),
+    ("Which department has the most employees?", "SQL"),
+    ("Total number of employees hired in 2022", "SQL"),
+    ("Show all employees located in Bangalore", "SQL"),
+    ("Give me the details of employee Aadhya Patel", "SQL"),
+    ("Who has the lowest performance rating?", "SQL"),
+    ("Maximum and minimum salary in the Finance department", "SQL"),
+    ("Find employees whose salary is greater than 100000", "SQL"),
+    ("Sum of salaries for the Marketing department", "SQL"),
+    ("Number of employees with leave balance less than 5", "SQL"),
+    ("Get the email of employees in the Sales department", "SQL"),
+    ("What is the leave policy?", "RAG"),
+    ("Summarize the marketing report", "RAG"),
+    ("Explain the code of conduct", "RAG"),
+    ("What are the guidelines for remote work?", "RAG"),
+    ("Describe the onboarding process", "RAG"),
+    ("Give an overview of the engineering architecture", "RAG"),
+    ("What does the handbook say about reimbursements?", "RAG"),
+    ("What were the key highlights of the Q3 campaign?", "RAG"),
+]
+
+_TOKEN_RE = re.compile(r"[a-z0-9_]+|[<>=]+")
+_SECTION_RE = re.compile(r"^(SQL|RAG)\s*\(\d+\):\s*$")
+_NUMBERED_RE = re.compile(r"^\d+\)\s*(.+)$")
+
+
+def _features(text: str) -> list[str]:
+    """Word unigrams and bigrams of a lower-cased question"""
+    tokens = _TOKEN_RE.findall(text.lower())
+    return tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+
+
+class QueryRouter:
+    """Multinomial naive Bayes over word n-grams deciding SQL vs RAG.
+
+    Priors are uniform so the larger RAG training set does not bias the
+    decision; confidence is the posterior probability of the chosen label.
+    Classification is a dictionary lookup per n-gram, well under a millisecond.
+    """
+
+    def __init__(self, alpha: float = 1.0):
+        self.alpha = alpha
+        self.examples = 0
+        self._log_prob: dict[str, dict[str, float]] = {}
+        self._log_unseen: dict[str, float] = {}
+
+    def fit(self, examples: list[tuple[str, str]]) -> "QueryRouter":
+        counts = {label: Counter() for label in LABELS}
+        for text, label in examples:
+            if label in counts:
+                counts[label].update(_features(text))
+                self.examples += 1
+        vocabulary = set().union(*counts.values())
+        for label, counter in counts.items():
+            total = sum(counter.values()) + self.alpha * (len(vocabulary) + 1)
+            self._log_prob[label] = {f: math.log((c + self.alpha) / total) for f, c in counter.items()}
+            self._log_unseen[label] = math.log(self.alpha / total)
+        return self
+
+    def predict(self, question: str) -> tuple[str, float]:
+        """Return (label, confidence)"""
+        features = _features(question)
+        scores = {
+            label: sum(self._log_prob[label].get(f, self._log_unseen[label]) for f in features)
+            for label in LABELS
+        }
+        best = max(scores, key=scores.get)
+        top = scores[best]
+        norm = sum(math.exp(score - top) for score in scores.values())
+        return best, 1.0 / norm
+
+
+def load_query_set(path: str = QUERY_SET_FILE) -> list[tuple[str, str]]:
+    """Parse the SQL/RAG sections of queries_by_role.txt"""
+    examples = []
+    if not os.path.exists(path):
+        return examples
+    label = None
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            section = _SECTION_RE.match(line)
+            if section:
+                label = section.group(1)
+                continue
+            numbered = _NUMBERED_RE.match(line)
+            if numbered and label:
+                examples.append((numbered.group(1), label))
+            elif line.startswith("Role:") or line.startswith("==="):
+                label = None
+    return examples
+
+
+def load_qa_pairs(path: str = QA_PAIRS_FILE) -> list[tuple[str, str]]:
+    """Every evaluation question is answered from documents"""
+    if not os.path.exists(path):
+        return []
+    with open(path, newline="", encoding="utf-8") as f:
+        return [(row["question"], "RAG") for row in csv.DictReader(f) if row.get("question")]
+
+
+def load_traffic(path: str | None = None) -> list[tuple[str, str]]:
+    """Routes confirmed by real requests (see record_route)"""
+    examples = []
+    for log_file in rotated_files(TRAFFIC_LOG_FILE if path is None else path):
+        with open(log_file, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                if entry.get("mode") in LABELS and entry.get("question"):
+                    examples.append((entry["question"], entry["mode"]))
+    return examples
+
+
+def record_route(question: str, mode: str, path: str | None = None):
+    """Queue a route confirmed by the outcome of a request for the traffic log (written in the background)"""
+    path = TRAFFIC_LOG_FILE if path is None else path
+    if mode not in LABELS or not path:
+        return
+    append_jsonl(path, {"question": question, "mode": mode}, TRAFFIC_LOG_MAX_BYTES)
+
+
+@lru_cache(maxsize=1)
+def get_router() -> QueryRouter:
+    """Router trained once per process; call reload_router() to pick up new traffic"""
+    examples = _SEED_EXAMPLES + load_query_set() + load_qa_pairs() + load_traffic()
+    router = QueryRouter().fit(examples)
+    logger.info("Router trained on %d labelled questions", router.examples)
+    return router
+
+
+def reload_router() -> QueryRouter:
+    get_router.cache_clear()
+    return get_router()
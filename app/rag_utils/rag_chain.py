@@ -1,92 +1,137 @@
-from rag_utils.rag_module import get_rag_chain
+import asyncio
+import time
+
+from rag_utils.rag_module import get_rag_components
+from rag_utils.context_packer import pack_context
+from rag_utils.query_condenser import condense_question, compact_history
 from rag_utils.secret_key import cohere_api_key
+from rag_utils.single_flight import SingleFlight
+from rag_utils.llm_scheduler import raise_if_cancelled
+from rag_utils.metrics import cache_event
+from rag_utils.tracing import span
+from rag_utils.logging_setup import get_logger
 
+logger = get_logger(__name__)
 
-async def ask_rag(question: str, role: str, detail: str = "brief", use_cohere: bool = False, history: list = None) -> dict:
-    """Ask the RAG chain and return an answer. detail: 'brief' or 'extended'."""
-    api_key = cohere_api_key if use_cohere else None
+# Simple in-memory cache to speed up repeated questions (10 min TTL)
+# Keyed by (role, detail, normalized_question)
+_RAG_ANSWER_CACHE = {}
+CACHE_TTL = 600.0
 
-    # Simple in-memory cache to speed up repeated questions (10 min TTL)
-    # Keyed by (role, detail, normalized_question)
-    global _RAG_ANSWER_CACHE
-    try:
-        _RAG_ANSWER_CACHE
-    except NameError:
-        _RAG_ANSWER_CACHE = {}
-    CACHE_TTL = 600.0
+# Concurrent identical questions share one retrieval + generation (same key as the cache)
+_RAG_FLIGHTS = SingleFlight("rag")
 
-    def _now():
-        import time as _t
-        return _t.time()
 
-    def _norm(q: str) -> str:
-        return " ".join((q or "").strip().lower().split())
+def invalidate_answer_cache():
+    """Drop cached answers after documents were removed from the vector store"""
+    _RAG_ANSWER_CACHE.clear()
 
-    cache_key = (role.lower(), (detail or "brief").lower(), _norm(question))
-    entry = _RAG_ANSWER_CACHE.get(cache_key)
-    if entry and entry.get("expiry", 0) > _now():
-        # Return cached result immediately
-        return entry["value"]
-
-    # Format history for context
-    history_context = ""
-    if history:
-        # Take last few exchanges for context (reduce tokens for faster responses)
-        for msg in history[-4:]:
-            role_label = "User" if msg.get("role") == "user" else "Assistant"
-            history_context += f"{role_label}: {msg.get('content', '')}\n"
-    
-    # Prepend history to question if available
-    enhanced_question = question
-    if history_context:
-        enhanced_question = f"Previous conversation:\n{history_context}\n\nCurrent question: {question}"
-    
-    # Pass detail through to the chain builder so prompts can adjust verbosity
-    chain = get_rag_chain(user_role=role, cohere_api_key=api_key, detail=detail)
 
-    # Invoke the chain and request both the answer and retrieved context
-    result = chain.invoke({"input": enhanced_question})
+def _norm(q: str) -> str:
+    return " ".join((q or "").strip().lower().split())
 
-    answer = result.get("answer")
-    context_docs = result.get("context", [])
 
-    # Extract source filenames from retrieved documents (if present)
+def _extract_sources(context_docs) -> list:
+    """Unique source filenames of the retrieved documents, in retrieval order"""
     sources = []
     for d in context_docs:
         md = getattr(d, "metadata", {}) or d.get("metadata", {})
         src = md.get("source") if isinstance(md, dict) else None
-        if src:
-            if src not in sources:
-                sources.append(src)
-
-    # If nothing useful found for this role, try a single fallback to General handbook
-    not_found_phrase = "i couldn't find an answer in the documents"
-    need_general_fallback = (
-        (not answer or not sources or (not_found_phrase in (answer or "").lower()))
-        and role.lower() != "general"
-    )
-
-    if need_general_fallback:
-        general_chain = get_rag_chain(user_role="General", cohere_api_key=api_key, detail=detail)
-        g_result = general_chain.invoke({"input": enhanced_question})
-        g_answer = g_result.get("answer")
-        g_context_docs = g_result.get("context", [])
-        g_sources = []
-        for d in g_context_docs:
-            md = getattr(d, "metadata", {}) or d.get("metadata", {})
-            src = md.get("source") if isinstance(md, dict) else None
-            if src and src not in g_sources:
-                g_sources.append(src)
-
-        # Use general fallback only if it produced something non-empty
-        if g_answer and g_sources:
-            answer = g_answer
-            context_docs = g_context_docs
-            sources = g_sources
-
-    response = {"answer": answer, "context": context_docs, "sources": sources}
-
-    # Store in cache
-    _RAG_ANSWER_CACHE[cache_key] = {"value": response, "expiry": _now() + CACHE_TTL}
-
-    return response
\ No newline at end of file
+        if src and src not in sources:
+            sources.append(src)
+    return sources
+
+
+def _generation_input(question: str, history: list) -> str:
+    """Standalone question plus a compact view of the conversation for the LLM"""
+    history_context = compact_history(history)
+    if history_context:
+        return f"Previous conversation:\n{history_context}\n\nCurrent question: {question}"
+    return question
+
+
+def _answer_question(question: str, role: str, detail: str, api_key, history: list, context_docs: list = None) -> dict:
+    """Blocking retrieval + generation; runs in a worker thread.
+
+    question is already standalone (see condense_question); history only
+    reaches the generation prompt.
+    """
+    # Pass detail through so prompts can adjust verbosity
+    retriever, qa_chain = get_rag_components(role, cohere_api_key=api_key, detail=detail)
+
+    # Retrieval may already have run (prefetched while SQL was generated)
+    if context_docs is None:
+        with span("retrieval"):
+            context_docs = retriever.invoke(question)
+
+    # Drop overlapping / near-duplicate chunks and fit the detail level's token budget
+    with span("context_packing"):
+        context_docs, pack = pack_context(context_docs, detail)
+    logger.debug("Context packed: %d→%d chunks, %d→%d tokens",
+                 pack["chunks_in"], pack["chunks_out"], pack["tokens_in"], pack["tokens_out"])
+
+    # A speculative branch that lost while retrieving stops before generation
+    raise_if_cancelled()
+    answer = qa_chain.invoke({"input": _generation_input(question, history), "context": context_docs})
+
+    # Extract source filenames from the documents the answer was generated from
+    sources = _extract_sources(context_docs)
+
+    # Every non-General retrieval includes General documents (see retrieval_partitions),
+    # so there is no second chain invocation against the General handbook here.
+
+    return {"answer": answer, "context": context_docs, "sources": sources}
+
+
+async def _standalone(question: str, history: list) -> str:
+    if not history:
+        return question
+    # May call the LLM for follow-ups the rules cannot rewrite
+    with span("condense"):
+        return await asyncio.to_thread(condense_question, question, history)
+
+
+async def retrieve_context(question: str, role: str, detail: str = "brief", use_cohere: bool = False, history: list = None) -> list:
+    """Run only the retrieval step of the role's RAG chain (used to prefetch while SQL is generated)"""
+    api_key = cohere_api_key if use_cohere else None
+    retriever, _ = get_rag_components(role, cohere_api_key=api_key, detail=detail)
+    with span("rag_prefetch"):
+        standalone = await _standalone(question, history)
+        return await asyncio.to_thread(retriever.invoke, standalone)
+
+
+async def ask_rag(question: str, role: str, detail: str = "brief", use_cohere: bool = False, history: list = None,
+                  context_docs: list = None) -> dict:
+    """Ask the RAG chain and return an answer. detail: 'brief' or 'extended'.
+
+    context_docs: documents already retrieved via retrieve_context; skips retrieval.
+    """
+    with span("ask_rag"):
+        return await _ask_rag(question, role, detail, use_cohere, history, context_docs)
+
+
+async def _ask_rag(question: str, role: str, detail: str, use_cohere: bool, history: list, context_docs: list) -> dict:
+    api_key = cohere_api_key if use_cohere else None
+
+    # Follow-ups are rewritten first so retrieval and the cache key depend on the real question
+    question = await _standalone(question, history)
+    cache_key = (role.lower(), (detail or "brief").lower(), _norm(question))
+    entry = _RAG_ANSWER_CACHE.get(cache_key)
+    if entry and entry.get("expiry", 0) > time.time():
+        # Return cached result immediately
+        cache_event("rag_answer", "hit")
+        return entry["value"]
+    if entry:
+        # Expired: drop it now rather than keeping it until the recompute finishes
+        _RAG_ANSWER_CACHE.pop(cache_key, None)
+        cache_event("rag_answer", "eviction")
+    cache_event("rag_answer", "miss")
+
+    async def _compute():
+        # Blocking LangChain calls run off the event loop so other requests keep flowing
+        response = await asyncio.to_thread(_answer_question, question, role, detail, api_key, history, context_docs)
+        # Store in cache
+        _RAG_ANSWER_CACHE[cache_key] = {"value": response, "expiry": time.time() + CACHE_TTL}
+        return response
+
+    return await _RAG_FLIGHTS.do_async(cache_key, _compute)
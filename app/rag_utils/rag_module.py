@@ -1,24 +1,21 @@
 # ========== CONFIG ==========
+# LangChain, Chroma, pandas and Cohere are imported where they are first used:
+# importing this module must stay cheap (API worker boot, test collection).
 from pathlib import Path
 import os
-import pandas as pd
-from collections import defaultdict
-from langchain.schema import Document
 import sqlite3
-
-
-from langchain_community.document_loaders import UnstructuredMarkdownLoader
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_community.vectorstores import Chroma
-from langchain_community.embeddings import OllamaEmbeddings
-from langchain_community.llms import Ollama
-from langchain.prompts import ChatPromptTemplate
-from langchain.chains.combine_documents import create_stuff_documents_chain
-from langchain.chains import create_retrieval_chain
-from langchain.retrievers import ContextualCompressionRetriever
-from langchain_cohere import CohereRerank
+import threading
+from functools import lru_cache
 
 from rag_utils.secret_key import langchain_key,cohere_api_key
+from rag_utils.llm_client import RAG_TIMEOUT
+from rag_utils.llm_scheduler import llm_context, BACKGROUND
+from rag_utils.paths import CHROMA_DIR, FLAT_INDEX_DIR, ROLES_DB_PATH, resolve
+from rag_utils.startup import timed
+from rag_utils.metrics import stage
+from rag_utils.logging_setup import get_logger
+
+logger = get_logger(__name__)
 
 
 
@@ -34,34 +31,125 @@ os.environ["COHERE_API_KEY"] = cohere_api_key
 # ====Split,load,embed==========
 # ==============================
 
-# Use Ollama embeddings with nomic-embed-text model
-ollama_embeddings = OllamaEmbeddings(model="nomic-embed-text")
-vectorstore = Chroma(
-    collection_name="my_collection",
-    persist_directory="chroma_db",
-    embedding_function=ollama_embeddings
-)
+@lru_cache(maxsize=1)
+def get_embeddings(batch_queries: bool = False):
+    """Ollama embeddings with nomic-embed-text model (shared pooled client).
 
+    batch_queries: micro-batch query embeddings; their vectors are normalized, so
+    only for searches that rank by cosine similarity (the flat index).
+    """
+    with timed("embeddings"):
+        from rag_utils.ollama_langchain import PooledOllamaEmbeddings
+        return PooledOllamaEmbeddings(model="nomic-embed-text", batch_queries=batch_queries)
+
+
+COLLECTION_NAME = "my_collection"
+# "chroma" searches the Chroma collection; "flat" searches a memory-mapped export of it (rag_utils.flat_index)
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "chroma").lower()
+_VECTORSTORE_LOCK = threading.Lock()
+_VECTORSTORE = None
+_SEARCH_INDEX = None
+# Held while chunks are added or removed, so compaction never loses a concurrent write
+VECTORSTORE_WRITE_LOCK = threading.RLock()
+
+
+def get_vectorstore():
+    """Open the persistent Chroma collection on first use"""
+    global _VECTORSTORE
+    if _VECTORSTORE is None:
+        with _VECTORSTORE_LOCK:
+            if _VECTORSTORE is None:
+                embeddings = get_embeddings()
+                with timed("vectorstore"):
+                    from langchain_community.vectorstores import Chroma
+                    _VECTORSTORE = Chroma(
+                        collection_name=COLLECTION_NAME,
+                        persist_directory=CHROMA_DIR,
+                        embedding_function=embeddings
+                    )
+    return _VECTORSTORE
+
+
+def get_search_index():
+    """What retrieval searches: the Chroma store, or the flat index when VECTOR_BACKEND=flat.
+
+    Chroma stays the store documents are written to; the flat index is exported
+    from it on first use (when missing) and after every change.
+    """
+    global _SEARCH_INDEX
+    if VECTOR_BACKEND != "flat":
+        return get_vectorstore()
+    if _SEARCH_INDEX is None:
+        from rag_utils.flat_index import FlatVectorIndex, build_flat_index
+
+        if not os.path.exists(os.path.join(FLAT_INDEX_DIR, "manifest.json")):
+            # Concurrent first searches (threads or workers) wait for a single export
+            build_flat_index(get_vectorstore()._collection, if_missing=True)
+        with _VECTORSTORE_LOCK:
+            if _SEARCH_INDEX is None:
+                with timed("flat_index"):
+                    # Cosine ranking: batched (unit length) query vectors rank like the exact ones
+                    _SEARCH_INDEX = FlatVectorIndex(get_embeddings(batch_queries=True))
+                    _SEARCH_INDEX.snapshot()
+    return _SEARCH_INDEX
+
+
+def refresh_search_index():
+    """Export the flat index again after chunks were added or removed (no-op for Chroma)"""
+    if VECTOR_BACKEND == "flat":
+        from rag_utils.flat_index import build_flat_index
+
+        build_flat_index(get_vectorstore()._collection)
+
+
+def reset_vectorstore():
+    """Forget the open collection (and the retrievers built on it) after it was replaced"""
+    global _VECTORSTORE
+    with _VECTORSTORE_LOCK:
+        _VECTORSTORE = None
+        _COMPONENT_CACHE.clear()
+        _CHAIN_CACHE.clear()
+
+
+def split_documents(docs):
+    from langchain.text_splitter import RecursiveCharacterTextSplitter
 
-def embed_documents_to_vectorstore(docs):
     # Optimized chunk size for faster processing and retrieval
     text_splitter = RecursiveCharacterTextSplitter(
         chunk_size=800,      # Reduced from 1000 for faster retrieval
         chunk_overlap=150    # Reduced from 200 for less redundancy
     )
-    splits = text_splitter.split_documents(docs)
-    vectorstore.add_documents(splits)
-    
-    print("Documents embedded and saved to vectorstore.")
-    print("Total documents:", len(vectorstore.get()["documents"]))
+    return text_splitter.split_documents(docs)
+
+
+def embed_documents_to_vectorstore(docs):
+    from rag_utils.vector_admin import record_chunks
 
+    vectorstore = get_vectorstore()
+    splits = split_documents(docs)
+    with VECTORSTORE_WRITE_LOCK:
+        vectorstore.add_documents(splits)
+        record_chunks([split.metadata for split in splits])
+        refresh_search_index()
 
+    logger.info("Embedded %d chunks into the vector store", len(splits))
 
 
-def load_file(filepath, role):
+
+
+def load_file(filepath, role, doc_id=None):
+    """Documents of a CSV (one per row) or Markdown file; doc_id ties their chunks to the documents row"""
+    from langchain_core.documents import Document
+
+    # Older rows store paths relative to the repository root
+    filepath = resolve(filepath)
     ext = Path(filepath).suffix.lower()
+    metadata = {"role": role.lower(), "source": Path(filepath).name}
+    if doc_id is not None:
+        metadata["doc_id"] = doc_id
     try:
         if ext == ".csv":
+            import pandas as pd
             df1 = pd.read_csv(filepath)
             documents = []
             for row in df1.to_dict(orient="records"):
@@ -69,7 +157,7 @@ def load_file(filepath, role):
                 documents.append(
                     Document(
                         page_content=content,
-                        metadata={"role": role.lower(), "source": Path(filepath).name}
+                        metadata=dict(metadata)
                     )
                 )
             return documents  # Return a list of documents
@@ -80,41 +168,45 @@ def load_file(filepath, role):
             return [
                 Document(
                     page_content=content,
-                    metadata={"role": role.lower(), "source": Path(filepath).name}
+                    metadata=dict(metadata)
                 )
             ]
         else:
             return None
 
     except Exception as e:
-        print(f"Failed to process {filepath}: {e}")
+        logger.error("Failed to process %s: %s", filepath, e)
         return None
 
 
 def run_indexer():
-    conn = sqlite3.connect("roles_docs.db")
+    conn = sqlite3.connect(ROLES_DB_PATH)
     c = conn.cursor()
-    c.execute("SELECT id, filepath, role FROM documents WHERE embedded = 0")
-    
-    all_docs = []
-
-    for doc_id, path, role in c.fetchall():
-        docs = load_file(path, role)
-        if docs:
-            if isinstance(docs, list):
-                all_docs.extend(docs)
-            else:
-                all_docs.append(docs)
-
-            # Mark this file as embedded
-            c.execute("UPDATE documents SET embedded = 1 WHERE id = ?", (doc_id,))
-
-    if all_docs:
-        embed_documents_to_vectorstore(all_docs)
-        conn.commit()
-
-    conn.close()
-    print(f"Indexed {len(all_docs)} document chunks.")
+    try:
+        c.execute("SELECT id, filepath, role FROM documents WHERE embedded = 0")
+        
+        all_docs = []
+
+        for doc_id, path, role in c.fetchall():
+            docs = load_file(path, role, doc_id)
+            if docs:
+                if isinstance(docs, list):
+                    all_docs.extend(docs)
+                else:
+                    all_docs.append(docs)
+
+                # Mark this file as embedded
+                c.execute("UPDATE documents SET embedded = 1 WHERE id = ?", (doc_id,))
+
+        if all_docs:
+            # Indexing yields to interactive chat in the LLM scheduler
+            with llm_context(BACKGROUND, "indexer"):
+                embed_documents_to_vectorstore(all_docs)
+            conn.commit()
+    finally:
+        # Always release the write lock, even when embedding fails
+        conn.close()
+    logger.info("Indexed %d documents", len(all_docs))
 
 
 # ==============================
@@ -133,42 +225,83 @@ system_prompt_extended = (
     "{context}"
 )
 
-chat_prompt_brief = ChatPromptTemplate.from_messages([
-    ("system", system_prompt_brief),
-    ("human", "{input}"),
-])
+_SYSTEM_PROMPTS = {"brief": system_prompt_brief, "extended": system_prompt_extended}
 
-chat_prompt_extended = ChatPromptTemplate.from_messages([
-    ("system", system_prompt_extended),
-    ("human", "{input}"),
-])
 
 # ==============================
 # ========== MODEL ==========
 # ==============================
-model = Ollama(
-    model="llama3.1",  
-    # Tighter generation settings to speed up RAG responses without hurting quality
-    temperature=0.0,     # Deterministic and concise
-    timeout=120,         # Keep overall cap at 2 minutes
-    num_predict=100,     # Lower max tokens to reduce generation time
-    top_p=0.5,           # More focused sampling
-    repeat_penalty=1.1   # Prevent repetition
-)
+@lru_cache(maxsize=1)
+def get_model():
+    with timed("llm"):
+        from rag_utils.ollama_langchain import PooledOllama
+        return PooledOllama(
+            model="llama3.1",
+            # Tighter generation settings to speed up RAG responses without hurting quality
+            temperature=0.0,     # Deterministic and concise
+            timeout=RAG_TIMEOUT, # Keep overall cap at 2 minutes
+            num_predict=100,     # Lower max tokens to reduce generation time
+            top_p=0.5,           # More focused sampling
+            repeat_penalty=1.1   # Prevent repetition
+        )
 
-question_answering_chain_brief = create_stuff_documents_chain(model, chat_prompt_brief)
-question_answering_chain_extended = create_stuff_documents_chain(model, chat_prompt_extended)
+
+@lru_cache(maxsize=2)
+def get_qa_chain(detail: str = "brief"):
+    """Stuff-documents QA chain for 'brief' or 'extended' answers"""
+    detail = "extended" if detail and detail.lower() == "extended" else "brief"
+    model = get_model()
+    with timed(f"qa_chain_{detail}"):
+        from langchain.prompts import ChatPromptTemplate
+        from langchain.chains.combine_documents import create_stuff_documents_chain
+        chat_prompt = ChatPromptTemplate.from_messages([
+            ("system", _SYSTEM_PROMPTS[detail]),
+            ("human", "{input}"),
+        ])
+        return create_stuff_documents_chain(model, chat_prompt)
+
+
+# Old module-level names, now created on first access
+_LAZY_ATTRIBUTES = {
+    "ollama_embeddings": get_embeddings,
+    "vectorstore": get_vectorstore,
+    "model": get_model,
+    "question_answering_chain_brief": lambda: get_qa_chain("brief"),
+    "question_answering_chain_extended": lambda: get_qa_chain("extended"),
+}
+
+
+def __getattr__(name):
+    if name in _LAZY_ATTRIBUTES:
+        return _LAZY_ATTRIBUTES[name]()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 # ==============================
 # Add a Reranker
 # ==============================
 
+# Brief answers: 0 keeps one search over role + General documents (k=2 in total);
+# N > 0 searches them as separate partitions with N General documents behind the role's.
+# Extended answers always search General documents as a partition of max(N, 1).
+GENERAL_K = int(os.getenv("RAG_GENERAL_K", "0"))
+
+
 # Cache for RAG chains to avoid recreation
 _CHAIN_CACHE = {}
+# Cache for the retriever / QA chain pairs the chains are built from
+_COMPONENT_CACHE = {}
 
 def wrap_with_reranker(retriever, cohere_api_key, top_n=4):
+    from langchain.retrievers import ContextualCompressionRetriever
+    from langchain_cohere import CohereRerank
+
+    class TimedCohereRerank(CohereRerank):
+        def compress_documents(self, *args, **kwargs):
+            with stage("rerank"):
+                return super().compress_documents(*args, **kwargs)
+
     #print("[INFO] Using Cohere reranker.")
-    reranker = CohereRerank(
+    reranker = TimedCohereRerank(
         cohere_api_key=cohere_api_key, 
         top_n=top_n,
         model="rerank-english-v3.0"  # Add required model parameter
@@ -185,75 +318,80 @@ def get_rag_chain(user_role: str, cohere_api_key: str = None, detail: str = "bri
     
     # Return cached chain if available
     if cache_key in _CHAIN_CACHE:
-        print(f"[RAG Cache] Using cached chain for {cache_key}")
+        logger.debug("Using cached chain for %s", cache_key)
         return _CHAIN_CACHE[cache_key]
     
-    print(f"[RAG Cache] Creating new chain for {cache_key}")
-    user_role = user_role.lower()
+    logger.info("Creating chain for %s", cache_key)
+    from langchain.chains import create_retrieval_chain
+
+    retriever, qa_chain = get_rag_components(user_role, cohere_api_key=cohere_api_key, detail=detail)
+    chain = create_retrieval_chain(retriever, qa_chain)
+    
+    # Cache the chain
+    _CHAIN_CACHE[cache_key] = chain
+    
+    return chain
+
 
+def retrieval_partitions(user_role: str, detail: str = "brief", role_k: int | None = None, general_k: int = GENERAL_K) -> list:
+    """(metadata filter, k) pairs searched for a role; role_k/general_k override the defaults (tuning)"""
+    user_role = user_role.lower()
     if user_role == "c-level":
         # C-level sees everything; use MMR for diverse, smaller context set
-        retriever = vectorstore.as_retriever(
-            search_type="mmr",
-            search_kwargs={
-                "k": 3,            # reduce retrieved docs
-                "lambda_mult": 0.8 # balance relevance/diversity
-            }
-        )
+        partitions = [(None, role_k or 3)]
 
     elif user_role == "general":
         # General role sees only general documents
-        retriever = vectorstore.as_retriever(
-            search_type="mmr",
-            search_kwargs={
-                "k": 2,
-                "lambda_mult": 0.8,
-                "filter": {"role": "general"}
-            }
-        )
+        partitions = [({"role": "general"}, role_k or 2)]
+
+    elif detail and str(detail).lower() == "extended":
+        # Extended answers: the role's own documents first, General documents behind them
+        # in the same pass (this replaced the second chain run against the General handbook),
+        # so at least one General chunk is always searched
+        partitions = [({"role": user_role}, role_k or 3), ({"role": "general"}, general_k or 1)]
+
+    elif general_k > 0:
+        # Role and General documents as separate partitions (one query embedding,
+        # concurrent searches), General documents filling in behind the role's
+        partitions = [({"role": user_role}, role_k or 2), ({"role": "general"}, general_k)]
 
     else:
-        # For extended/strict answers, restrict retrieval to the user's role only
-        if detail and str(detail).lower() == "extended":
-            retriever = vectorstore.as_retriever(
-                search_type="mmr",
-                search_kwargs={
-                    "k": 3,  # reduce retrieved docs further in extended to keep latency bounded
-                    "lambda_mult": 0.8,
-                    "filter": {"role": user_role}
-                }
-            )
-        else:
-            # All other roles see their docs + general for brief answers
-            retriever = vectorstore.as_retriever(
-                search_type="mmr",
-                search_kwargs={
-                    "k": 2,
-                    "lambda_mult": 0.8,
-                    "filter": {
-                        "role": {"$in": [user_role, "general"]}
-                    }
-                }
-            )
+        # All other roles see their docs + general for brief answers
+        partitions = [({"role": {"$in": [user_role, "general"]}}, role_k or 2)]
+    return partitions
+
+
+def get_rag_components(user_role: str, cohere_api_key: str = None, detail: str = "brief"):
+    """Return the (retriever, qa_chain) pair behind get_rag_chain.
+
+    Lets callers run retrieval on its own (e.g. prefetching while SQL is
+    generated) and feed the documents to the QA chain later.
+    """
+    cache_key = f"{user_role.lower()}_{detail}_{bool(cohere_api_key)}"
+    if cache_key in _COMPONENT_CACHE:
+        return _COMPONENT_CACHE[cache_key]
+
+    user_role = user_role.lower()
+    vectorstore = get_search_index()
+
+    from rag_utils.retrievers import PartitionedMMRRetriever
+
+    partitions = retrieval_partitions(user_role, detail)
+
+    # lambda_mult 0.8 balances relevance/diversity
+    retriever = PartitionedMMRRetriever(vectorstore=vectorstore, partitions=partitions, lambda_mult=0.8)
 
     # wrap with reranker
     # Only use reranker when explicitly requested (passed from caller)
     if cohere_api_key:
-        print("Using cohere reranker")
+        logger.debug("Using Cohere reranker")
         retriever = wrap_with_reranker(retriever, cohere_api_key, top_n=3)
 
     # Choose QA chain based on requested detail
-    if detail and detail.lower() == "extended":
-        qa_chain = question_answering_chain_extended
-    else:
-        qa_chain = question_answering_chain_brief
+    qa_chain = get_qa_chain(detail)
 
-    chain = create_retrieval_chain(retriever, qa_chain)
-    
-    # Cache the chain
-    _CHAIN_CACHE[cache_key] = chain
-    
-    return chain
+    _COMPONENT_CACHE[cache_key] = (retriever, qa_chain)
+    return retriever, qa_chain
     """
     from langchain_core.runnables import RunnableLambda, RunnableMap
 
@@ -0,0 +1,40 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any
+
+from langchain_core.retrievers import BaseRetriever
+
+from rag_utils.metrics import stage
+
+_PARTITION_POOL = ThreadPoolExecutor(max_workers=4, thread_name_prefix="rag-partition")
+
+
+class PartitionedMMRRetriever(BaseRetriever):
+    """MMR retrieval over several metadata partitions with one query embedding.
+
+    partitions is a list of (filter, k); a None filter searches everything. Partitions are searched concurrently
+    and concatenated in order with duplicates removed, so the role's own
+    documents come first and General documents fill in behind them.
+    """
+
+    vectorstore: Any
+    partitions: list
+    lambda_mult: float = 0.8
+    fetch_k: int = 20
+
+    def _get_relevant_documents(self, query: str, *, run_manager=None) -> list:
+        embedding = self.vectorstore.embeddings.embed_query(query)
+
+        def search(partition):
+            search_filter, k = partition
+            return self.vectorstore.max_marginal_relevance_search_by_vector(
+                embedding, k=k, fetch_k=self.fetch_k, lambda_mult=self.lambda_mult, filter=search_filter
+            )
+
+        docs, seen = [], set()
+        with stage("vector_search"):
+            for partition_docs in _PARTITION_POOL.map(search, self.partitions):
+                for doc in partition_docs:
+                    if doc.page_content not in seen:
+                        seen.add(doc.page_content)
+                        docs.append(doc)
+        return docs
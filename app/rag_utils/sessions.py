@@ -0,0 +1,156 @@
+import os
+import re
+import time
+import uuid
+import threading
+from collections import OrderedDict
+
+from rag_utils.metrics import cache_event
+
+# Sessions idle longer than this are dropped; the least recently used go first when full
+SESSION_TTL = int(os.getenv("SESSION_TTL", "3600"))
+MAX_SESSIONS = int(os.getenv("SESSION_MAX", "1000"))
+# Messages kept verbatim; older ones are folded into the running summary
+RECENT_MESSAGES = int(os.getenv("SESSION_RECENT_MESSAGES", "6"))
+SUMMARY_MAX_CHARS = int(os.getenv("SESSION_SUMMARY_CHARS", "800"))
+# Assistant outputs longer than this that look like tables are stored once and referenced
+LARGE_OUTPUT_CHARS = int(os.getenv("SESSION_LARGE_OUTPUT_CHARS", "300"))
+# Stored outputs per session; the least recently used are dropped past either limit
+MAX_ARTIFACTS = int(os.getenv("SESSION_MAX_ARTIFACTS", "20"))
+MAX_ARTIFACT_BYTES = int(os.getenv("SESSION_ARTIFACT_BYTES", str(2 * 1024 * 1024)))
+
+_SENTENCE_RE = re.compile(r"(?<=[.!?])\s")
+
+
+class Session:
+    def __init__(self, username: str):
+        self.id = uuid.uuid4().hex
+        self.username = username
+        self.summary = ""
+        self.messages: list[dict] = []  # recent messages, oldest first
+        self.artifacts: OrderedDict[str, str] = OrderedDict()  # reference id -> full tool output, LRU order
+        self.artifact_bytes = 0
+        self.turns = 0
+        self.last_used = time.time()
+        self._artifact_count = 0  # references are never reused, even after eviction
+        # Concurrent requests of one session must not interleave messages or reuse a reference
+        self._lock = threading.Lock()
+
+    def add(self, role: str, content: str, **meta):
+        content = content or ""
+        with self._lock:
+            if role == "assistant" and _is_large_output(content):
+                content = self._store_artifact(content, meta.get("sql"))
+            self.messages.append({"role": role, "content": content})
+            if role == "user":
+                self.turns += 1
+            while len(self.messages) > RECENT_MESSAGES:
+                self._fold(self.messages.pop(0))
+
+    def get_artifact(self, ref: str) -> str | None:
+        with self._lock:
+            content = self.artifacts.get(ref)
+            if content is not None:
+                self.artifacts.move_to_end(ref)
+            return content
+
+    def _store_artifact(self, content: str, sql: str | None) -> str:
+        self._artifact_count += 1
+        ref = f"res-{self._artifact_count}"
+        self.artifacts[ref] = content
+        self.artifact_bytes += len(content.encode("utf-8"))
+        # The newest output is always kept, even if it alone exceeds the budget
+        while len(self.artifacts) > 1 and (len(self.artifacts) > MAX_ARTIFACTS or self.artifact_bytes > MAX_ARTIFACT_BYTES):
+            _, dropped = self.artifacts.popitem(last=False)
+            self.artifact_bytes -= len(dropped.encode("utf-8"))
+            cache_event("session_artifact", "eviction")
+        rows = [line for line in content.splitlines() if line.strip().startswith("|")]
+        header = [c.strip() for c in rows[0].strip("|").split("|")] if rows else []
+        summary = f"[Result {ref}: {max(len(rows) - 2, 0)} rows"
+        if header:
+            summary += f", columns {', '.join(header)}"
+        if sql:
+            summary += f"; SQL: {sql}"
+        return summary + "]"
+
+    def _fold(self, message: dict):
+        """Incremental extractive summary: the question, or the first sentence of an answer"""
+        content = " ".join(message["content"].split())
+        if message["role"] == "user":
+            line = f"User asked: {content[:150]}"
+        else:
+            line = f"Assistant: {_SENTENCE_RE.split(content, 1)[0][:150]}"
+        summary = f"{self.summary}\n{line}".strip()
+        # Oldest lines go first once the summary is full
+        while len(summary) > SUMMARY_MAX_CHARS and "\n" in summary:
+            summary = summary.split("\n", 1)[1]
+        self.summary = summary
+
+    def history(self) -> list[dict]:
+        """Bounded history for the pipelines: summary (if any) + recent messages"""
+        with self._lock:
+            history = [{"role": "system", "content": f"Earlier in this conversation:\n{self.summary}"}] if self.summary else []
+            return history + [dict(m) for m in self.messages]
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            return {
+                "session_id": self.id,
+                "turns": self.turns,
+                "summary": self.summary,
+                "messages": [dict(m) for m in self.messages],
+                "artifacts": sorted(self.artifacts),
+            }
+
+
+def _is_large_output(content: str) -> bool:
+    return len(content) > LARGE_OUTPUT_CHARS and content.count("\n|") >= 2
+
+
+class SessionStore:
+    """In-memory LRU of conversation sessions keyed by id, scoped to their owner"""
+
+    def __init__(self, max_sessions: int = MAX_SESSIONS, ttl: int = SESSION_TTL):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self._sessions: OrderedDict[str, Session] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _evict(self):
+        now = time.time()
+        for session_id in [sid for sid, s in self._sessions.items() if now - s.last_used > self.ttl]:
+            del self._sessions[session_id]
+            cache_event("session", "eviction")
+        while len(self._sessions) > self.max_sessions:
+            self._sessions.popitem(last=False)
+            cache_event("session", "eviction")
+
+    def get(self, session_id: str | None, username: str) -> Session | None:
+        with self._lock:
+            session = self._sessions.get(session_id) if session_id else None
+            if session is None or session.username != username or time.time() - session.last_used > self.ttl:
+                return None
+            session.last_used = time.time()
+            self._sessions.move_to_end(session_id)
+            return session
+
+    def get_or_create(self, session_id: str | None, username: str) -> Session:
+        session = self.get(session_id, username)
+        if session is not None:
+            return session
+        session = Session(username)
+        with self._lock:
+            self._sessions[session.id] = session
+            self._evict()
+        return session
+
+    def delete(self, session_id: str, username: str) -> bool:
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None or session.username != username:
+                return False
+            del self._sessions[session_id]
+            return True
+
+
+SESSIONS = SessionStore()
@@ -0,0 +1,102 @@
+import asyncio
+import threading
+
+from rag_utils.llm_scheduler import LLMCallCancelled, cancel_requested
+
+
+class _Call:
+    __slots__ = ("event", "result", "error")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Coalesce concurrent calls with the same key into one computation.
+
+    The first caller for a key runs the function; callers arriving while it is
+    in flight wait for and share its result (or exception). Nothing is cached
+    after completion - that is the job of the answer caches in front of this.
+    If the computation was cancelled because the caller that started it
+    abandoned its work, callers that still want the result run it again.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._calls: dict = {}
+        self._tasks: dict = {}
+        self._lock = threading.Lock()
+        self.coalesced = 0  # number of calls that reused an in-flight computation
+
+    def do(self, key, fn, *args, **kwargs):
+        """Thread-based variant for synchronous functions"""
+        while True:
+            try:
+                return self._do(key, fn, *args, **kwargs)
+            except LLMCallCancelled:
+                if cancel_requested():
+                    raise
+
+    def _do(self, key, fn, *args, **kwargs):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn(*args, **kwargs)
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.event.set()
+
+    async def do_async(self, key, coro_fn, *args, **kwargs):
+        """asyncio variant: the shared work runs as its own task.
+
+        Waiters await it through asyncio.shield, so cancelling one waiter never
+        cancels the computation the other waiters depend on.
+        """
+        while True:
+            try:
+                return await self._do_async(key, coro_fn, *args, **kwargs)
+            except LLMCallCancelled:
+                if cancel_requested():
+                    raise
+
+    async def _do_async(self, key, coro_fn, *args, **kwargs):
+        with self._lock:
+            task = self._tasks.get(key)
+            if task is None or task.done():
+                task = asyncio.ensure_future(coro_fn(*args, **kwargs))
+                self._tasks[key] = task
+
+                def _forget(finished, key=key):
+                    with self._lock:
+                        if self._tasks.get(key) is finished:
+                            del self._tasks[key]
+                    if not finished.cancelled():
+                        finished.exception()  # retrieved even if every waiter went away
+
+                task.add_done_callback(_forget)
+            else:
+                self.coalesced += 1
+        return await asyncio.shield(task)
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._calls) + sum(1 for t in self._tasks.values() if not t.done())
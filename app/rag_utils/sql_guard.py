@@ -0,0 +1,105 @@
+import os
+import json
+import threading
+
+import duckdb
+
+from rag_utils.logging_setup import get_logger
+
+logger = get_logger(__name__)
+
+# Budgets for LLM-generated SQL (override via environment)
+SQL_TIMEOUT_SECONDS = float(os.getenv("SQL_TIMEOUT_SECONDS", "10"))
+SQL_MEMORY_LIMIT = os.getenv("SQL_MEMORY_LIMIT", "512MB")
+SQL_THREADS = int(os.getenv("SQL_THREADS", "2"))
+SQL_MAX_PLAN_COST = int(os.getenv("SQL_MAX_PLAN_COST", "10000000"))  # estimated rows processed
+SQL_MAX_RESULT_ROWS = int(os.getenv("SQL_MAX_RESULT_ROWS", "500"))
+
+
+class QueryRejected(Exception):
+    """Raised when a query is over budget or gets interrupted"""
+
+
+def _node_cardinality(node: dict) -> int:
+    """Estimated output rows of a plan node"""
+    child_cards = [_node_cardinality(child) for child in node.get("children", [])]
+    estimate = node.get("extra_info", {}).get("Estimated Cardinality")
+    if estimate not in (None, ""):
+        try:
+            return int(estimate)
+        except (TypeError, ValueError):
+            pass
+    if node.get("name") in ("CROSS_PRODUCT", "NESTED_LOOP_JOIN", "BLOCKWISE_NL_JOIN", "PIECEWISE_MERGE_JOIN"):
+        # No estimate for cartesian-style joins: assume the worst case
+        product = 1
+        for card in child_cards:
+            product *= max(card, 1)
+        return product
+    return max(child_cards, default=0)
+
+
+def _walk(node: dict):
+    yield node
+    for child in node.get("children", []):
+        yield from _walk(child)
+
+
+def estimate_plan(duck_conn, sql: str) -> dict:
+    """Inspect the physical plan with EXPLAIN and estimate its cost.
+
+    cost is the sum of estimated rows produced by every operator, rows is the
+    estimated result size, has_limit tells whether the plan already caps its output.
+    """
+    row = duck_conn.execute(f"EXPLAIN (FORMAT JSON) {sql}").fetchone()
+    roots = json.loads(row[1])
+    nodes = [node for root in roots for node in _walk(root)]
+    return {
+        "cost": sum(_node_cardinality(node) for node in nodes),
+        "rows": sum(_node_cardinality(root) for root in roots),
+        "has_limit": any("LIMIT" in node.get("name", "") for node in nodes),
+        "cross_products": sum(1 for node in nodes if node.get("name") == "CROSS_PRODUCT"),
+    }
+
+
+def run_guarded_query(duck_conn, sql: str, timeout: float | None = None, max_rows: int | None = None):
+    """Execute a SELECT with plan-based cost checks, a row cap, memory/thread limits and a deadline.
+
+    Returns (rows, columns, truncated). Raises QueryRejected when the query is
+    over the cost budget, runs past the deadline, or exceeds the memory limit.
+    """
+    timeout = SQL_TIMEOUT_SECONDS if timeout is None else timeout
+    max_rows = SQL_MAX_RESULT_ROWS if max_rows is None else max_rows
+    sql = sql.strip().rstrip(";").strip()
+
+    # Note: DuckDB applies these per database instance, so they also cap concurrent queries
+    duck_conn.execute(f"SET memory_limit = '{SQL_MEMORY_LIMIT}'")
+    duck_conn.execute(f"SET threads = {SQL_THREADS}")
+
+    plan = estimate_plan(duck_conn, sql)
+    logger.debug("Plan estimate: cost=%s rows=%s limit=%s cross_products=%s",
+                 plan["cost"], plan["rows"], plan["has_limit"], plan["cross_products"])
+    if plan["cost"] > SQL_MAX_PLAN_COST:
+        raise QueryRejected(
+            f"Query too expensive (estimated {plan['cost']:,} rows processed, budget {SQL_MAX_PLAN_COST:,})"
+        )
+
+    # Rewrite: cap large results with a LIMIT one above the budget so truncation can be detected
+    if not plan["has_limit"] and plan["rows"] > max_rows:
+        sql = f"SELECT * FROM ({sql}) AS guarded_query LIMIT {max_rows + 1}"
+        logger.info("Injected LIMIT %d", max_rows + 1)
+
+    timer = threading.Timer(timeout, duck_conn.interrupt)
+    timer.start()
+    try:
+        cursor = duck_conn.execute(sql)
+        columns = [desc[0] for desc in cursor.description]
+        rows = cursor.fetchmany(max_rows + 1)
+    except duckdb.InterruptException:
+        raise QueryRejected(f"Query exceeded the {timeout:g}s time limit")
+    except duckdb.OutOfMemoryException:
+        raise QueryRejected(f"Query exceeded the {SQL_MEMORY_LIMIT} memory limit")
+    finally:
+        timer.cancel()
+
+    truncated = len(rows) > max_rows
+    return rows[:max_rows], columns, truncated
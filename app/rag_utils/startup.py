@@ -0,0 +1,39 @@
+import time
+import threading
+from contextlib import contextmanager
+
+from rag_utils.logging_setup import get_logger
+
+logger = get_logger(__name__)
+
+# Seconds spent creating each component, in the order they were first created
+_TIMINGS: dict[str, float] = {}
+_LOCK = threading.Lock()
+_PROCESS_START = time.time()
+
+
+@contextmanager
+def timed(component: str):
+    """Record how long creating a component took (first creation only)"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        with _LOCK:
+            _TIMINGS.setdefault(component, round(elapsed, 4))
+
+
+def record(component: str, seconds: float):
+    with _LOCK:
+        _TIMINGS.setdefault(component, round(seconds, 4))
+
+
+def startup_report() -> dict:
+    with _LOCK:
+        return {"components": dict(_TIMINGS), "uptime_seconds": round(time.time() - _PROCESS_START, 1)}
+
+
+def log_startup_report():
+    timings = {name: round(seconds * 1000, 1) for name, seconds in startup_report()["components"].items()}
+    logger.info("Component timings (ms): %s", timings, extra={"timings_ms": timings})
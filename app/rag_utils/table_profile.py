@@ -0,0 +1,334 @@
+import os
+import re
+import time
+import threading
+import tabulate
+
+from rag_utils.logging_setup import get_logger
+
+logger = get_logger(__name__)
+
+# Materialized summary tables written next to the raw CSV tables in DuckDB
+PROFILE_TABLE = "table_profiles"
+VALUE_COUNTS_TABLE = "table_value_counts"
+
+# Columns with at most this many distinct values get their value frequencies stored
+LOW_CARDINALITY_MAX = 50
+# Columns with at most this many distinct values get their values listed in SQL prompts
+PROMPT_VALUES_MAX = 15
+
+NUMERIC_TYPES = {
+    "TINYINT", "SMALLINT", "INTEGER", "BIGINT", "HUGEINT",
+    "UTINYINT", "USMALLINT", "UINTEGER", "UBIGINT",
+    "FLOAT", "REAL", "DOUBLE",
+}
+
+# In-memory copy of the stored profiles so answers never touch DuckDB
+_PROFILE_CACHE: dict[str, dict] = {}
+# Tables that could not be profiled (missing, markdown-backed roles) -> retry time
+_PROFILE_FAILURES: dict[str, float] = {}
+PROFILE_FAILURE_TTL = float(os.getenv("PROFILE_FAILURE_TTL", "300"))
+_PROFILE_LOCK = threading.Lock()
+
+
+def _quote(identifier: str) -> str:
+    return '"' + identifier.replace('"', '""') + '"'
+
+
+def _is_numeric(column_type: str) -> bool:
+    return column_type.upper() in NUMERIC_TYPES or column_type.upper().startswith("DECIMAL")
+
+
+def ensure_profile_tables(duck_conn):
+    """Create the summary tables if they do not exist yet"""
+    duck_conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS {PROFILE_TABLE} (
+            table_name TEXT,
+            column_name TEXT,
+            column_type TEXT,
+            row_count BIGINT,
+            distinct_count BIGINT,
+            null_count BIGINT,
+            min_value TEXT,
+            max_value TEXT,
+            mean_value DOUBLE,
+            profiled_at TIMESTAMP DEFAULT current_timestamp
+        )
+    """)
+    duck_conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS {VALUE_COUNTS_TABLE} (
+            table_name TEXT,
+            column_name TEXT,
+            value TEXT,
+            frequency BIGINT
+        )
+    """)
+
+
+def build_table_profile(duck_conn, table_name: str) -> dict:
+    """Profile a DuckDB table and store the result in the summary tables.
+
+    All column statistics are computed in a single scan; value frequencies
+    are computed only for low-cardinality columns (e.g. department, location).
+    """
+    ensure_profile_tables(duck_conn)
+    columns = [(row[0], row[1]) for row in duck_conn.execute(f"DESCRIBE {_quote(table_name)}").fetchall()]
+
+    select_parts = ["COUNT(*)"]
+    for name, col_type in columns:
+        col = _quote(name)
+        select_parts.append(f"COUNT(DISTINCT {col})")
+        select_parts.append(f"COUNT(*) - COUNT({col})")
+        select_parts.append(f"CAST(MIN({col}) AS VARCHAR)")
+        select_parts.append(f"CAST(MAX({col}) AS VARCHAR)")
+        select_parts.append(f"AVG({col})" if _is_numeric(col_type) else "NULL")
+    stats = duck_conn.execute(f"SELECT {', '.join(select_parts)} FROM {_quote(table_name)}").fetchone()
+
+    row_count = stats[0]
+    profile = {"table_name": table_name, "row_count": row_count, "columns": {}}
+    for i, (name, col_type) in enumerate(columns):
+        distinct_count, null_count, min_value, max_value, mean_value = stats[1 + i * 5: 6 + i * 5]
+        profile["columns"][name] = {
+            "type": col_type,
+            "distinct_count": distinct_count,
+            "null_count": null_count,
+            "min": min_value,
+            "max": max_value,
+            "mean": mean_value,
+            "values": None,
+        }
+
+    for name, info in profile["columns"].items():
+        # Skip unique-ish columns (ids, emails) - their frequencies carry no information
+        if info["distinct_count"] <= LOW_CARDINALITY_MAX and info["distinct_count"] < row_count:
+            col = _quote(name)
+            rows = duck_conn.execute(
+                f"SELECT CAST({col} AS VARCHAR) AS value, COUNT(*) AS frequency "
+                f"FROM {_quote(table_name)} GROUP BY 1 ORDER BY 2 DESC, 1"
+            ).fetchall()
+            info["values"] = [(value, frequency) for value, frequency in rows]
+
+    # Replace any previous profile for this table
+    duck_conn.execute(f"DELETE FROM {PROFILE_TABLE} WHERE table_name = ?", (table_name,))
+    duck_conn.execute(f"DELETE FROM {VALUE_COUNTS_TABLE} WHERE table_name = ?", (table_name,))
+    duck_conn.executemany(
+        f"INSERT INTO {PROFILE_TABLE} (table_name, column_name, column_type, row_count, distinct_count, "
+        f"null_count, min_value, max_value, mean_value) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        [
+            (table_name, name, info["type"], row_count, info["distinct_count"], info["null_count"],
+             info["min"], info["max"], info["mean"])
+            for name, info in profile["columns"].items()
+        ],
+    )
+    value_rows = [
+        (table_name, name, value, frequency)
+        for name, info in profile["columns"].items() if info["values"]
+        for value, frequency in info["values"]
+    ]
+    if value_rows:
+        duck_conn.executemany(
+            f"INSERT INTO {VALUE_COUNTS_TABLE} (table_name, column_name, value, frequency) VALUES (?, ?, ?, ?)",
+            value_rows,
+        )
+
+    with _PROFILE_LOCK:
+        _PROFILE_CACHE[table_name.lower()] = profile
+        _PROFILE_FAILURES.pop(table_name.lower(), None)
+    logger.info("Profiled %s: %d rows, %d columns", table_name, row_count, len(columns))
+    return profile
+
+
+def load_table_profile(duck_conn, table_name: str) -> dict | None:
+    """Read a stored profile back from the summary tables"""
+    ensure_profile_tables(duck_conn)
+    rows = duck_conn.execute(
+        f"SELECT column_name, column_type, row_count, distinct_count, null_count, min_value, max_value, mean_value "
+        f"FROM {PROFILE_TABLE} WHERE table_name = ? ORDER BY rowid",
+        (table_name,),
+    ).fetchall()
+    if not rows:
+        return None
+
+    profile = {"table_name": table_name, "row_count": rows[0][2], "columns": {}}
+    for name, col_type, _, distinct_count, null_count, min_value, max_value, mean_value in rows:
+        profile["columns"][name] = {
+            "type": col_type,
+            "distinct_count": distinct_count,
+            "null_count": null_count,
+            "min": min_value,
+            "max": max_value,
+            "mean": mean_value,
+            "values": None,
+        }
+    for name, value, frequency in duck_conn.execute(
+        f"SELECT column_name, value, frequency FROM {VALUE_COUNTS_TABLE} "
+        f"WHERE table_name = ? ORDER BY column_name, frequency DESC, value",
+        (table_name,),
+    ).fetchall():
+        info = profile["columns"].get(name)
+        if info is not None:
+            info["values"] = (info["values"] or []) + [(value, frequency)]
+    return profile
+
+
+def get_table_profile(table_name: str, duck_conn_factory) -> dict | None:
+    """Get a table profile from memory, the summary tables, or by profiling the table.
+
+    Tables ingested before profiling existed are profiled on first use. Failures
+    are remembered for PROFILE_FAILURE_TTL seconds instead of being retried on
+    every question.
+    """
+    key = table_name.lower()
+    with _PROFILE_LOCK:
+        if key in _PROFILE_CACHE:
+            return _PROFILE_CACHE[key]
+        if _PROFILE_FAILURES.get(key, 0) > time.time():
+            return None
+
+    try:
+        with duck_conn_factory() as duck_conn:
+            profile = load_table_profile(duck_conn, table_name)
+            if profile is None:
+                profile = build_table_profile(duck_conn, table_name)
+    except Exception as e:
+        logger.warning("Could not load profile for %s: %s", table_name, e)
+        with _PROFILE_LOCK:
+            _PROFILE_FAILURES[key] = time.time() + PROFILE_FAILURE_TTL
+        return None
+
+    with _PROFILE_LOCK:
+        _PROFILE_CACHE[key] = profile
+    return profile
+
+
+def invalidate_profile_cache(table_name: str | None = None):
+    """Drop cached profiles after a table is (re)uploaded"""
+    with _PROFILE_LOCK:
+        if table_name is None:
+            _PROFILE_CACHE.clear()
+            _PROFILE_FAILURES.clear()
+        else:
+            _PROFILE_CACHE.pop(table_name.lower(), None)
+            _PROFILE_FAILURES.pop(table_name.lower(), None)
+
+
+def profiles_cached(table_names: list[str]) -> bool:
+    """Whether every table's profile (or its recent failure) is already in memory"""
+    now = time.time()
+    with _PROFILE_LOCK:
+        return all(t.lower() in _PROFILE_CACHE or _PROFILE_FAILURES.get(t.lower(), 0) > now for t in table_names)
+
+
+def describe_table_for_prompt(profile: dict) -> str:
+    """Compact schema line for SQL prompts: column types plus values of small categorical columns"""
+    cols = []
+    values = []
+    for name, info in profile["columns"].items():
+        cols.append(f"{name} ({info['type']})")
+        is_id = name.lower().endswith("_id")
+        if info["values"] and not is_id and not _is_numeric(info["type"]) and info["distinct_count"] <= PROMPT_VALUES_MAX:
+            listed = ", ".join(str(v) for v, _ in info["values"] if v is not None)
+            values.append(f"{name}: {listed}")
+    text = f"Table: {profile['table_name']}\nColumns: {', '.join(cols)}"
+    if values:
+        text += "\nValues: " + "; ".join(values)
+    return text
+
+
+# ==============================
+# === ANSWERS FROM PROFILES ===
+# ==============================
+# Only unfiltered whole-table questions can be answered from the summaries
+_FILTER_MARKERS = re.compile(
+    r"\b(where|with|whose|who|hired|joined|between|above|below|greater|less|more than|fewer|"
+    r"equal|except|only|not|top|bottom|and|or)\b|[<>=]|\d"
+)
+_ROW_COUNT_RE = re.compile(
+    r"^(?:how many|count(?: of)?(?: all)?(?: the)?|(?:what is the )?total number of|number of)\s+"
+    r"(?:employees|rows|records|entries|people|staff)"
+    r"(?:\s+(?:are there|do we have|in total|total|in the table))?$"
+)
+_GROUP_COUNT_RE = re.compile(
+    r"^(?:how many|count(?: of)?|(?:show |list )?(?:the )?(?:total )?(?:number of|count of)?|show(?: me)?(?: the)?(?: total)?|total)\s*"
+    r"(?:employees|rows|records|people|staff)?\s*(?:are there\s+)?"
+    r"(?:by|per|in each|for each|across|grouped by)\s+(?P<column>[a-z_ ]+?)"
+    r"(?:,?\s*(?:sorted|ordered) by (?:highest|largest|the highest) count(?: first)?)?$"
+)
+_STAT_RE = re.compile(
+    r"^(?:what is |what's |show |show me |give me )?(?:the )?"
+    r"(?P<stat>average|avg|mean|minimum|min|lowest|maximum|max|highest)\s+(?P<column>[a-z_ ]+?)"
+    r"(?:\s+(?:of|across|for) (?:all )?(?:employees|rows|records|people|staff|the company))?$"
+)
+_STATS = {
+    "average": "mean", "avg": "mean", "mean": "mean",
+    "minimum": "min", "min": "min", "lowest": "min",
+    "maximum": "max", "max": "max", "highest": "max",
+}
+_SQL_FUNCS = {"mean": "AVG", "min": "MIN", "max": "MAX"}
+
+
+def _normalize_question(question: str) -> str:
+    return " ".join(question.lower().strip().rstrip("?.!").split())
+
+
+def _match_column(profile: dict, phrase: str) -> str | None:
+    """Map a phrase like 'performance rating' or 'departments' onto a column name"""
+    phrase = phrase.strip().replace(" ", "_")
+    candidates = {phrase, phrase.rstrip("s"), phrase[:-3] + "y" if phrase.endswith("ies") else phrase}
+    for name in profile["columns"]:
+        if name.lower() in candidates:
+            return name
+    return None
+
+
+def answer_from_profile(question: str, allowed_tables: list[str], duck_conn_factory) -> dict | None:
+    """Answer simple whole-table aggregate questions from the precomputed profiles.
+
+    Returns a response dict like ask_csv (answer + equivalent sql), or None when
+    the question needs the full SQL path.
+    """
+    q = _normalize_question(question)
+    row_match = _ROW_COUNT_RE.match(q)
+    group_match = None if row_match else _GROUP_COUNT_RE.match(q)
+    stat_match = None if (row_match or group_match) else _STAT_RE.match(q)
+    if not (row_match or group_match or stat_match):
+        return None
+    # Filters are only allowed inside the grouping phrase, never elsewhere in the question
+    if not group_match and _FILTER_MARKERS.search(q):
+        return None
+
+    profiles = [p for p in (get_table_profile(t, duck_conn_factory) for t in allowed_tables) if p]
+    if not profiles:
+        return None
+
+    if row_match:
+        # Without a column to disambiguate, only a single accessible table is unambiguous
+        if len(profiles) != 1:
+            return None
+        profile = profiles[0]
+        sql = f"SELECT COUNT(*) AS count FROM {profile['table_name']}"
+        return {"answer": tabulate.tabulate([[profile["row_count"]]], headers=["count"], tablefmt="github"), "sql": sql}
+
+    match = group_match or stat_match
+    hits = [(p, _match_column(p, match.group("column"))) for p in profiles]
+    hits = [(p, col) for p, col in hits if col]
+    if len(hits) != 1:
+        return None
+    profile, column = hits[0]
+    info = profile["columns"][column]
+    table = profile["table_name"]
+
+    if group_match:
+        if not info["values"]:
+            return None
+        sql = f"SELECT {column}, COUNT(*) AS count FROM {table} GROUP BY {column} ORDER BY count DESC"
+        return {"answer": tabulate.tabulate(info["values"], headers=[column, "count"], tablefmt="github"), "sql": sql}
+
+    stat = _STATS[stat_match.group("stat")]
+    if not _is_numeric(info["type"]) or info[stat] is None:
+        return None
+    func = _SQL_FUNCS[stat]
+    label = f"{func.lower()}_{column}"
+    sql = f"SELECT {func}({column}) AS {label} FROM {table}"
+    value = info[stat] if stat == "mean" else float(info[stat])
+    return {"answer": tabulate.tabulate([[value]], headers=[label], tablefmt="github"), "sql": sql}
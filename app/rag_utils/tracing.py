@@ -0,0 +1,134 @@
+import os
+import time
+import uuid
+import threading
+import contextvars
+from contextlib import contextmanager
+
+from rag_utils.paths import DUCKDB_DIR
+from rag_utils.jsonl_log import append_jsonl
+
+# Traces of requests slower than this are exported; TRACE_ALL=1 exports every request
+TRACE_SLOW_MS = float(os.getenv("TRACE_SLOW_MS", "5000"))
+TRACE_ALL = os.getenv("TRACE_ALL", "0") == "1"
+TRACE_FILE = os.getenv("TRACE_FILE", os.path.join(DUCKDB_DIR, "traces.jsonl"))
+# Past this size the trace file is rotated to <file>.1 (one old file is kept)
+TRACE_MAX_BYTES = int(os.getenv("TRACE_MAX_BYTES", str(10 * 1024 * 1024)))
+
+_trace_var = contextvars.ContextVar("trace", default=None)
+_parent_var = contextvars.ContextVar("trace_parent", default=None)
+
+
+class Trace:
+    """Spans of one request. Shared by the tasks and worker threads serving it."""
+
+    def __init__(self, name: str, request_id: str | None = None):
+        self.request_id = request_id or uuid.uuid4().hex[:16]
+        self.name = name
+        self.started = time.perf_counter()
+        self.started_at = time.time()
+        self.spans: list[dict] = []
+        self.attributes: dict = {}
+        self.duration_ms = None
+        self._lock = threading.Lock()
+        self._next_id = 0
+
+    def _new_id(self) -> int:
+        with self._lock:
+            self._next_id += 1
+            return self._next_id
+
+    def add(self, span: dict):
+        with self._lock:
+            self.spans.append(span)
+
+    def finish(self):
+        self.duration_ms = round((time.perf_counter() - self.started) * 1000, 2)
+
+    def breakdown(self) -> dict:
+        """Total milliseconds per span name (a name can occur several times, e.g. embedding)"""
+        totals: dict[str, float] = {}
+        with self._lock:
+            for s in self.spans:
+                totals[s["name"]] = totals.get(s["name"], 0.0) + s["duration_ms"]
+        return {name: round(ms, 2) for name, ms in totals.items()}
+
+    def server_timing(self) -> str:
+        """Value for the Server-Timing response header"""
+        parts = [f"{name};dur={ms}" for name, ms in self.breakdown().items()]
+        if self.duration_ms is not None:
+            parts.append(f"total;dur={self.duration_ms}")
+        return ", ".join(parts)
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            spans = sorted(self.spans, key=lambda s: s["start_ms"])
+        return {
+            "request_id": self.request_id,
+            "name": self.name,
+            "started_at": self.started_at,
+            "duration_ms": self.duration_ms,
+            "attributes": self.attributes,
+            "spans": spans,
+        }
+
+
+def start_trace(name: str, request_id: str | None = None) -> Trace:
+    trace = Trace(name, request_id)
+    _trace_var.set(trace)
+    _parent_var.set(None)
+    return trace
+
+
+def current_trace() -> Trace | None:
+    return _trace_var.get()
+
+
+def set_attribute(key: str, value):
+    trace = _trace_var.get()
+    if trace is not None:
+        trace.attributes[key] = value
+
+
+@contextmanager
+def span(name: str, **attributes):
+    """Record a timed span in the current request's trace (no-op outside a request)"""
+    trace = _trace_var.get()
+    if trace is None:
+        yield
+        return
+    span_id = trace._new_id()
+    token = _parent_var.set(span_id)
+    started = time.perf_counter()
+    error = None
+    try:
+        yield
+    except BaseException as e:
+        error = type(e).__name__
+        raise
+    finally:
+        _parent_var.reset(token)
+        record = {
+            "id": span_id,
+            "parent": _parent_var.get(),
+            "name": name,
+            "start_ms": round((started - trace.started) * 1000, 2),
+            "duration_ms": round((time.perf_counter() - started) * 1000, 2),
+        }
+        if attributes:
+            record["attributes"] = attributes
+        if error:
+            record["error"] = error
+        trace.add(record)
+
+
+# ---------- export ----------
+def export_trace(trace: Trace):
+    """Queue a finished trace for the JSONL file if it is slow, failed (or TRACE_ALL); never blocks"""
+    if not TRACE_FILE or trace.duration_ms is None:
+        return
+    slow = trace.duration_ms >= TRACE_SLOW_MS
+    if not (slow or "error" in trace.attributes or TRACE_ALL):
+        return
+    # Written by the background JSONL writer; dropped if its queue is full
+    append_jsonl(TRACE_FILE, {**trace.to_dict(), "slow": slow}, TRACE_MAX_BYTES)
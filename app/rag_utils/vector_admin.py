@@ -0,0 +1,340 @@
+"""Vector store maintenance: chunk counts, document removal and index compaction.
+
+Chunk counts per (role, source) live in a small SQLite table next to `documents`.
+They are updated whenever chunks are added or deleted, so stats never read the
+collection. Compaction deletes chunks whose document row is gone (or no longer
+matches their role/source) and exact duplicates. It then rebuilds the HNSW index
+by copying the live chunks into a fresh collection, which also drops the deleted
+entries that Chroma only marks in the index.
+
+    python -m rag_utils.vector_admin stats
+    python -m rag_utils.vector_admin compact
+"""
+import os
+import uuid
+import shutil
+import sqlite3
+import threading
+from collections import Counter
+from contextlib import closing
+from pathlib import Path
+
+import duckdb
+
+from rag_utils.rag_module import (
+    COLLECTION_NAME, VECTORSTORE_WRITE_LOCK, get_vectorstore, reset_vectorstore, refresh_search_index,
+)
+from rag_utils.paths import CHROMA_DIR, DUCKDB_FILE, ROLES_DB_PATH, UPLOAD_DIR, resolve
+from rag_utils.table_profile import PROFILE_TABLE, VALUE_COUNTS_TABLE, invalidate_profile_cache
+from rag_utils.logging_setup import get_logger
+
+logger = get_logger(__name__)
+
+COUNTS_TABLE = "vector_chunk_counts"
+# Chunks read or copied per Chroma call during backfill and compaction
+SCAN_BATCH = int(os.getenv("VECTOR_SCAN_BATCH", "500"))
+_COMPACT_COLLECTION = f"{COLLECTION_NAME}_compact"
+_COUNTS_LOCK = threading.Lock()
+
+
+def _scan(collection, include):
+    """Every chunk of the collection, SCAN_BATCH at a time"""
+    offset = 0
+    while True:
+        batch = collection.get(include=include, limit=SCAN_BATCH, offset=offset)
+        if not batch["ids"]:
+            return
+        yield batch
+        offset += len(batch["ids"])
+
+
+def _key(metadata: dict) -> tuple[str, str]:
+    return (metadata or {}).get("role") or "", (metadata or {}).get("source") or ""
+
+
+def _write_counts(conn, counts: Counter, sign: int = 1):
+    conn.executemany(
+        f"INSERT INTO {COUNTS_TABLE} (role, source, chunks) VALUES (?, ?, ?) "
+        "ON CONFLICT (role, source) DO UPDATE SET chunks = chunks + excluded.chunks",
+        [(role, source, sign * n) for (role, source), n in counts.items()],
+    )
+    conn.execute(f"DELETE FROM {COUNTS_TABLE} WHERE chunks <= 0")
+
+
+def _counts_connection() -> tuple[sqlite3.Connection, bool]:
+    """Connection with the counts table; backfilled from the collection on first use.
+
+    The flag tells the caller the counts were just rebuilt (and so already include
+    the change it is about to record).
+    """
+    conn = sqlite3.connect(ROLES_DB_PATH, timeout=30)
+    with _COUNTS_LOCK:
+        exists = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (COUNTS_TABLE,)).fetchone()
+        if exists:
+            return conn, False
+        conn.execute(f"""
+            CREATE TABLE {COUNTS_TABLE} (
+                role TEXT NOT NULL,
+                source TEXT NOT NULL,
+                chunks INTEGER NOT NULL,
+                PRIMARY KEY (role, source)
+            )
+        """)
+        counts = Counter()
+        for batch in _scan(get_vectorstore()._collection, ["metadatas"]):
+            counts.update(_key(m) for m in batch["metadatas"])
+        _write_counts(conn, counts)
+        conn.commit()
+        logger.info("Backfilled chunk counts for %d sources", len(counts))
+        return conn, True
+
+
+def record_chunks(metadatas: list[dict], sign: int = 1):
+    """Count chunks just added (sign=1) to or deleted (sign=-1) from the collection"""
+    conn, backfilled = _counts_connection()
+    with closing(conn), conn:
+        if not backfilled:
+            _write_counts(conn, Counter(_key(m) for m in metadatas), sign)
+
+
+def _directory_bytes(path: str) -> int:
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass  # segment file replaced while walking
+    return total
+
+
+def vector_stats() -> dict:
+    """Chunk totals per role and per source plus the on-disk index size, without reading chunks"""
+    conn, _ = _counts_connection()
+    with closing(conn):
+        rows = conn.execute(f"SELECT role, source, chunks FROM {COUNTS_TABLE} ORDER BY role, source").fetchall()
+    by_role, by_source = Counter(), Counter()
+    for role, source, chunks in rows:
+        by_role[role] += chunks
+        by_source[source] += chunks
+    return {
+        "total_chunks": get_vectorstore()._collection.count(),
+        "by_role": dict(by_role),
+        "by_source": dict(by_source),
+        "index_bytes": _directory_bytes(CHROMA_DIR),
+    }
+
+
+def _delete_chunks(collection, ids: list[str], metadatas: list[dict]):
+    for start in range(0, len(ids), SCAN_BATCH):
+        collection.delete(ids=ids[start:start + SCAN_BATCH])
+    record_chunks(metadatas, sign=-1)
+
+
+def _drop_csv_table(filename: str):
+    table_name = Path(filename).stem.replace("-", "_")
+    with duckdb.connect(DUCKDB_FILE) as duck_conn:
+        duck_conn.execute(f'DROP TABLE IF EXISTS "{table_name}"')
+        for table in ("tables_metadata", PROFILE_TABLE, VALUE_COUNTS_TABLE):
+            try:
+                duck_conn.execute(f"DELETE FROM {table} WHERE table_name = ?", (table_name,))
+            except duckdb.CatalogException:
+                pass  # summary tables not created yet
+    invalidate_profile_cache(table_name)
+
+
+def remove_document(doc_id: int, replaced: bool = False) -> dict | None:
+    """Delete a document row with its chunks, uploaded file and (for CSVs) DuckDB table.
+
+    Chunks indexed before chunks carried a doc_id are matched by source and role;
+    they are kept while another row for the same file and role still exists, unless
+    `replaced` says that row is a newer, already indexed copy. The file and table
+    are kept while such a row exists. Returns None when there is no such document.
+    """
+    with closing(sqlite3.connect(ROLES_DB_PATH, timeout=30)) as conn:
+        row = conn.execute("SELECT filename, role, filepath FROM documents WHERE id = ?", (doc_id,)).fetchone()
+        if row is None:
+            return None
+        filename, role, filepath = row
+        siblings = conn.execute(
+            "SELECT count(*) FROM documents WHERE filename = ? AND lower(role) = lower(?) AND id != ?",
+            (filename, role, doc_id),
+        ).fetchone()[0]
+
+    with VECTORSTORE_WRITE_LOCK:
+        collection = get_vectorstore()._collection
+        found = collection.get(where={"doc_id": doc_id}, include=["metadatas"])
+        ids, metadatas = list(found["ids"]), list(found["metadatas"])
+        if not siblings or replaced:
+            legacy = collection.get(where={"$and": [{"source": filename}, {"role": role.lower()}]}, include=["metadatas"])
+            for chunk_id, metadata in zip(legacy["ids"], legacy["metadatas"]):
+                if "doc_id" not in metadata:
+                    ids.append(chunk_id)
+                    metadatas.append(metadata)
+        if ids:
+            _delete_chunks(collection, ids, metadatas)
+            refresh_search_index()
+
+    with closing(sqlite3.connect(ROLES_DB_PATH, timeout=30)) as conn, conn:
+        conn.execute("DELETE FROM documents WHERE id = ?", (doc_id,))
+
+    # Only files the app uploaded are removed, never the seed documents
+    path = Path(resolve(filepath))
+    if not siblings and path.is_file() and Path(UPLOAD_DIR) in path.resolve().parents:
+        path.unlink()
+    if not siblings and Path(filename).suffix.lower() == ".csv":
+        _drop_csv_table(filename)
+
+    logger.info("Removed document %s (%s, %s): %d chunks", doc_id, filename, role, len(ids))
+    return {"doc_id": doc_id, "filename": filename, "role": role, "chunks_deleted": len(ids)}
+
+
+def _superseded_documents(conn, filename: str | None = None, role: str | None = None) -> list[int]:
+    """Older rows of files uploaded again for the same role (the newest row wins), optionally of one file"""
+    query = ("SELECT id FROM documents d WHERE EXISTS (SELECT 1 FROM documents n "
+             "WHERE n.filename = d.filename AND lower(n.role) = lower(d.role) AND n.id > d.id)")
+    if filename is None:
+        return [doc_id for (doc_id,) in conn.execute(query)]
+    query += " AND d.filename = ? AND lower(d.role) = lower(?)"
+    return [doc_id for (doc_id,) in conn.execute(query, (filename, role))]
+
+
+def remove_superseded(filename: str, role: str) -> list[dict]:
+    """Remove the older copies of a file once its new upload is stored and indexed"""
+    with closing(sqlite3.connect(ROLES_DB_PATH, timeout=30)) as conn:
+        superseded = _superseded_documents(conn, filename, role)
+    return [removed for doc_id in superseded if (removed := remove_document(doc_id, replaced=True))]
+
+
+def _recover(client):
+    """Finish or discard a compaction that stopped half-way"""
+    names = {c if isinstance(c, str) else c.name for c in client.list_collections()}
+    if _COMPACT_COLLECTION in names:
+        if COLLECTION_NAME in names:
+            client.delete_collection(_COMPACT_COLLECTION)  # copy was incomplete
+        else:
+            client.get_collection(_COMPACT_COLLECTION).modify(name=COLLECTION_NAME)
+        reset_vectorstore()
+
+
+def _rebuild(client, collection, keep: list[str]):
+    """Copy the kept chunks into a fresh collection and swap it in under the old name"""
+    configuration = {"hnsw": collection.configuration.get("hnsw")} if collection.configuration.get("hnsw") else None
+    target = client.create_collection(_COMPACT_COLLECTION, configuration=configuration,
+                                      metadata=collection.metadata, embedding_function=None)
+    for start in range(0, len(keep), SCAN_BATCH):
+        batch = collection.get(ids=keep[start:start + SCAN_BATCH], include=["embeddings", "metadatas", "documents"])
+        target.add(ids=batch["ids"], embeddings=batch["embeddings"],
+                   metadatas=batch["metadatas"], documents=batch["documents"])
+    client.delete_collection(COLLECTION_NAME)
+    target.modify(name=COLLECTION_NAME)
+
+
+def _reclaim_disk():
+    """Delete HNSW directories of dropped collections and VACUUM Chroma's SQLite file.
+
+    Chroma keeps both around after delete_collection, so without this a rebuild
+    would leave the directory larger than before.
+    """
+    with closing(sqlite3.connect(os.path.join(CHROMA_DIR, "chroma.sqlite3"), timeout=30)) as conn:
+        segments = {segment_id for (segment_id,) in conn.execute("SELECT id FROM segments")}
+        conn.execute("VACUUM")
+    for entry in os.scandir(CHROMA_DIR):
+        try:
+            uuid.UUID(entry.name)
+        except ValueError:
+            continue
+        if entry.is_dir() and entry.name not in segments:
+            shutil.rmtree(entry.path, ignore_errors=True)
+
+
+def compact(rebuild: bool = True) -> dict:
+    """Remove superseded documents, orphaned and duplicate chunks, then rebuild the index.
+
+    Searches that arrive during the swap at the end may fail; run it as maintenance.
+    """
+    with VECTORSTORE_WRITE_LOCK:
+        _recover(get_vectorstore()._client)
+        before = {"chunks": get_vectorstore()._collection.count(), "index_bytes": _directory_bytes(CHROMA_DIR)}
+
+        with closing(sqlite3.connect(ROLES_DB_PATH, timeout=30)) as conn:
+            superseded = _superseded_documents(conn)
+    # remove_document takes the write lock itself
+    for doc_id in superseded:
+        remove_document(doc_id)
+
+    with VECTORSTORE_WRITE_LOCK:
+        with closing(sqlite3.connect(ROLES_DB_PATH, timeout=30)) as conn:
+            rows = conn.execute("SELECT id, filename, role FROM documents").fetchall()
+        live_ids = {doc_id: (role.lower(), filename) for doc_id, filename, role in rows}
+        live_files = set(live_ids.values())
+
+        vectorstore = get_vectorstore()
+        collection = vectorstore._collection
+        keep, drop, seen, embedded = [], [], set(), set()
+        orphaned = duplicates = 0
+        for batch in _scan(collection, ["metadatas", "documents"]):
+            for chunk_id, metadata, text in zip(batch["ids"], batch["metadatas"], batch["documents"]):
+                key = _key(metadata)
+                doc_id = metadata.get("doc_id")
+                if doc_id is not None:
+                    alive = live_ids.get(doc_id) == key
+                else:
+                    alive = key in live_files
+                identity = (doc_id, key, text)
+                if not alive or identity in seen:
+                    orphaned += not alive
+                    duplicates += alive
+                    drop.append(chunk_id)
+                    continue
+                seen.add(identity)
+                keep.append(chunk_id)
+                embedded.add(key if doc_id is None else doc_id)
+
+        if rebuild:
+            _rebuild(vectorstore._client, collection, keep)
+            reset_vectorstore()
+            _reclaim_disk()
+        elif drop:
+            for start in range(0, len(drop), SCAN_BATCH):
+                collection.delete(ids=drop[start:start + SCAN_BATCH])
+        refresh_search_index()
+
+        with closing(sqlite3.connect(ROLES_DB_PATH, timeout=30)) as conn, conn:
+            conn.execute(f"DROP TABLE IF EXISTS {COUNTS_TABLE}")
+        conn, _ = _counts_connection()  # recreated from the compacted collection
+        conn.close()
+
+        # Rows whose chunks were all orphaned (e.g. the role was deleted) are indexed again
+        stale = [doc_id for doc_id, key in live_ids.items() if doc_id not in embedded and key not in embedded]
+        if stale:
+            with closing(sqlite3.connect(ROLES_DB_PATH, timeout=30)) as conn, conn:
+                conn.executemany("UPDATE documents SET embedded = 0 WHERE id = ? AND embedded = 1",
+                                 [(doc_id,) for doc_id in stale])
+
+        report = {
+            "before": before,
+            "after": {"chunks": get_vectorstore()._collection.count(), "index_bytes": _directory_bytes(CHROMA_DIR)},
+            "superseded_documents": superseded,
+            "orphaned_chunks": orphaned,
+            "duplicate_chunks": duplicates,
+            "documents_to_reindex": stale,
+            "rebuilt": rebuild,
+        }
+    logger.info("Compacted vector store: %s", report)
+    return report
+
+
+if __name__ == "__main__":
+    import json
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Vector store stats and compaction")
+    parser.add_argument("command", choices=["stats", "compact"])
+    parser.add_argument("--no-rebuild", action="store_true", help="delete chunks without rebuilding the index")
+    args = parser.parse_args()
+    if args.command == "stats":
+        result = vector_stats()
+    else:
+        result = compact(rebuild=not args.no_rebuild)
+    print(json.dumps(result, indent=2, default=str))
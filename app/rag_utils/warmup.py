@@ -0,0 +1,96 @@
+import os
+import time
+import threading
+
+from rag_utils.llm_client import get_llm_client, EMBED_MODEL, LLM_MODEL
+from rag_utils.llm_scheduler import llm_context, BACKGROUND
+from rag_utils.rag_module import VECTOR_BACKEND, get_vectorstore, get_search_index, get_rag_chain, get_rag_components
+from rag_utils.logging_setup import get_logger
+
+logger = get_logger(__name__)
+
+# Detail levels a chain is built for per role
+DETAIL_LEVELS = ("brief", "extended")
+WARMUP_QUESTION = os.getenv("WARMUP_QUESTION", "What is the leave policy?")
+
+_STATE = {"status": "pending", "started_at": None, "finished_at": None, "steps": {}}
+_STATE_LOCK = threading.Lock()
+_THREAD = None
+
+
+def _step(name: str, fn, *args):
+    """Run one warm-up step and record its outcome; failures do not stop later steps"""
+    started = time.time()
+    try:
+        fn(*args)
+        outcome = {"ok": True}
+    except Exception as e:
+        outcome = {"ok": False, "error": str(e)}
+        logger.warning("Warm-up step %s failed: %s", name, e)
+    outcome["seconds"] = round(time.time() - started, 3)
+    with _STATE_LOCK:
+        _STATE["steps"][name] = outcome
+    return outcome["ok"]
+
+
+def _open_vector_index():
+    if VECTOR_BACKEND == "flat":
+        # Chroma is not opened at all when the flat index already exists
+        index = get_search_index()
+        snapshot = index.snapshot()
+        if snapshot.texts:
+            index.similarity_search_by_vector(snapshot.exact[0], k=1)
+        return
+    # Searching with a stored vector loads the HNSW segment without needing Ollama
+    vectorstore = get_vectorstore()
+    stored = vectorstore._collection.get(limit=1, include=["embeddings"])
+    if len(stored["embeddings"]):
+        vectorstore.similarity_search_by_vector(list(stored["embeddings"][0]), k=1)
+
+
+def _build_chains(roles: list[str]):
+    for role in roles:
+        for detail in DETAIL_LEVELS:
+            get_rag_chain(user_role=role, detail=detail)
+
+
+def _warmup_query():
+    retriever, qa_chain = get_rag_components("c-level", detail="brief")
+    docs = retriever.invoke(WARMUP_QUESTION)
+    qa_chain.invoke({"input": WARMUP_QUESTION, "context": docs})
+
+
+def run_warmup(roles: list[str]) -> dict:
+    """Preload models, open the index, build every chain and answer one question"""
+    with _STATE_LOCK:
+        _STATE.update(status="running", started_at=time.time(), finished_at=None, steps={})
+    client = get_llm_client()
+    # Warm-up must never delay interactive chat
+    with llm_context(BACKGROUND, "warmup"):
+        ok = all([
+            _step("load_llm", client.preload, LLM_MODEL),
+            _step("load_embedding_model", client.embed, "warm-up", EMBED_MODEL),
+            _step("open_vector_index", _open_vector_index),
+            _step("build_chains", _build_chains, roles),
+            _step("warmup_query", _warmup_query),
+        ])
+    with _STATE_LOCK:
+        _STATE.update(status="ready" if ok else "degraded", finished_at=time.time())
+        total = _STATE["finished_at"] - _STATE["started_at"]
+    logger.info("Warm-up %s after %.1fs", "ready" if ok else "finished with errors", total)
+    return warmup_state()
+
+
+def start_warmup(roles: list[str]):
+    """Run the warm-up in a background thread (once per process)"""
+    global _THREAD
+    with _STATE_LOCK:
+        if _THREAD is not None:
+            return
+        _THREAD = threading.Thread(target=run_warmup, args=(roles,), name="warmup", daemon=True)
+    _THREAD.start()
+
+
+def warmup_state() -> dict:
+    with _STATE_LOCK:
+        return {**_STATE, "steps": dict(_STATE["steps"])}
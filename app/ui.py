@@ -63,6 +63,8 @@ if "chat_history" not in st.session_state:
     st.session_state.chat_history = []
 if "current_user" not in st.session_state:
     st.session_state.current_user = None
+if "chat_session_id" not in st.session_state:
+    st.session_state.chat_session_id = None  # server-side conversation id
 
 # Load roles into session state if not present
 def fetch_roles():
@@ -117,6 +119,7 @@ if st.session_state.page == "login":
             # Check if this is a different user - if so, clear chat history
             if st.session_state.current_user != username:
                 st.session_state.chat_history = []
+                st.session_state.chat_session_id = None
                 st.session_state.current_user = username
             
             st.session_state.auth = (username, password)
@@ -160,6 +163,7 @@ if st.session_state.page == "main":
             st.session_state.role = None
             st.session_state.page = "login"
             st.session_state.chat_history = []  # Clear chat history
+            st.session_state.chat_session_id = None  # Start a new server-side conversation next time
             st.session_state.current_user = None  # Clear current user
             st.session_state.username = None
             st.session_state.password = None
@@ -201,7 +205,17 @@ if st.session_state.page == "main":
         col1, col2 = st.columns([6, 1])
         with col2:
             if st.button("🗑️ Clear Chat"):
+                if st.session_state.chat_session_id:
+                    try:
+                        requests.delete(
+                            f"{API_URL}/sessions/{st.session_state.chat_session_id}",
+                            auth=HTTPBasicAuth(*st.session_state.auth),
+                            timeout=5
+                        )
+                    except requests.exceptions.RequestException:
+                        pass  # the server drops idle sessions anyway
                 st.session_state.chat_history = []
+                st.session_state.chat_session_id = None
                 st.rerun()
         
         # Display chat history
@@ -231,16 +245,14 @@ if st.session_state.page == "main":
             # Get response from backend
             with st.spinner(" Thinking..."):
                 try:
-                    # Send last 4 exchanges for context (8 messages = 4 Q&A pairs) - reduced for speed
-                    history_for_api = st.session_state.chat_history[-8:] if len(st.session_state.chat_history) > 1 else []
-                    
+                    # The server keeps the conversation; only the session id is sent
                     res = requests.post(
                         f"{API_URL}/chat",
                         json={
                             "question": question,
                             "role": st.session_state.role,
                             "detail": "brief",
-                            "history": history_for_api
+                            "session_id": st.session_state.chat_session_id
                         },
                         auth=HTTPBasicAuth(*st.session_state.auth),
                         timeout=150  # Increased from 120s to 150s (2.5 minutes) to handle SQL generation timeout
@@ -248,6 +260,7 @@ if st.session_state.page == "main":
                     
                     if res.status_code == 200:
                         response_data = res.json()
+                        st.session_state.chat_session_id = response_data.get("session_id")
                         answer = response_data["answer"]
                         mode = response_data.get("mode", "Unknown")
                         sql = response_data.get("sql")
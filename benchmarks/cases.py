@@ -0,0 +1,231 @@
+"""Benchmark cases for the CPU-bound hot paths.
+
+Every input is pinned here (fixed strings, seeded random data) so results from
+different commits are comparable. Nothing touches Ollama, Cohere or the repo's
+databases; setup() builds whatever a case needs and returns the callable to time.
+"""
+import os
+import random
+import tempfile
+
+# Inputs below are built once per case; "number" is how many calls one timed run makes
+CASES = {}
+
+
+def case(name: str, number: int):
+    def register(setup):
+        CASES[name] = {"setup": setup, "number": number, "doc": (setup.__doc__ or "").strip()}
+        return setup
+    return register
+
+
+QUESTIONS = [
+    "How many employees are in the Finance department?",
+    "What is the average salary by department?",
+    "List employees with performance rating 5 hired after 2020",
+    "Summarize the employee handbook leave policy",
+    "Explain the Q4 marketing campaign highlights",
+    "What does the engineering architecture document say about deployments?",
+    "total number of employees with attendance below 90 percent",
+    "Tell me about the company's mission",
+    "Which department has the highest average rating?",
+    "Describe the quarterly financial report summary",
+    "show top 10 employees by salary",
+    "what about marketing?",
+]
+
+SQL_QUERIES = [
+    "SELECT department, COUNT(*) FROM hr_data GROUP BY department",
+    "SELECT full_name, salary FROM hr_data WHERE performance_rating = 5 ORDER BY salary DESC LIMIT 10",
+    "WITH d AS (SELECT department, AVG(salary) AS s FROM hr_data GROUP BY department) "
+    "SELECT * FROM d WHERE s > (SELECT AVG(salary) FROM hr_data)",
+    "SELECT a.full_name, b.department FROM hr_data a JOIN departments b ON a.department = b.name",
+    "DELETE FROM hr_data WHERE salary > 0",
+]
+
+LLM_RESPONSES = [
+    "```sql\nSELECT department, COUNT(*) AS employees FROM hr_data GROUP BY department;\n```",
+    "Here is the query you asked for:\n\nSELECT full_name FROM hr_data WHERE salary > 100000\n\nIt lists high earners.",
+    "```\nSELECT AVG(performance_rating) FROM hr_data\n```\nThis computes the average rating.",
+    "SELECT * FROM hr_data LIMIT 5",
+]
+
+ROLES = ["hr", "finance", "marketing", "engineering", "general"]
+
+_WORDS = ("policy employee revenue quarter leave benefit campaign deployment service "
+          "architecture security compliance budget forecast review training").split()
+
+
+def _paragraphs(rng: random.Random, count: int) -> str:
+    paragraphs = []
+    for _ in range(count):
+        sentences = [" ".join(rng.choice(_WORDS) for _ in range(rng.randint(8, 20))).capitalize() + "."
+                     for _ in range(rng.randint(3, 8))]
+        paragraphs.append(" ".join(sentences))
+    return "\n\n".join(paragraphs)
+
+
+def _rows(rng: random.Random, count: int) -> list[list]:
+    departments = ["Finance", "HR", "Marketing", "Engineering", "Sales"]
+    return [
+        [f"FINEMP{1000 + i}", f"Employee {i}", rng.choice(departments), rng.randint(30_000, 200_000),
+         rng.randint(1, 5), round(rng.uniform(70, 100), 2), f"2020-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}"]
+        for i in range(count)
+    ]
+
+
+COLUMNS = ["employee_id", "full_name", "department", "salary", "performance_rating", "attendance_pct", "date_of_joining"]
+
+
+@case("fast_classify", number=2000)
+def bench_fast_classify():
+    """Rule-based SQL/RAG classification of a fixed question mix"""
+    from rag_utils.query_classifier import fast_classify
+
+    def run():
+        for question in QUESTIONS:
+            fast_classify(question)
+    return run
+
+
+@case("analyze_sql_uncached", number=50)
+def bench_analyze_sql():
+    """DuckDB parse + table walk behind extract_tables_from_sql / is_safe_query (cache bypassed)"""
+    from rag_utils.csv_query import analyze_sql
+    parse = analyze_sql.__wrapped__
+
+    def run():
+        for sql in SQL_QUERIES:
+            parse(sql)
+    return run
+
+
+@case("extract_tables_cached", number=5000)
+def bench_extract_tables():
+    """extract_tables_from_sql + is_safe_query on repeated statements (parse cache hits)"""
+    from rag_utils.csv_query import extract_tables_from_sql, is_safe_query
+
+    def run():
+        for sql in SQL_QUERIES:
+            extract_tables_from_sql(sql)
+            is_safe_query(sql)
+    return run
+
+
+@case("extract_sql", number=5000)
+def bench_extract_sql():
+    """SQL extraction from typical LLM responses"""
+    from rag_utils.csv_query import extract_sql
+
+    def run():
+        for response in LLM_RESPONSES:
+            extract_sql(response)
+    return run
+
+
+@case("load_file_csv", number=3)
+def bench_load_file():
+    """CSV -> Document conversion in load_file (2,000 rows x 7 columns)"""
+    import csv
+    from rag_utils.rag_module import load_file
+
+    directory = tempfile.mkdtemp(prefix="rag-bench-")
+    path = os.path.join(directory, "hr_data.csv")
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(COLUMNS)
+        writer.writerows(_rows(random.Random(7), 2000))
+    return lambda: load_file(path, "HR")
+
+
+@case("split_documents", number=3)
+def bench_split_documents():
+    """Recursive character splitting (800/150) of 20 markdown documents"""
+    from langchain_core.documents import Document
+    from rag_utils.rag_module import split_documents
+
+    rng = random.Random(11)
+    docs = [Document(page_content=_paragraphs(rng, 40), metadata={"source": f"doc{i}.md", "role": "general"})
+            for i in range(20)]
+    return lambda: split_documents(docs)
+
+
+@case("mmr_select", number=200)
+def bench_mmr():
+    """MMR selection of k=3 from fetch_k=20 candidates, 768-dim embeddings (as in Chroma)"""
+    import numpy as np
+    from langchain_community.vectorstores.utils import maximal_marginal_relevance
+
+    rng = np.random.default_rng(3)
+    query = rng.normal(size=768).astype(np.float32)
+    candidates = rng.normal(size=(20, 768)).astype(np.float32).tolist()
+    return lambda: maximal_marginal_relevance(query, candidates, lambda_mult=0.8, k=3)
+
+
+def _flat_index(count: int, dtype: str):
+    """A FlatVectorIndex over count seeded 768-dim chunks, plus a query vector"""
+    import numpy as np
+    from rag_utils.flat_index import FlatVectorIndex, build_flat_index
+
+    class Collection:
+        def get(self, include, limit, offset):
+            rows = range(offset, min(offset + limit, len(vectors)))
+            return {"ids": list(rows), "embeddings": vectors[offset:offset + len(rows)],
+                    "metadatas": [{"role": ROLES[i % len(ROLES)], "source": f"doc{i % 50}.md"} for i in rows],
+                    "documents": [f"chunk {i}" for i in rows]}
+
+    rng = np.random.default_rng(5)
+    vectors = rng.normal(size=(count, 768)).astype(np.float32)
+    query = rng.normal(size=768).astype(np.float32)
+    directory = tempfile.mkdtemp(prefix="rag-bench-")
+    build_flat_index(Collection(), directory, dtype)
+    return FlatVectorIndex(embeddings=None, directory=directory), query
+
+
+@case("flat_index_mmr", number=200)
+def bench_flat_index():
+    """Flat index (float16) MMR search: role prefilter over 5,000 x 768 chunks, k=3, fetch_k=20"""
+    index, query = _flat_index(5000, "float16")
+    return lambda: index.max_marginal_relevance_search_by_vector(query, k=3, fetch_k=20, lambda_mult=0.8,
+                                                                 filter={"role": "hr"})
+
+
+# Unfiltered scans score every row, so a scoring path without BLAS (e.g. a float16 matmul) shows up here
+@case("flat_index_scan_float16", number=50)
+def bench_flat_index_scan_float16():
+    """Flat index (float16) similarity search with no filter over 20,000 x 768 chunks, k=4"""
+    index, query = _flat_index(20000, "float16")
+    return lambda: index.similarity_search_by_vector(query, k=4)
+
+
+@case("flat_index_scan_int8", number=50)
+def bench_flat_index_scan_int8():
+    """Flat index (int8) similarity search with no filter over 20,000 x 768 chunks, k=4"""
+    index, query = _flat_index(20000, "int8")
+    return lambda: index.similarity_search_by_vector(query, k=4)
+
+
+@case("auth_cache_hit", number=5000)
+def bench_auth_cache():
+    """authenticate() answered from the in-memory cache (password hash + lookup)"""
+    import time
+    import hashlib
+    from fastapi.security import HTTPBasicCredentials
+    import main
+
+    credentials = HTTPBasicCredentials(username="bench_user", password="bench-password")
+    main._AUTH_CACHE["bench_user"] = {
+        "password_hash": hashlib.sha256(b"bench-password").hexdigest(),
+        "role": "HR",
+        "expiry": time.time() + 3600,
+    }
+    return lambda: main.authenticate(credentials)
+
+
+@case("tabulate_result", number=5)
+def bench_tabulate():
+    """Markdown rendering of a SQL result at the row cap (500 rows x 7 columns)"""
+    import tabulate
+
+    rows = _rows(random.Random(5), 500)
+    return lambda: tabulate.tabulate(rows, headers=COLUMNS, tablefmt="github")
@@ -0,0 +1,250 @@
+"""End-to-end load test: the FastAPI app against a mock Ollama, replaying queries_by_role.txt.
+
+Starts the mock Ollama server and the app (uvicorn, in this process) on free
+ports. It then has N concurrent users, one login per role, send that role's
+questions to /chat, and reports throughput plus p50/p95/p99 latency per route
+(SQL, RAG, fallback). The app runs on copies of roles_docs.db, chroma_db and
+the DuckDB file, with router traffic and traces in a temporary directory, so
+the repository data is left untouched.
+
+    python benchmarks/load_test.py --users 8 --requests 200 --tokens-per-second 15
+    python benchmarks/load_test.py --users 4 --duration 60 --output benchmarks/results/load.json
+"""
+import os
+import re
+import sys
+import json
+import math
+import time
+import random
+import shutil
+import socket
+import sqlite3
+import hashlib
+import argparse
+import tempfile
+import threading
+import statistics
+from pathlib import Path
+
+BENCH_DIR = Path(__file__).resolve().parent
+REPO_DIR = BENCH_DIR.parent
+sys.path.insert(0, str(BENCH_DIR))
+
+from mock_ollama import MockOllama, add_profile_arguments, profile_from_args  # noqa: E402
+
+QUERY_SET_FILE = REPO_DIR / "queries_by_role.txt"
+_ROLE_RE = re.compile(r"^Role:\s*(.+?)\s*\(")
+_SECTION_RE = re.compile(r"^(SQL|RAG)\s*\(\d+\):")
+_NUMBERED_RE = re.compile(r"^\d+\)\s*(.+)$")
+LOAD_PASSWORD = "load-test"
+
+
+def load_query_mix(path: Path = QUERY_SET_FILE) -> dict[str, list[tuple[str, str]]]:
+    """{role: [(expected route, question), ...]} from queries_by_role.txt"""
+    mix: dict[str, list[tuple[str, str]]] = {}
+    role = label = None
+    for line in path.read_text(encoding="utf-8").splitlines():
+        line = line.strip()
+        if match := _ROLE_RE.match(line):
+            role, label = match.group(1), None
+        elif match := _SECTION_RE.match(line):
+            label = match.group(1)
+        elif (match := _NUMBERED_RE.match(line)) and role and label:
+            mix.setdefault(role, []).append((label, match.group(1)))
+    return mix
+
+
+def route_of(response: dict) -> str:
+    mode = response.get("mode", "")
+    if "fallback" in mode.lower():
+        return "fallback"
+    return "SQL" if mode == "SQL" else "RAG"
+
+
+def percentile(values: list[float], q: float) -> float:
+    """Nearest-rank percentile"""
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(q / 100 * len(ordered)) - 1)]
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def prepare_data(workdir: Path, roles: list[str]):
+    """Point the app at copies of its stores and add one load-test user per role"""
+    db_path = workdir / "roles_docs.db"
+    shutil.copy(REPO_DIR / "roles_docs.db", db_path)
+    shutil.copytree(REPO_DIR / "chroma_db", workdir / "chroma_db")
+    shutil.copy(REPO_DIR / "static" / "data" / "structured_queries.duckdb", workdir / "structured_queries.duckdb")
+    os.environ.update({
+        "ROLES_DB_PATH": str(db_path),
+        "CHROMA_DIR": str(workdir / "chroma_db"),
+        "DUCKDB_FILE": str(workdir / "structured_queries.duckdb"),
+        "ROUTER_TRAFFIC_LOG": str(workdir / "router_traffic.jsonl"),
+        "TRACE_FILE": str(workdir / "traces.jsonl"),
+    })
+    conn = sqlite3.connect(db_path)
+    hashed = hashlib.sha256(LOAD_PASSWORD.encode()).hexdigest()
+    for role in roles:
+        conn.execute("INSERT OR IGNORE INTO roles (role_name) VALUES (?)", (role,))
+        conn.execute("INSERT OR REPLACE INTO users (username, password, role) VALUES (?, ?, ?)",
+                     (_username(role), hashed, role))
+    conn.commit()
+    conn.close()
+
+
+def _username(role: str) -> str:
+    return "load_" + re.sub(r"\W+", "_", role.lower())
+
+
+def start_app(port: int):
+    import uvicorn
+    sys.path.insert(0, str(REPO_DIR / "app"))
+    from main import app
+
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, name="load-test-app", daemon=True)
+    thread.start()
+    deadline = time.time() + 60
+    while not server.started:
+        if time.time() > deadline or not thread.is_alive():
+            raise RuntimeError("The app did not start")
+        time.sleep(0.05)
+    return server, thread
+
+
+def run_load(base_url: str, mix: dict, users: int, total_requests: int | None, duration: float | None,
+             detail: str, vary: bool, seed: int) -> list[dict]:
+    import requests
+
+    roles = sorted(mix)
+    samples: list[dict] = []
+    lock = threading.Lock()
+    issued = [0]
+    stop_at = time.time() + duration if duration else None
+
+    def take_ticket() -> int | None:
+        with lock:
+            if total_requests is not None and issued[0] >= total_requests:
+                return None
+            if stop_at is not None and time.time() >= stop_at:
+                return None
+            issued[0] += 1
+            return issued[0]
+
+    def user(index: int):
+        role = roles[index % len(roles)]
+        rng = random.Random(seed + index)
+        queries = list(mix[role])
+        session = requests.Session()
+        session.auth = (_username(role), LOAD_PASSWORD)
+        while (ticket := take_ticket()) is not None:
+            expected, question = rng.choice(queries)
+            if vary:
+                question = f"{question} (request {ticket})"  # defeats the answer caches
+            started = time.perf_counter()
+            try:
+                response = session.post(f"{base_url}/chat", json={"question": question, "detail": detail}, timeout=600)
+                ok = response.status_code == 200
+                body = response.json() if ok else {}
+                route = route_of(body) if ok else f"http_{response.status_code}"
+            except requests.RequestException as e:
+                ok, route = False, type(e).__name__
+            sample = {"role": role, "expected": expected, "route": route, "ok": ok,
+                      "latency": time.perf_counter() - started}
+            with lock:
+                samples.append(sample)
+
+    threads = [threading.Thread(target=user, args=(i,), name=f"load-user-{i}") for i in range(users)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return samples
+
+
+def summarize(samples: list[dict], elapsed: float) -> dict:
+    def stats(group: list[dict]) -> dict:
+        latencies = [s["latency"] for s in group]
+        return {
+            "requests": len(group),
+            "p50_ms": round(percentile(latencies, 50) * 1000, 1),
+            "p95_ms": round(percentile(latencies, 95) * 1000, 1),
+            "p99_ms": round(percentile(latencies, 99) * 1000, 1),
+            "mean_ms": round(statistics.fmean(latencies) * 1000, 1),
+        }
+
+    routes = {}
+    for route in sorted({s["route"] for s in samples}):
+        routes[route] = stats([s for s in samples if s["route"] == route])
+    ok = [s for s in samples if s["ok"]]
+    return {
+        "requests": len(samples),
+        "errors": len(samples) - len(ok),
+        "elapsed_s": round(elapsed, 2),
+        "throughput_rps": round(len(ok) / elapsed, 3) if elapsed else 0.0,
+        "overall": stats(ok) if ok else {},
+        "routes": routes,
+        "misrouted": sum(1 for s in ok if s["route"] != "fallback" and s["route"] != s["expected"]),
+    }
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=4, help="concurrent users (spread over the roles)")
+    parser.add_argument("--requests", type=int, default=100, help="total requests (ignored with --duration)")
+    parser.add_argument("--duration", type=float, help="run for this many seconds instead of a request count")
+    parser.add_argument("--detail", default="brief", choices=["brief", "extended"])
+    parser.add_argument("--vary", action="store_true", help="make every question unique to bypass caches")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--warmup", action="store_true", help="run the app's startup warm-up before the load")
+    parser.add_argument("--output", help="write the summary as JSON to this file")
+    add_profile_arguments(parser)
+    args = parser.parse_args(argv)
+
+    mix = load_query_mix()
+    workdir = Path(tempfile.mkdtemp(prefix="rag-load-"))
+    mock = MockOllama(profile=profile_from_args(args)).start()
+    os.environ.update({
+        "OLLAMA_BASE_URL": mock.base_url,
+        "WARMUP_ON_STARTUP": "1" if args.warmup else "0",
+        "LOG_LEVEL": os.environ.get("LOG_LEVEL", "WARNING"),
+    })
+    prepare_data(workdir, sorted(mix))
+    server = None
+    try:
+        port = _free_port()
+        server, _ = start_app(port)
+        if args.warmup:
+            import requests
+            while requests.get(f"http://127.0.0.1:{port}/ready", timeout=5).status_code != 200:
+                time.sleep(0.5)
+        started = time.perf_counter()
+        samples = run_load(f"http://127.0.0.1:{port}", mix, args.users, None if args.duration else args.requests,
+                           args.duration, args.detail, args.vary, args.seed)
+        summary = summarize(samples, time.perf_counter() - started)
+    finally:
+        if server is not None:
+            server.should_exit = True
+        mock.stop()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    summary["config"] = {"users": args.users, "detail": args.detail, "vary": args.vary,
+                         "mock_ollama": vars(mock.profile), "mock_calls": mock.stats}
+    print(f"{summary['requests']} requests, {summary['errors']} errors in {summary['elapsed_s']}s "
+          f"-> {summary['throughput_rps']} req/s")
+    for route, route_stats in summary["routes"].items():
+        print(f"  {route:<10} n={route_stats['requests']:<5} p50 {route_stats['p50_ms']:>8} ms   "
+              f"p95 {route_stats['p95_ms']:>8} ms   p99 {route_stats['p99_ms']:>8} ms")
+    if args.output:
+        Path(args.output).parent.mkdir(parents=True, exist_ok=True)
+        Path(args.output).write_text(json.dumps(summary, indent=2) + "\n")
+    return 1 if summary["errors"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,183 @@
+"""A local stand-in for the Ollama HTTP API with configurable latency.
+
+Serves /api/tags, /api/generate, /api/embeddings and /api/embed. Generation
+time is modelled as a fixed overhead plus prompt processing and token output
+rates, and at most `parallel` generations run at once, like a CPU-only Ollama
+with OLLAMA_NUM_PARALLEL. Replies are shaped by the prompt: classifier prompts
+get SQL/RAG, SQL prompts get a SELECT over the first table in the schema, and
+everything else gets filler text.
+
+    python benchmarks/mock_ollama.py --port 11435 --tokens-per-second 15
+"""
+import re
+import json
+import math
+import time
+import hashlib
+import argparse
+import threading
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+_TABLE_RE = re.compile(r"^Table:\s*(\w+)", re.MULTILINE)
+_QUESTION_RE = re.compile(r'"([^"]+)"\s*Answer:', re.DOTALL)
+_SQL_HINTS = ("how many", "average", "count", "total", "list", "top ", "show", "sum", "per ")
+_WORD_RE = re.compile(r"\w+")
+_FILLER = ("The documents describe the policy in detail and note the main points relevant to the "
+           "question including responsibilities timelines and the expected outcomes for each team").split()
+
+
+@dataclass
+class MockProfile:
+    overhead_ms: float = 50.0           # per request: model dispatch, sampling setup
+    prompt_tokens_per_second: float = 400.0
+    tokens_per_second: float = 20.0     # generation rate
+    answer_tokens: int = 120            # RAG-style answers, capped by num_predict
+    embed_ms: float = 15.0              # per embedded text
+    embed_dim: int = 768                # nomic-embed-text
+    parallel: int = 1                   # concurrent generations
+
+
+def _tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+
+def _embedding(text: str, dim: int) -> list[float]:
+    """Deterministic hashed bag-of-words vector, so similar texts land close together"""
+    vector = [0.0] * dim
+    for word in _WORD_RE.findall(text.lower()):
+        digest = hashlib.blake2b(word.encode(), digest_size=8).digest()
+        index = int.from_bytes(digest[:4], "little") % dim
+        vector[index] += 1.0 if digest[4] & 1 else -1.0
+    norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+    return [v / norm for v in vector]
+
+
+def reply_for(prompt: str, num_predict: int | None, profile: MockProfile) -> str:
+    if "Respond with only one word" in prompt:
+        match = _QUESTION_RE.search(prompt)
+        question = (match.group(1) if match else prompt).lower()
+        return "SQL" if any(hint in question for hint in _SQL_HINTS) else "RAG"
+    tables = _TABLE_RE.findall(prompt)
+    if tables and "SQL" in prompt:
+        return f"```sql\nSELECT * FROM {tables[0]} LIMIT 10\n```"
+    if "Standalone question:" in prompt:
+        return "What does the document say about this topic?"
+    if not prompt:
+        return ""  # model preload
+    words = min(num_predict or profile.answer_tokens, profile.answer_tokens)
+    return " ".join(_FILLER[i % len(_FILLER)] for i in range(words)) + "."
+
+
+class MockOllama:
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, profile: MockProfile | None = None):
+        self.profile = profile or MockProfile()
+        self._slots = threading.BoundedSemaphore(self.profile.parallel)
+        self.stats = {"generate": 0, "embed_calls": 0, "embed_texts": 0}
+        self._stats_lock = threading.Lock()
+        self.server = ThreadingHTTPServer((host, port), self._handler())
+        self.server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def _count(self, key: str, amount: int = 1):
+        with self._stats_lock:
+            self.stats[key] += amount
+
+    def generate(self, payload: dict) -> dict:
+        prompt = payload.get("prompt", "")
+        options = payload.get("options") or {}
+        text = reply_for(prompt, options.get("num_predict"), self.profile)
+        seconds = (self.profile.overhead_ms / 1000
+                   + _tokens(prompt) / self.profile.prompt_tokens_per_second
+                   + len(text.split()) / self.profile.tokens_per_second)
+        with self._slots:
+            time.sleep(seconds)
+        self._count("generate")
+        return {"model": payload.get("model"), "response": text, "done": True,
+                "eval_count": len(text.split()), "total_duration": int(seconds * 1e9)}
+
+    def embed(self, texts: list[str]) -> list[list[float]]:
+        time.sleep(self.profile.embed_ms * len(texts) / 1000)
+        self._count("embed_calls")
+        self._count("embed_texts", len(texts))
+        return [_embedding(text, self.profile.embed_dim) for text in texts]
+
+    def _handler(self):
+        mock = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def _send(self, body: dict, status: int = 200):
+                data = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                if self.path == "/api/tags":
+                    self._send({"models": [{"name": "llama3.1:latest"}, {"name": "nomic-embed-text:latest"}]})
+                else:
+                    self._send({"error": "not found"}, 404)
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                payload = json.loads(self.rfile.read(length) or b"{}")
+                if self.path == "/api/generate":
+                    self._send(mock.generate(payload))
+                elif self.path == "/api/embeddings":
+                    self._send({"embedding": mock.embed([payload.get("prompt", "")])[0]})
+                elif self.path == "/api/embed":
+                    texts = payload.get("input", [])
+                    self._send({"model": payload.get("model"), "embeddings": mock.embed([texts] if isinstance(texts, str) else texts)})
+                else:
+                    self._send({"error": "not found"}, 404)
+
+        return Handler
+
+    def start(self) -> "MockOllama":
+        self._thread = threading.Thread(target=self.server.serve_forever, name="mock-ollama", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def add_profile_arguments(parser: argparse.ArgumentParser):
+    defaults = MockProfile()
+    parser.add_argument("--overhead-ms", type=float, default=defaults.overhead_ms)
+    parser.add_argument("--prompt-tokens-per-second", type=float, default=defaults.prompt_tokens_per_second)
+    parser.add_argument("--tokens-per-second", type=float, default=defaults.tokens_per_second)
+    parser.add_argument("--answer-tokens", type=int, default=defaults.answer_tokens)
+    parser.add_argument("--embed-ms", type=float, default=defaults.embed_ms)
+    parser.add_argument("--embed-dim", type=int, default=defaults.embed_dim)
+    parser.add_argument("--parallel", type=int, default=defaults.parallel, help="concurrent generations")
+
+
+def profile_from_args(args) -> MockProfile:
+    return MockProfile(args.overhead_ms, args.prompt_tokens_per_second, args.tokens_per_second,
+                       args.answer_tokens, args.embed_ms, args.embed_dim, args.parallel)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11435)
+    add_profile_arguments(parser)
+    args = parser.parse_args()
+    mock = MockOllama(args.host, args.port, profile_from_args(args))
+    print(f"Mock Ollama listening on {mock.base_url}")
+    try:
+        mock.server.serve_forever()
+    except KeyboardInterrupt:
+        mock.stop()
@@ -0,0 +1,116 @@
+"""Run the hot-path micro-benchmarks and write comparable JSON results.
+
+    python benchmarks/run.py                                 # all cases -> benchmarks/results/latest.json
+    python benchmarks/run.py --only fast_classify extract_sql
+    python benchmarks/run.py --baseline benchmarks/results/main.json --tolerance 0.25
+
+Exits with status 1 when a case is slower than its ceiling in thresholds.json,
+or slower than the baseline's median by more than the tolerance.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import statistics
+import subprocess
+import timeit
+from pathlib import Path
+
+BENCH_DIR = Path(__file__).resolve().parent
+REPO_DIR = BENCH_DIR.parent
+sys.path.insert(0, str(REPO_DIR / "app"))
+sys.path.insert(0, str(BENCH_DIR))
+
+# Offline and quiet: no warm-up threads, no per-call logging in the timings
+os.environ.setdefault("WARMUP_ON_STARTUP", "0")
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+from cases import CASES  # noqa: E402
+
+THRESHOLDS_FILE = BENCH_DIR / "thresholds.json"
+DEFAULT_OUTPUT = BENCH_DIR / "results" / "latest.json"
+
+
+def _git_commit() -> str | None:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_case(name: str, repeat: int) -> dict:
+    spec = CASES[name]
+    func = spec["setup"]()
+    func()  # warm caches, lazy imports and compiled patterns outside the timed runs
+    number = spec["number"]
+    runs = timeit.Timer(func).repeat(repeat=repeat, number=number)
+    per_call_ms = sorted(r / number * 1000 for r in runs)
+    return {
+        "description": spec["doc"],
+        "number": number,
+        "repeat": repeat,
+        "min_ms": round(per_call_ms[0], 4),
+        "median_ms": round(statistics.median(per_call_ms), 4),
+        "max_ms": round(per_call_ms[-1], 4),
+        "stdev_ms": round(statistics.pstdev(per_call_ms), 4),
+    }
+
+
+def check(results: dict, thresholds: dict, baseline: dict | None, tolerance: float) -> list[str]:
+    """Regression messages: absolute ceilings first, then the relative baseline check"""
+    problems = []
+    for name, result in results.items():
+        ceiling = thresholds.get(name)
+        if ceiling is not None and result["median_ms"] > ceiling:
+            problems.append(f"{name}: median {result['median_ms']} ms above ceiling {ceiling} ms")
+        previous = (baseline or {}).get(name)
+        if previous and result["median_ms"] > previous["median_ms"] * (1 + tolerance):
+            slower = result["median_ms"] / previous["median_ms"] - 1
+            problems.append(f"{name}: median {result['median_ms']} ms is {slower:.0%} slower than baseline "
+                            f"{previous['median_ms']} ms (tolerance {tolerance:.0%})")
+    return problems
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--only", nargs="+", choices=sorted(CASES), help="run only these cases")
+    parser.add_argument("--repeat", type=int, default=7, help="timed runs per case (median is compared)")
+    parser.add_argument("--output", default=str(DEFAULT_OUTPUT), help="where to write the JSON results")
+    parser.add_argument("--baseline", help="earlier results JSON to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown vs the baseline median")
+    args = parser.parse_args(argv)
+
+    thresholds = json.loads(THRESHOLDS_FILE.read_text()) if THRESHOLDS_FILE.exists() else {}
+    baseline = json.loads(Path(args.baseline).read_text())["results"] if args.baseline else None
+
+    results = {}
+    for name in args.only or CASES:
+        results[name] = run_case(name, args.repeat)
+        print(f"{name:<24} median {results[name]['median_ms']:>10.4f} ms   min {results[name]['min_ms']:>10.4f} ms")
+
+    report = {
+        "meta": {
+            "commit": _git_commit(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+        },
+        "results": results,
+    }
+    output = Path(args.output)
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2) + "\n")
+    print(f"Results written to {output}")
+
+    problems = check(results, thresholds, baseline, args.tolerance)
+    for problem in problems:
+        print(f"REGRESSION {problem}")
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
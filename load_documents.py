@@ -13,12 +13,13 @@ import sys
 sys.path.append(os.path.join(os.path.dirname(__file__), 'app'))
 
 from app.rag_utils.rag_module import run_indexer
+from app.rag_utils.paths import BASE_DIR, ROLES_DB_PATH
 
 def load_all_documents():
     """Load all documents from resources/data into the database"""
     
     # Connect to database
-    conn = sqlite3.connect("roles_docs.db")
+    conn = sqlite3.connect(ROLES_DB_PATH)
     c = conn.cursor()
     
     # Clear existing documents (optional - remove if you want to keep existing)
@@ -26,7 +27,7 @@ def load_all_documents():
     c.execute("DELETE FROM documents")
     
     # Base path to resources
-    resources_path = Path("resources/data")
+    resources_path = Path(BASE_DIR) / "resources" / "data"
     
     # Document mapping: folder -> role
     folder_role_mapping = {
@@ -1,9 +1,24 @@
+import sys
+from pathlib import Path
+
 import pytest
 
+sys.path.append(str(Path(__file__).resolve().parent.parent / "app"))
+
+@pytest.fixture(autouse=True)
+def _scratch_logs(tmp_path, monkeypatch):
+    """Keep the router traffic log and request traces of tests out of static/data"""
+    from rag_utils import query_router, tracing
+
+    for env, module, attr, name in [("ROUTER_TRAFFIC_LOG", query_router, "TRAFFIC_LOG_FILE", "router_traffic.jsonl"),
+                                    ("TRACE_FILE", tracing, "TRACE_FILE", "traces.jsonl")]:
+        monkeypatch.setenv(env, str(tmp_path / name))
+        monkeypatch.setattr(module, attr, str(tmp_path / name))
+
 @pytest.fixture(scope="function")
 def context(browser):
     return browser.new_context(record_video_dir="videos/")
 
 @pytest.fixture(scope="function")
 def page(context):
-    return context.new_page()
\ No newline at end of file
+    return context.new_page()
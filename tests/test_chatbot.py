@@ -4,9 +4,16 @@ from pathlib import Path
 # Add root directory to Python path
 sys.path.append(str(Path(__file__).resolve().parent.parent))
 
+import asyncio
+import time
 import pytest
 from fastapi.testclient import TestClient
-from app.main import app  # adjust as needed
+from app.main import app, _run_speculative  # adjust as needed
+from rag_utils.llm_client import OllamaClient
+from rag_utils.llm_scheduler import QueueFullError, get_scheduler
+from rag_utils.query_classifier import route_query, fast_classify, _count, _SQL_KEYWORD_RE, _RAG_KEYWORD_RE, SQL_KEYWORDS, RAG_KEYWORDS
+from rag_utils import jsonl_log
+from rag_utils.query_router import QueryRouter, load_query_set, load_traffic, record_route
 import io
 from unittest.mock import patch
 
@@ -74,6 +81,28 @@ def test_upload_md_doc(c_level_auth):
     assert res.status_code == 200
     assert "uploaded successfully" in res.json()["message"]
 
+def test_failed_reupload_keeps_earlier_copy(c_level_auth):
+    import duckdb
+    from app.main import DUCKDB_PATH, UPLOAD_DIR
+
+    client.post("/create-role", auth=c_level_auth, data={"role_name": "rollbackrole"})
+
+    def upload(content):
+        return client.post("/upload-docs", auth=c_level_auth, data={"role": "rollbackrole"},
+                           files={"file": ("rollback_test.csv", io.BytesIO(content), "text/csv")})
+
+    with patch("app.main.run_indexer"):
+        assert upload(b"Name,Policy\nAdmin,Compliant").status_code == 200
+    with patch("app.main.run_indexer", side_effect=RuntimeError("embedding failed")):
+        res = upload(b"Name,Policy\nAdmin,Revoked")
+
+    assert res.status_code == 500
+    filepath = Path(UPLOAD_DIR) / "rollbackrole" / "rollback_test.csv"
+    assert filepath.read_bytes() == b"Name,Policy\nAdmin,Compliant"
+    assert [p.name for p in filepath.parent.iterdir()] == ["rollback_test.csv"]
+    with duckdb.connect(str(DUCKDB_PATH)) as duck_conn:
+        assert duck_conn.execute("SELECT Policy FROM rollback_test").fetchall() == [("Compliant",)]
+
 @patch("app.main.detect_query_type_llm", return_value="RAG")
 @patch("app.main.ask_rag", return_value={"answer": "This is RAG response"})
 def test_chat_rag_mode(mock_ask_rag, mock_detect, c_level_auth):
@@ -99,6 +128,165 @@ def test_chat_sql_mode(mock_ask_csv, mock_detect, c_level_auth):
     assert res.json()["answer"] == "Here is the SQL data"
     assert "sql" in res.json()
 
+@patch("app.main.route_query", return_value=(None, 0.5, "router"))
+@patch("app.main.ask_csv", return_value={"answer": "Failed to generate SQL query", "error": True})
+@patch("app.main.ask_rag", return_value={"answer": "Handbook answer", "sources": ["employee_handbook.md"]})
+def test_chat_speculative_uses_first_valid_result(mock_ask_rag, mock_ask_csv, mock_fast, c_level_auth):
+    res = client.post(
+        "/chat",
+        auth=c_level_auth,
+        json={"question": "Remote work rules"}
+    )
+    assert res.status_code == 200
+    # Both paths start together; the failed SQL attempt does not delay the RAG answer
+    mock_ask_csv.assert_called_once()
+    assert res.json()["speculative"] is True
+    assert res.json()["mode"] == "RAG"
+    assert res.json()["answer"] == "Handbook answer"
+
+def test_client_error_ends_half_open_probe(monkeypatch):
+    from types import SimpleNamespace
+    from rag_utils.llm_client import LLMError
+
+    llm = OllamaClient()
+    for _ in range(llm.breaker.failure_threshold):
+        llm.breaker.record_failure()
+    llm.breaker._opened_at -= llm.breaker.reset_seconds  # due for a probe
+    monkeypatch.setattr(llm.session, "post", lambda *a, **kw: SimpleNamespace(status_code=404, text="model not found"))
+
+    with pytest.raises(LLMError):
+        llm._post_with_retries("/api/generate", {}, 1)
+    assert llm.breaker.state == "closed" and llm.breaker.allow()
+
+
+@pytest.mark.parametrize("lane_busy", [False, True])
+def test_speculative_loser_makes_no_llm_call_after_winner_returns(monkeypatch, lane_busy):
+    llm = OllamaClient()
+    calls = []
+    monkeypatch.setattr(llm, "start_health_monitor", lambda: None)
+    monkeypatch.setattr(llm, "_post_with_retries", lambda path, payload, timeout: calls.append(path) or {"response": "late"})
+    scheduler = get_scheduler("generate")
+
+    async def fake_csv(*args, **kwargs):
+        await asyncio.sleep(0.2)
+        return {"answer": "| n |\n|---|\n| 3 |", "sql": "SELECT 3"}
+
+    async def fake_rag(*args, **kwargs):
+        def answer():
+            if not lane_busy:
+                time.sleep(0.4)  # still retrieving when SQL wins
+            return llm.generate("prompt")  # otherwise queued behind the busy lane
+        return {"answer": await asyncio.to_thread(answer), "sources": ["employee_handbook.md"]}
+
+    monkeypatch.setattr("app.main.ask_csv", fake_csv)
+    monkeypatch.setattr("app.main.ask_rag", fake_rag)
+    held = scheduler.max_concurrency if lane_busy else 0
+    cancelled = scheduler.stats()["cancelled"]
+    for _ in range(held):
+        scheduler.acquire()
+    try:
+        # asyncio.run returns only after the loser's worker thread has finished
+        result, mode = asyncio.run(_run_speculative("How many employees?", "HR", "admin", "brief", []))
+    finally:
+        for _ in range(held):
+            scheduler.release()
+
+    assert mode == "SQL" and result["sql"] == "SELECT 3"
+    assert calls == []
+    # A queued wait is dropped as soon as the branch loses, not when it times out
+    assert scheduler.stats()["queued"] == 0
+    assert scheduler.stats()["cancelled"] == cancelled + int(lane_busy)
+
+@patch("app.main.detect_query_type_llm", return_value="SQL")
+@patch("app.main.ask_csv", return_value={"answer": "| name |\n|---|\n" + "| Aadhya |\n" * 100, "sql": "SELECT name FROM hr_data"})
+def test_chat_session_keeps_bounded_history(mock_ask_csv, mock_detect, c_level_auth):
+    first = client.post("/chat", auth=c_level_auth, json={"question": "List all employees in HR"}).json()
+    session_id = first["session_id"]
+    client.post("/chat", auth=c_level_auth, json={"question": "Only those in Mumbai", "session_id": session_id})
+
+    # The second call sees the first turn, with the large table replaced by a reference
+    history = mock_ask_csv.call_args.kwargs["history"]
+    assert history[0] == {"role": "user", "content": "List all employees in HR"}
+    assert history[1]["content"].startswith("[Result res-1: 100 rows, columns name")
+
+    artifact = client.get(f"/sessions/{session_id}/artifacts/res-1", auth=c_level_auth)
+    assert artifact.json()["content"] == first["answer"]
+    assert client.get(f"/sessions/{session_id}", auth=("testuser", "testpass")).status_code in (401, 404)
+
+def test_metrics_endpoint_exposes_prometheus_text(c_level_auth):
+    client.get("/login", auth=c_level_auth)
+    res = client.get("/metrics")
+    assert res.status_code == 200
+    assert res.headers["content-type"].startswith("text/plain")
+    assert 'rag_cache_events_total{cache="auth",event="hit"}' in res.text
+    assert 'ollama_queue_depth{lane="generate",state="queued"} 0.0' in res.text
+    assert "# TYPE rag_stage_duration_seconds histogram" in res.text
+
+@patch("app.main.detect_query_type_llm", return_value="RAG")
+@patch("app.main.ask_rag", return_value={"answer": "Policy answer", "sources": ["employee_handbook.md"]})
+def test_chat_returns_server_timing(mock_ask_rag, mock_detect, c_level_auth):
+    res = client.post("/chat", auth=c_level_auth, json={"question": "Explain the leave policy", "include_timings": True})
+    assert res.status_code == 200
+    assert "total;dur=" in res.headers["Server-Timing"]
+    assert res.json()["timings"]["request_id"] == res.headers["X-Request-ID"]
+
+def test_unhandled_error_still_exports_trace(tmp_path):
+    import json
+
+    failing = TestClient(app, raise_server_exceptions=False)
+    with patch("app.main.render_metrics", side_effect=RuntimeError("boom")):
+        res = failing.get("/metrics", headers={"X-Request-ID": "failing-request"})
+    jsonl_log.flush()
+
+    assert res.status_code == 500
+    entry = json.loads((tmp_path / "traces.jsonl").read_text().splitlines()[-1])
+    assert entry["request_id"] == "failing-request"
+    assert entry["attributes"] == {"status": 500, "error": "RuntimeError"}
+    assert entry["duration_ms"] is not None
+
+def test_route_query_rules_then_router():
+    assert route_query("How many employees joined in 2023?") == ("SQL", 1.0, "rules")
+    mode, confidence, source = route_query("Which location has the largest team?")
+    assert source == "router" and mode == "SQL" and confidence >= 0.8
+
+    router = QueryRouter().fit([("average salary per department", "SQL"), ("explain the leave policy", "RAG")])
+    assert router.predict("salary per location")[0] == "SQL"
+    assert router.predict("leave policy details")[0] == "RAG"
+
+def test_route_log_is_written_in_background_and_capped(tmp_path, monkeypatch):
+    monkeypatch.setattr("rag_utils.query_router.TRAFFIC_LOG_MAX_BYTES", 200)
+    for i in range(20):
+        record_route(f"How many employees joined in {2000 + i}?", "SQL")
+    record_route("Which route won the race?", "speculative")  # not a label
+    jsonl_log.flush()
+
+    log = tmp_path / "router_traffic.jsonl"
+    assert log.stat().st_size <= 200 and (tmp_path / "router_traffic.jsonl.1").stat().st_size <= 200
+    traffic = load_traffic()
+    assert traffic[-1] == ("How many employees joined in 2019?", "SQL")
+    assert len(traffic) < 20 and {mode for _, mode in traffic} == {"SQL"}
+
+def test_keyword_counts_match_the_list_scan():
+    questions = [q for q, _ in load_query_set()] + ["Which employees joined in 2020?", "employees located in Mumbai"]
+    assert len(questions) > 50
+    for question in questions:
+        q = question.lower()
+        assert _count(_SQL_KEYWORD_RE, q) == sum(1 for kw in SQL_KEYWORDS if kw in q), question
+        assert _count(_RAG_KEYWORD_RE, q) == sum(1 for kw in RAG_KEYWORDS if kw in q), question
+    # "employee" and "employees" overlap and count as two keywords
+    for question in ["Which employees joined in 2020?", "employees located in Mumbai", "what about employees"]:
+        assert fast_classify(question) == "SQL"
+
+@patch("app.main.detect_query_type_llm", side_effect=QueueFullError("generate queue is full", retry_after=7))
+def test_chat_rejects_when_llm_queue_full(mock_detect, c_level_auth):
+    res = client.post(
+        "/chat",
+        auth=c_level_auth,
+        json={"question": "Summarize the handbook"}
+    )
+    assert res.status_code == 429
+    assert res.headers["Retry-After"] == "7"
+
 def test_create_role_no_auth():
     res = client.post("/create-role", data={"role_name": "bad"})
     assert res.status_code == 401 or res.status_code == 403
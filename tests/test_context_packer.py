@@ -0,0 +1,34 @@
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parent.parent / "app"))
+
+from langchain_core.documents import Document
+from rag_utils.context_packer import pack_context, estimate_tokens
+
+
+def _doc(text, source="report.md"):
+    return Document(page_content=text, metadata={"source": source})
+
+
+def test_pack_context_removes_overlap_and_duplicates():
+    first = "Leave policy. " * 5 + "Employees get 24 days of paid leave per year."
+    # Splitter overlap: the second chunk starts with the tail of the first
+    second = "Employees get 24 days of paid leave per year. Unused leave carries over."
+    duplicate = _doc(first, source="handbook_copy.md")
+
+    packed, stats = pack_context([_doc(first), _doc(second), duplicate], "brief")
+
+    assert [d.page_content for d in packed] == [first, "Unused leave carries over."]
+    assert stats["duplicates_dropped"] == 1
+    assert stats["tokens_saved"] > 0
+
+
+def test_pack_context_respects_budget():
+    docs = [_doc(f"Section {i}. " + "Revenue grew in every quarter. " * 40, source=f"q{i}.md") for i in range(5)]
+    packed, stats = pack_context(docs, "brief", budget=300)
+
+    assert stats["tokens_out"] <= 300
+    assert sum(estimate_tokens(d.page_content) for d in packed) == stats["tokens_out"]
+    # Most relevant (first) chunk is kept
+    assert packed[0].page_content.startswith("Section 0.")
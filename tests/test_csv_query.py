@@ -0,0 +1,86 @@
+import sys
+from pathlib import Path
+
+# Add the app directory to Python path so rag_utils imports resolve like in main.py
+sys.path.append(str(Path(__file__).resolve().parent.parent / "app"))
+
+import duckdb
+import pandas as pd
+import pytest
+
+from rag_utils import table_profile, sql_guard
+from rag_utils.csv_query import is_safe_query, extract_tables_from_sql
+
+
+@pytest.fixture
+def duck_factory(tmp_path):
+    db_path = str(tmp_path / "test.duckdb")
+    df = pd.DataFrame({
+        "employee_id": ["E1", "E2", "E3", "E4"],
+        "department": ["HR", "Finance", "HR", "Sales"],
+        "salary": [100.0, 200.0, 300.0, 400.0],
+    })
+    with duckdb.connect(db_path) as duck_conn:
+        duck_conn.execute("CREATE TABLE staff AS SELECT * FROM df")
+    table_profile.invalidate_profile_cache()
+    yield lambda: duckdb.connect(db_path)
+    table_profile.invalidate_profile_cache()
+
+
+def test_profile_is_materialized(duck_factory):
+    with duck_factory() as duck_conn:
+        profile = table_profile.build_table_profile(duck_conn, "staff")
+        stored = table_profile.load_table_profile(duck_conn, "staff")
+
+    assert profile["row_count"] == 4
+    assert stored["columns"]["salary"]["mean"] == 250.0
+    assert stored["columns"]["department"]["values"][0] == ("HR", 2)
+    # Unique id columns get no value frequencies
+    assert stored["columns"]["employee_id"]["values"] is None
+
+
+def test_answer_from_profile(duck_factory):
+    by_dept = table_profile.answer_from_profile("How many employees by department?", ["staff"], duck_factory)
+    assert by_dept["sql"].startswith("SELECT department, COUNT(*)")
+    assert "HR" in by_dept["answer"]
+
+    avg = table_profile.answer_from_profile("What is the average salary?", ["staff"], duck_factory)
+    assert "250" in avg["answer"]
+
+    # Filtered questions still need generated SQL
+    assert table_profile.answer_from_profile("How many employees earn more than 150?", ["staff"], duck_factory) is None
+
+
+def test_profile_failures_are_cached(duck_factory):
+    opened = []
+
+    def factory():
+        opened.append(1)
+        return duck_factory()
+
+    assert table_profile.get_table_profile("missing_table", factory) is None
+    assert table_profile.profiles_cached(["missing_table"])
+    assert table_profile.get_table_profile("missing_table", factory) is None
+    assert len(opened) == 1
+
+
+def test_guard_caps_rows_and_rejects_cross_joins(duck_factory):
+    with duck_factory() as duck_conn:
+        rows, columns, truncated = sql_guard.run_guarded_query(duck_conn, "SELECT * FROM staff a, staff b", max_rows=5)
+        assert len(rows) == 5 and truncated
+        assert columns[0] == "employee_id"
+
+        with pytest.raises(sql_guard.QueryRejected):
+            sql_guard.run_guarded_query(duck_conn, "SELECT * FROM range(100000) a, range(100000) b")
+
+
+def test_sql_validation_uses_parser():
+    # Column names containing forbidden words are fine
+    assert is_safe_query("SELECT created_at, updated_by FROM hr_data")
+    assert not is_safe_query("DELETE FROM hr_data")
+    assert not is_safe_query("SELECT 1; DROP TABLE hr_data")
+    assert not is_safe_query("SELECT * FROM read_csv('/etc/passwd')")
+
+    sql = 'WITH top AS (SELECT * FROM "Hr Data") SELECT * FROM top JOIN teams ON top.id = teams.id ' \
+          'WHERE id IN (SELECT id FROM audits)'
+    assert sorted(extract_tables_from_sql(sql)) == ["Hr Data", "audits", "teams"]
@@ -0,0 +1,64 @@
+import sys
+import threading
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parent.parent / "app"))
+
+from rag_utils.embed_batcher import EmbeddingBatcher
+
+
+def _embed_concurrently(batcher, texts):
+    results, errors = {}, []
+
+    def call(text):
+        try:
+            results[text] = batcher.embed(text, timeout=5)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=call, args=(text,)) for text in texts]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return results, errors
+
+
+def test_concurrent_queries_share_batches_and_get_their_own_vectors():
+    calls = []
+
+    def send(texts):
+        calls.append(list(texts))
+        return [[float(len(text))] for text in texts]
+
+    batcher = EmbeddingBatcher(send, window_ms=200, max_batch=8)
+    texts = [f"question {'x' * i}" for i in range(16)]
+    results, errors = _embed_concurrently(batcher, texts)
+
+    assert not errors
+    assert results == {text: [float(len(text))] for text in texts}
+    assert sum(len(c) for c in calls) == 16
+    assert len(calls) < 16 and max(len(c) for c in calls) <= 8
+
+
+def test_identical_queries_in_a_batch_are_sent_once():
+    calls = []
+
+    def send(texts):
+        calls.append(list(texts))
+        return [[1.0] for _ in texts]
+
+    results, errors = _embed_concurrently(EmbeddingBatcher(send, window_ms=200), ["same"] * 5 + ["other"])
+
+    assert not errors and results == {"same": [1.0], "other": [1.0]}
+    assert sorted(t for c in calls for t in c) == ["other", "same"]
+
+
+def test_send_errors_reach_every_caller():
+    def send(texts):
+        raise RuntimeError("ollama down")
+
+    results, errors = _embed_concurrently(EmbeddingBatcher(send, window_ms=50), ["a", "b", "c"])
+
+    assert results == {}
+    assert len(errors) == 3 and all(isinstance(e, RuntimeError) for e in errors)
@@ -0,0 +1,83 @@
+import sys
+import asyncio
+import json
+from pathlib import Path
+
+import pytest
+
+sys.path.append(str(Path(__file__).resolve().parent.parent / "app"))
+
+from langchain_core.documents import Document
+from rag_evaluator import evaluator, eval_store
+
+
+class FakeChain:
+    def __init__(self, fail_on=()):
+        self.calls = 0
+        self.fail_on = set(fail_on)
+
+    def invoke(self, inputs):
+        self.calls += 1
+        if inputs["query"] in self.fail_on:
+            raise RuntimeError("chain crashed")
+        return {"result": f"answer to {inputs['query']}", "source_documents": [Document(page_content="context")]}
+
+
+def test_eval_resumes_from_checkpoint_and_reuses_judge(tmp_path, monkeypatch):
+    judged = []
+
+    def fake_judge(question, predicted, contexts, reference):
+        judged.append(question)
+        return '{"faithfulness": 1.0, "relevancy": 1.0, "context_recall": 1.0}'
+
+    monkeypatch.setattr(evaluator, "evaluate_with_openai", fake_judge)
+    monkeypatch.setattr(evaluator, "JUDGE_CACHE_FILE", str(tmp_path / "judge.jsonl"))
+    monkeypatch.setattr(eval_store, "EVAL_STORE_FILE", str(tmp_path / "runs.duckdb"))
+    qa_list = [{"question": f"q{i}", "answer": f"a{i}", "role": "finance" if i % 2 else "hr"} for i in range(5)]
+    output = str(tmp_path / "results.csv")
+
+    config = {"retriever": "similarity", "k": 4}
+    checkpoint = Path(evaluator.checkpoint_path(output))
+
+    # A run that crashes on q3 keeps the items it finished in its checkpoint
+    chain = FakeChain(fail_on={"q3"})
+    with pytest.raises(RuntimeError):
+        asyncio.run(evaluator.run_rag_eval_async(qa_list, None, output, concurrency=1, qa_chain=chain, config=config))
+    assert checkpoint.exists()
+
+    # Resumed run: only the two unfinished items are answered and judged; the checkpoint goes once all are done
+    chain = FakeChain()
+    rows = asyncio.run(evaluator.run_rag_eval_async(qa_list, None, output, concurrency=2, qa_chain=chain, config=config))
+    assert chain.calls == 2 and len(rows) == 5
+    assert sorted(judged) == ["q0", "q1", "q2", "q3", "q4"]
+    assert not checkpoint.exists()
+
+    # The next run answers everything again instead of replaying stale rows; unchanged ones are not re-judged
+    chain = FakeChain()
+    asyncio.run(evaluator.run_rag_eval_async(qa_list, None, output, qa_chain=chain, config=config))
+    assert chain.calls == 5 and len(judged) == 5
+
+    # A crashed run's items are not reused by a run with another configuration
+    with pytest.raises(RuntimeError):
+        asyncio.run(evaluator.run_rag_eval_async(qa_list, None, output, concurrency=1,
+                                                 qa_chain=FakeChain(fail_on={"q4"}), config=config))
+    chain = FakeChain()
+    asyncio.run(evaluator.run_rag_eval_async(qa_list, None, output, qa_chain=chain, config={**config, "k": 2}))
+    assert chain.calls == 5
+
+    # Every completed run is recorded with typed metrics; summaries are SQL aggregations
+    assert len(eval_store.compare_runs()) == 3
+    assert eval_store.summary()["items"] == 5 and eval_store.summary()["faithfulness"] == 1.0
+    assert [(r["role"], r["items"]) for r in eval_store.role_summary()] == [("finance", 2), ("hr", 3)]
+
+
+def test_judge_exceptions_are_reported_as_errors(tmp_path, monkeypatch):
+    def broken_judge(*args):
+        raise ValueError("bad response")
+
+    monkeypatch.setattr(evaluator, "evaluate_with_openai", broken_judge)
+    cache = evaluator.JsonlStore(str(tmp_path / "judge.jsonl"))
+    scores = evaluator.judge_cached("q", "p", "c", "g", cache)
+
+    assert json.loads(scores) == {"error": "Judge failed: bad response"}
+    assert cache.records == {}
@@ -0,0 +1,113 @@
+import sys
+import threading
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+sys.path.append(str(Path(__file__).resolve().parent.parent / "app"))
+
+from rag_utils import ollama_langchain
+from rag_utils.flat_index import FlatVectorIndex, build_flat_index
+from rag_utils.ollama_langchain import PooledOllamaEmbeddings
+
+
+class FakeCollection:
+    """The slice of Chroma's collection API the export uses"""
+
+    def __init__(self, vectors, metadatas):
+        self.vectors, self.metadatas = vectors, metadatas
+
+    def get(self, include, limit, offset):
+        rows = range(offset, min(offset + limit, len(self.vectors)))
+        return {"ids": [str(i) for i in rows], "embeddings": [self.vectors[i] for i in rows],
+                "metadatas": [self.metadatas[i] for i in rows], "documents": [f"chunk {i}" for i in rows]}
+
+
+@pytest.mark.parametrize("dtype", ["float16", "int8"])
+def test_search_matches_exact_cosine_within_role(tmp_path, dtype):
+    rng = np.random.default_rng(0)
+    vectors = rng.normal(size=(300, 32)).astype(np.float32)
+    metadatas = [{"role": ("hr", "finance", "general")[i % 3], "source": f"doc{i}.md"} for i in range(300)]
+    build_flat_index(FakeCollection(vectors, metadatas), str(tmp_path), dtype)
+    index = FlatVectorIndex(embeddings=None, directory=str(tmp_path))
+
+    query = rng.normal(size=32)
+    docs = index.similarity_search_by_vector(query, k=5, filter={"role": "finance"})
+
+    rows = np.arange(1, 300, 3)
+    normalized = vectors[rows] / np.linalg.norm(vectors[rows], axis=1, keepdims=True)
+    expected = rows[np.argsort(-(normalized @ query))[:5]]
+    assert [d.page_content for d in docs] == [f"chunk {i}" for i in expected]
+    assert all(d.metadata["role"] == "finance" for d in docs)
+    assert len(index.max_marginal_relevance_search_by_vector(query, k=3, fetch_k=10, filter={"role": "hr"})) == 3
+    assert index.similarity_search_by_vector(query, k=3, filter={"role": "unknown"}) == []
+    mixed = index.similarity_search_by_vector(query, k=6, filter={"role": {"$in": ["hr", "general"]}})
+    assert len(mixed) == 6 and {d.metadata["role"] for d in mixed} <= {"hr", "general"}
+
+
+def test_new_export_is_picked_up(tmp_path):
+    vectors = np.eye(4, dtype=np.float32)
+    build_flat_index(FakeCollection(vectors[:2], [{"role": "hr"}] * 2), str(tmp_path))
+    index = FlatVectorIndex(embeddings=None, directory=str(tmp_path))
+    assert len(index.similarity_search_by_vector(vectors[0], k=10)) == 2
+
+    build_flat_index(FakeCollection(vectors, [{"role": "hr"}] * 4), str(tmp_path))
+    assert len(index.similarity_search_by_vector(vectors[0], k=10)) == 4
+
+
+
+def test_concurrent_first_builds_export_once(tmp_path):
+    calls = []
+
+    class CountingCollection(FakeCollection):
+        def get(self, include, limit, offset):
+            if offset == 0:
+                calls.append(offset)
+            return super().get(include, limit, offset)
+
+    collection = CountingCollection(np.eye(4, dtype=np.float32), [{"role": "hr"}] * 4)
+    threads = [threading.Thread(target=build_flat_index, args=(collection, str(tmp_path)),
+                                kwargs={"if_missing": True}) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert len(calls) == 1
+    assert len([p for p in tmp_path.iterdir() if p.is_dir()]) == 1
+    index = FlatVectorIndex(embeddings=None, directory=str(tmp_path))
+    assert len(index.similarity_search_by_vector(np.eye(4)[0], k=10)) == 4
+
+    # A forced export replaces the version; a newer directory (an export in progress) is left alone
+    newer = tmp_path / "99991231235959-000000000-1"
+    newer.mkdir()
+    manifest = build_flat_index(collection, str(tmp_path))
+    assert sorted(p.name for p in tmp_path.iterdir() if p.is_dir()) == [manifest["version"], newer.name]
+
+def test_batched_query_vectors_rank_like_exact_ones(tmp_path, monkeypatch):
+    rng = np.random.default_rng(1)
+    vectors = rng.normal(size=(200, 16)).astype(np.float32) * 20  # /api/embeddings vectors are not unit length
+    build_flat_index(FakeCollection(vectors, [{"role": "hr"}] * 200), str(tmp_path))
+    exact = {f"query: q{i}": (rng.normal(size=16) * 20).tolist() for i in range(10)}
+
+    class FakeClient:
+        def embed(self, prompt, model=None):
+            return exact[prompt]
+
+    class FakeBatcher:
+        def embed(self, prompt):  # /api/embed: the same direction, unit length
+            return (np.asarray(exact[prompt]) / np.linalg.norm(exact[prompt])).tolist()
+
+    monkeypatch.setattr(ollama_langchain, "EMBED_BATCH_WINDOW_MS", 5)
+    monkeypatch.setattr(ollama_langchain, "get_llm_client", lambda: FakeClient())
+    monkeypatch.setattr(ollama_langchain, "get_embed_batcher", lambda model: FakeBatcher())
+    batched = PooledOllamaEmbeddings(batch_queries=True)
+    single = PooledOllamaEmbeddings()
+
+    for i in range(10):
+        assert batched.embed_query(f"q{i}") != single.embed_query(f"q{i}")
+        results = [FlatVectorIndex(embeddings, str(tmp_path)).similarity_search(f"q{i}", k=5) for embeddings in (batched, single)]
+        assert [d.page_content for d in results[0]] == [d.page_content for d in results[1]]
+    # Without batching (the Chroma default) the exact vector is used
+    assert single.embed_query("q0") == exact["query: q0"]
@@ -0,0 +1,51 @@
+import sys
+import json
+import logging
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parent.parent / "app"))
+
+from rag_utils.logging_setup import DebugSampler, JsonFormatter, RequestIdFilter
+from rag_utils import jsonl_log
+from rag_utils.tracing import start_trace, export_trace
+
+
+def _record(level, msg, *args):
+    return logging.LogRecord("rag.test", level, __file__, 1, msg, args, None)
+
+
+def test_debug_sampler_keeps_every_nth_per_template():
+    sampler = DebugSampler(every=5)
+    kept = [sampler.filter(_record(logging.DEBUG, "Schema rows: %s", i)) for i in range(10)]
+    assert kept.count(True) == 2
+    # Other templates are counted separately; other levels always pass
+    assert sampler.filter(_record(logging.DEBUG, "Extracted SQL: %s", "SELECT 1"))
+    assert all(sampler.filter(_record(logging.WARNING, "Schema rows: %s", i)) for i in range(3))
+
+
+def test_json_records_carry_request_id_and_extra_fields():
+    trace = start_trace("test")
+    record = _record(logging.INFO, "SQL answer with %d row(s)", 3)
+    record.sql = "SELECT 1"
+    RequestIdFilter().filter(record)
+
+    entry = json.loads(JsonFormatter().format(record))
+
+    assert entry["msg"] == "SQL answer with 3 row(s)"
+    assert entry["request_id"] == trace.request_id
+    assert entry["sql"] == "SELECT 1"
+    assert entry["level"] == "info"
+
+
+def test_traces_are_exported_to_a_capped_file(tmp_path, monkeypatch):
+    monkeypatch.setattr("rag_utils.tracing.TRACE_ALL", True)
+    monkeypatch.setattr("rag_utils.tracing.TRACE_MAX_BYTES", 600)
+    for _ in range(10):
+        trace = start_trace("chat")
+        trace.finish()
+        export_trace(trace)
+    jsonl_log.flush()
+
+    current, rotated = tmp_path / "traces.jsonl", tmp_path / "traces.jsonl.1"
+    assert current.stat().st_size <= 600 and rotated.stat().st_size <= 600
+    assert json.loads(current.read_text().splitlines()[-1])["request_id"] == trace.request_id
@@ -0,0 +1,44 @@
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parent.parent / "app"))
+
+from rag_utils import query_condenser
+from rag_utils.query_condenser import condense_question, compact_history
+
+HISTORY = [
+    {"role": "user", "content": "Explain the leave policy"},
+    {"role": "assistant", "content": "Employees get 24 days of paid leave. " * 20},
+]
+
+
+def test_condense_rewrites_follow_ups_without_llm(monkeypatch):
+    monkeypatch.setattr(query_condenser, "CONDENSE_WITH_LLM", False)
+
+    assert condense_question("Does it apply to interns?", HISTORY) == "Does the leave policy apply to interns?"
+    # Standalone questions and questions without history are left alone
+    assert condense_question("Summarize the marketing report", HISTORY) == "Summarize the marketing report"
+    assert condense_question("Does it apply to interns?", []) == "Does it apply to interns?"
+    # Rules cannot resolve an ellipsis; only the previous question is added, not the answer
+    assert condense_question("What about Finance?", HISTORY) == "Explain the leave policy; What about Finance?"
+
+
+def test_standalone_questions_are_not_rewritten(monkeypatch):
+    def fail(question, previous):
+        raise AssertionError(f"LLM rewrite requested for {question!r}")
+
+    monkeypatch.setattr(query_condenser, "_llm_rewrite", fail)
+    for question in [
+        "Is it possible to work remotely?",
+        "It is mandatory to wear badges at the office?",
+        "How many employees?",
+        "Revenue this year",
+        "List these employees by department",
+    ]:
+        assert condense_question(question, HISTORY) == question
+
+
+def test_compact_history_is_bounded():
+    compact = compact_history(HISTORY * 5)
+    assert len(compact.splitlines()) == 2
+    assert len(compact) < 500
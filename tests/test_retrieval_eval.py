@@ -0,0 +1,63 @@
+import sys
+from pathlib import Path
+
+import numpy as np
+
+sys.path.append(str(Path(__file__).resolve().parent.parent / "app"))
+
+from langchain_core.documents import Document
+from rag_evaluator.retrieval_eval import mmr, score, retrieval_partitions
+from rag_utils.retrievers import PartitionedMMRRetriever
+
+
+def test_score_recall_mrr_ndcg():
+    relevance = np.array([
+        [1, 0, 1],  # hit at rank 1, 2 of 2 available relevant chunks retrieved
+        [0, 1, 0],  # hit at rank 2
+        [0, 0, 0],  # miss
+    ], dtype=float)
+    metrics = score(relevance, np.array([2, 5, 3]))
+
+    assert metrics["recall"].tolist() == [1.0, 1.0, 0.0]
+    assert metrics["mrr"].tolist() == [1.0, 0.5, 0.0]
+    assert metrics["ndcg"][0] == (1 + 1 / np.log2(4)) / (1 + 1 / np.log2(3))
+    assert metrics["ndcg"][2] == 0.0
+
+
+def test_mmr_prefers_diverse_candidates():
+    query = np.array([1.0, 0.0])
+    near = np.array([0.99, np.sqrt(1 - 0.99 ** 2)])
+    candidates = np.stack([near, near, np.array([0.6, 0.8])])
+
+    assert mmr(query, candidates, k=2, lambda_mult=1.0) == [0, 1]
+    assert mmr(query, candidates, k=2, lambda_mult=0.3) == [0, 2]
+
+
+def test_retrieval_partitions_keep_the_chunk_budgets():
+    # Brief: one search over role + General documents; extended: role documents with General behind them
+    assert retrieval_partitions("hr", "brief", general_k=0) == [({"role": {"$in": ["hr", "general"]}}, 2)]
+    assert retrieval_partitions("hr", "extended", general_k=0) == [({"role": "hr"}, 3), ({"role": "general"}, 1)]
+    assert retrieval_partitions("hr", "brief", general_k=1) == [({"role": "hr"}, 2), ({"role": "general"}, 1)]
+
+
+class FakeStore:
+    """Role-filtered search over fixed documents, ignoring the query vector"""
+
+    class embeddings:
+        @staticmethod
+        def embed_query(query):
+            return [1.0]
+
+    docs = [Document(page_content=f"hr {i}", metadata={"role": "hr"}) for i in range(5)] + [
+        Document(page_content="Remote work is allowed two days a week", metadata={"role": "general"})]
+
+    def max_marginal_relevance_search_by_vector(self, embedding, k, fetch_k, lambda_mult, filter):
+        roles = filter["role"]["$in"] if isinstance(filter["role"], dict) else [filter["role"]]
+        return [d for d in self.docs if d.metadata["role"] in roles][:k]
+
+
+def test_extended_answers_see_general_documents():
+    retriever = PartitionedMMRRetriever(vectorstore=FakeStore(), partitions=retrieval_partitions("hr", "extended"))
+    docs = retriever.invoke("How many remote days are allowed?")
+    assert [d.metadata["role"] for d in docs] == ["hr", "hr", "hr", "general"]
+    assert "Remote work" in docs[-1].page_content
@@ -0,0 +1,41 @@
+import sys
+import threading
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parent.parent / "app"))
+
+from rag_utils import sessions
+from rag_utils.sessions import Session
+
+
+def _table(rows: int, tag: str = "x") -> str:
+    return "| name |\n|---|\n" + f"| {tag} |\n" * rows
+
+
+def test_artifacts_are_capped_least_recently_used_first(monkeypatch):
+    monkeypatch.setattr(sessions, "MAX_ARTIFACTS", 3)
+    session = Session("admin")
+    for i in range(4):
+        session.add("assistant", _table(50, str(i)))
+        if i == 1:
+            session.get_artifact("res-1")  # used again, so res-2 is the oldest
+
+    assert list(session.artifacts) == ["res-1", "res-3", "res-4"]
+    assert session.get_artifact("res-2") is None
+
+    monkeypatch.setattr(sessions, "MAX_ARTIFACT_BYTES", 400)
+    session.add("assistant", _table(80))
+    assert list(session.artifacts) == ["res-5"]  # newest is kept even over the budget
+    assert session.artifact_bytes == len(session.artifacts["res-5"])
+
+
+def test_concurrent_adds_get_distinct_references(monkeypatch):
+    monkeypatch.setattr(sessions, "MAX_ARTIFACTS", 1000)
+    session = Session("admin")
+    threads = [threading.Thread(target=lambda: [session.add("assistant", _table(50)) for _ in range(25)]) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(session.artifacts) == 200
+    assert set(session.artifacts) == {f"res-{i}" for i in range(1, 201)}
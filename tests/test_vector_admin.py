@@ -0,0 +1,76 @@
+import sys
+import sqlite3
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parent.parent / "app"))
+
+from rag_utils import rag_module, vector_admin
+
+
+def _setup(tmp_path, monkeypatch):
+    db_path = str(tmp_path / "roles_docs.db")
+    chroma_dir = str(tmp_path / "chroma_db")
+    for module in (rag_module, vector_admin):
+        monkeypatch.setattr(module, "CHROMA_DIR", chroma_dir)
+    monkeypatch.setattr(vector_admin, "ROLES_DB_PATH", db_path)
+    monkeypatch.setattr(vector_admin, "DUCKDB_FILE", str(tmp_path / "structured.duckdb"))
+    monkeypatch.setattr(rag_module, "get_embeddings", lambda: None)
+    monkeypatch.setattr(rag_module, "_VECTORSTORE", None)
+
+    conn = sqlite3.connect(db_path)
+    conn.execute("CREATE TABLE documents (id INTEGER PRIMARY KEY, filename TEXT, role TEXT, filepath TEXT, "
+                 "headers_str TEXT, embedded INTEGER)")
+    conn.executemany("INSERT INTO documents VALUES (?, ?, ?, ?, NULL, 1)", [
+        (1, "a.md", "HR", "a.md"),
+        (2, "a.md", "HR", "a.md"),  # re-upload of the same file
+        (3, "b.md", "Finance", "b.md"),
+    ])
+    conn.commit()
+    conn.close()
+
+    chunks = [
+        ("c1", "old a", {"role": "hr", "source": "a.md", "doc_id": 1}),
+        ("c2", "new a", {"role": "hr", "source": "a.md", "doc_id": 2}),
+        ("c3", "more a", {"role": "hr", "source": "a.md", "doc_id": 2}),
+        ("c4", "b", {"role": "finance", "source": "b.md"}),  # indexed before chunks had a doc_id
+        ("c5", "b", {"role": "finance", "source": "b.md"}),  # exact duplicate
+        ("c6", "gone", {"role": "hr", "source": "gone.md", "doc_id": 9}),  # document deleted
+    ]
+    rag_module.get_vectorstore()._collection.add(
+        ids=[c[0] for c in chunks], documents=[c[1] for c in chunks], metadatas=[c[2] for c in chunks],
+        embeddings=[[float(i), 1.0, 0.0] for i in range(len(chunks))],
+    )
+
+
+def test_compact_removes_superseded_orphaned_and_duplicate_chunks(tmp_path, monkeypatch):
+    _setup(tmp_path, monkeypatch)
+    assert vector_admin.vector_stats()["by_role"] == {"finance": 2, "hr": 4}
+
+    report = vector_admin.compact()
+
+    assert report["superseded_documents"] == [1]
+    assert (report["orphaned_chunks"], report["duplicate_chunks"]) == (1, 1)
+    assert report["after"]["chunks"] == 3
+    stats = vector_admin.vector_stats()
+    assert stats["by_source"] == {"a.md": 2, "b.md": 1}
+    assert sorted(rag_module.get_vectorstore()._collection.get()["ids"]) == ["c2", "c3", "c4"]
+
+    removed = vector_admin.remove_document(3)
+    assert removed["chunks_deleted"] == 1
+    assert vector_admin.vector_stats()["by_role"] == {"hr": 2}
+    assert vector_admin.remove_document(3) is None
+
+
+def test_remove_superseded_keeps_the_new_copy(tmp_path, monkeypatch):
+    _setup(tmp_path, monkeypatch)
+    collection = rag_module.get_vectorstore()._collection
+    collection.add(ids=["c7"], documents=["legacy a"], metadatas=[{"role": "hr", "source": "a.md"}],
+                   embeddings=[[7.0, 1.0, 0.0]])
+
+    removed = vector_admin.remove_superseded("a.md", "hr")
+
+    # The old row goes with its own and its pre-doc_id chunks; the re-upload (doc 2) stays
+    assert [(r["doc_id"], r["chunks_deleted"]) for r in removed] == [(1, 2)]
+    assert sorted(collection.get(where={"source": "a.md"})["ids"]) == ["c2", "c3"]
+    assert vector_admin.remove_superseded("a.md", "hr") == []
+    assert vector_admin.remove_superseded("b.md", "Finance") == []